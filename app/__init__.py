@@ -5,7 +5,16 @@ import flask_moment
 import flask_cors
 import flask_jwt_extended
 from flask_login import LoginManager
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import config
+from .cache import Cache
+from .compression import Compress
+from .identity import IdentityCache
+from .hashing import PasswordHasher
+from .ratelimit import RateLimiter
+from .presence import PresenceTracker
+from .encoding import JSONProvider
+from .links import LinkBuilder, get_mode
 
 #set endpoint for the login page
 login_manager = LoginManager()
@@ -16,6 +25,15 @@ moment = flask_moment.Moment()
 bootstrap = flask_bootstrap.Bootstrap()
 cors = flask_cors.CORS()
 jwt = flask_jwt_extended.JWTManager()
+cache = Cache()
+compress = Compress()
+identities = IdentityCache()
+hasher = PasswordHasher()
+limiter = RateLimiter()
+presence = PresenceTracker()
+links = LinkBuilder()
+cache.add_scope(get_mode)
+cache.add_listener(identities.invalidate)
 
 def create_app(config_name):
     """
@@ -25,6 +43,13 @@ def create_app(config_name):
 
     app = flask.Flask(__name__)
     app.config.from_object(config[config_name])
+    app.json = JSONProvider(app)
+
+    # Take client addresses from the trusted proxies, for rate limits
+    if app.config['PROXY_COUNT']:
+        app.wsgi_app = ProxyFix(app.wsgi_app,
+                x_for = app.config['PROXY_COUNT'],
+                x_proto = app.config['PROXY_COUNT'])
 
     bootstrap.init_app(app)
     db.init_app(app)
@@ -32,6 +57,12 @@ def create_app(config_name):
     login_manager.init_app(app)
     cors.init_app(app)
     jwt.init_app(app)
+    cache.init_app(app)
+    compress.init_app(app)
+    identities.init_app(app)
+    hasher.init_app(app)
+    limiter.init_app(app)
+    presence.init_app(app)
 
     if app.config['SSL_REDIRECT']:
         from flask_sslify import SSLify
@@ -60,5 +91,8 @@ def create_app(config_name):
     from .administration import administration as administration_blueprint
     app.register_blueprint(administration_blueprint, 
             url_prefix = "/api/administration")
-    
+
+    # Compile link templates once every route is registered
+    links.init_app(app)
+
     return app
@@ -4,39 +4,57 @@ from datetime import datetime
 from flask_login import current_user, login_required, login_user
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask import jsonify
-from sqlalchemy import or_
+from decorators import token_permission_required, token_admin_required
 from . import administration
-from .. import db
+from .. import db, cache
+from ..hashing import HashingBusy
+from utilities.fields import get_fields, load_fields
+from utilities.streaming import get_stream_format, stream_response
+from utilities.importing import get_import_format, read_records
+from utilities.pagination import (paginate, get_limit, encode_cursor,
+        decode_cursor, PaginationError)
 from ..models import (Permission, User, Role, Raffle, Book, Ticket, Author, 
-        AuthorBook, Category, CategoryBook, Notification, Task)
+        AuthorBook, Category, CategoryBook, Notification, Task, Code)
 
 
 #------------------------------------------------------------------------------
 #                               USER MANAGEMENT
 #------------------------------------------------------------------------------
 @administration.route('/users', methods = ["GET"])
-@jwt_required()
+@token_permission_required(Permission.VISIT)
 def get_users():
     """Gets list of all users"""
     try:
         # Log the user ID for the request
         logging.info(f"User requested details for multiple users")
 
-        # Checking if the current user has permission to view user details
-        if current_user.can(Permission.VISIT):
-            logging.warning(f"Unauthorized attempt to view multiple user details")
-            return flask.jsonify({"error": "Unauthorized"}), 403
+        # Retrieve the fields selected by the client
+        fields = get_fields()
 
-        # Fetch user details from the database
-        users = User.query.all()
-        users = [user.getDetails() for user in users]
+        # Answer conditional requests without loading users
+        validator = User.getValidator()
+        if validator.isFresh():
+            return validator.notModified()
+
+        # Stream every user if the client asked for a stream
+        stream_format = get_stream_format()
+        if stream_format:
+            response = stream_response(load_fields(User.query, User, fields)
+                    .order_by(User.userId), lambda users:
+                    User.getBulkDetails(users, fields), "users", stream_format)
+            return validator.apply(response)
+
+        # Fetch a page of user details from the database
+        users, next_cursor = paginate(load_fields(User.query, User, fields),
+                User.userId)
+        users = User.getBulkDetails(users, fields)
 
         if users:
             # Log successful user details retrieval
             logging.info(f"Multiple User details retrieved successfully by user")
 
             # Return user details as JSON
-            return flask.jsonify({"users": users}), 200
+            return validator.apply(flask.jsonify({"users": users, "next": next_cursor})), 200
     
         else:
             # Log unsuccessful user details retrieval
@@ -44,6 +62,12 @@ def get_users():
 
             return flask.jsonify({"error": "Users not found"}), 404
 
+    except PaginationError as e:
+        # Log invalid pagination parameters
+        logging.warning(f"Invalid pagination parameters: {str(e)}")
+
+        return jsonify({"error": str(e)}), 400
+
     except Exception as e:
         # Log any errors that occur during fetching of multiple user details 
         logging.error(f"Error fetching multiple user details: {str(e)}")
@@ -52,18 +76,64 @@ def get_users():
         return jsonify({"error": "An error occurred while fetching multiple user details"}) , 500
 
 
+@administration.route('/users/import', methods = ["POST"])
+@token_admin_required
+def import_users():
+    """Imports users from an uploaded CSV or NDJSON file"""
+    try:
+        # Read an uploaded file, or else the request body, as it arrives
+        upload = flask.request.files.get("file")
+        stream = upload.stream if upload else flask.request.stream
+        import_format = get_import_format(flask.request.args.get("format"),
+                upload.filename if upload else None,
+                upload.mimetype if upload else flask.request.mimetype)
+
+        if import_format is None:
+            return jsonify({"error": "Unsupported import format"}), 400
+
+        report = User.importMany(read_records(stream, import_format),
+                batch_size = flask.current_app.config["IMPORT_BATCH_SIZE"])
+        details = report.getDetails()
+
+        # Log the outcome of the import
+        logging.info(f"Imported {details['imported']} of {details['rows']} "
+                f"users at {details['rowsPerSecond']} rows per second")
+
+        return jsonify(details), 200
+
+    except HashingBusy:
+        # Log that the passwords could not be hashed in time
+        logging.warning("User import rejected, hashing is saturated")
+        return jsonify({"error": "Service busy, try again later"}), 503
+
+    except Exception as e:
+        # Log any errors that occur during the import
+        logging.error(f"Error importing users: {str(e)}")
+
+        # Return an error response
+        return jsonify({"error": "An error occurred while importing users"}), 500
+
+
 @administration.route('/users/<int:user_id>', methods = ["GET"])
 def get_user(user_id):
     """Gets details of a specific user"""
     try:
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
         # Log the user ID for the request
         logging.info(f"User requested details for user with ID {user_id}")
 
         # Checking if the current user has permission to view user details
-        if current_user.can(Permission.VISIT):
+        if not current_user.can(Permission.VISIT):
             logging.warning(f"Unauthorized attempt to view user details for user with ID {user_id}")
             return flask.jsonify({"error": "Unauthorized"}), 403
 
+        # Answer conditional requests without loading the user
+        validator = User.getValidator(user_id)
+        if validator.isFresh():
+            return validator.notModified()
+
         # Fetch user details from the database
         user = User.query.get(user_id)
 
@@ -72,7 +142,7 @@ def get_user(user_id):
             logging.info(f"User details retrived successfully for user with ID {user_id}")
 
             # Return user details as JSON
-            return flask.jsonify(user.getDetails()), 200
+            return validator.apply(flask.jsonify(user.getDetails(fields = fields))), 200
     
         else:
             # Log unsuccessful user details retrieval
@@ -201,6 +271,9 @@ def upload_user_image(user_id):
 def get_user_tickets(user_id):
     """Retrieves tickets purchased by a user"""
     try:
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
         # Retrieve the specific user from the database
         user = User.query.get(user_id)
 
@@ -212,7 +285,7 @@ def get_user_tickets(user_id):
             return jsonify({"error": "User not found"}), 404
 
         # Get tickets of the user
-        tickets = [{ticket.ticketId: ticket.getDetails()} 
+        tickets = [{ticket.ticketId: ticket.getDetails(fields = fields)} 
                 for ticket in user.tickets]
 
         # Return the tickets as a JSON response
@@ -261,6 +334,9 @@ def get_user_tasks(user_id):
 def get_user_notifications(user_id):
     """Retrieves notifications associated to the user"""
     try:
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
         # Retrieve the specific user from the database
         user = User.query.get(user_id)
 
@@ -272,7 +348,8 @@ def get_user_notifications(user_id):
             return jsonify({"error": "User not found"}), 404
 
         # Get notifications of the user
-        notifications = [{notification.notificationId: notification.getDetails()} 
+        notifications = [{notification.notificationId:
+            notification.getDetails(fields = fields)}
                 for notification in user.notifications]
 
         # Return the notifications as a JSON response
@@ -294,18 +371,44 @@ def get_user_notifications(user_id):
 def get_raffles():
     """Gets list of all raffles"""
     try:
-        # Fetch all raffles from the database
-        raffles = Raffle.query.all()
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
+        # Answer conditional requests without loading raffles
+        validator = Raffle.getValidator()
+        if validator.isFresh():
+            return validator.notModified()
+
+        # Stream every raffle if the client asked for a stream
+        stream_format = get_stream_format()
+        if stream_format:
+            response = stream_response(load_fields(Raffle.query, Raffle, fields)
+                    .order_by(Raffle.raffleId), lambda raffles:
+                    [{raffle.raffleId: details} for raffle, details in
+                        zip(raffles, Raffle.getBulkDetails(raffles, fields))],
+                    "raffles", stream_format)
+            return validator.apply(response)
+
+        # Fetch a page of raffles from the database
+        raffles, next_cursor = paginate(load_fields(Raffle.query, Raffle, fields),
+                Raffle.raffleId)
 
         # Log the successful retrieval of raffles
         logging.info("Raffles fetched successfully")
 
         # Retrieve details in jsonfiable format
-        raffles = [{raffle.raffleId: raffle.getDetails()} for raffle in raffles]
+        raffles = [{raffle.raffleId: details} for raffle, details in
+                zip(raffles, Raffle.getBulkDetails(raffles, fields))]
 
         # Return the raffles as a JSON response
-        return jsonify({"raffles": raffles}), 200
-    
+        return validator.apply(jsonify({"raffles": raffles, "next": next_cursor})), 200
+
+    except PaginationError as e:
+        # Log invalid pagination parameters
+        logging.warning(f"Invalid pagination parameters: {str(e)}")
+
+        return jsonify({"error": str(e)}), 400
+
     except Exception as e:
         # Log any errors that occur during fetching of raffles 
         logging.error(f"Error fetching raffles: {str(e)}")
@@ -318,11 +421,19 @@ def get_raffles():
 def get_raffle(raffle_id):
     """Gets details of a specific raffle"""
     try:
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
+        # Answer conditional requests without loading the raffle
+        validator = Raffle.getValidator(raffle_id)
+        if validator.isFresh():
+            return validator.notModified()
+
         # Get Raffle details from the database
         raffle = Raffle.query.get(raffle_id)
         if raffle:
             logging.info(f"Details fetched successfully for raffle with raffleId {raffle_id}")
-            return jsonify(raffle.getDetails()), 200
+            return validator.apply(jsonify(raffle.getDetails(fields = fields))), 200
 
         else:
             # Log that the raffle with the specified raffle_id was not found
@@ -439,6 +550,34 @@ def close_raffle(raffle_id):
         return jsonify({"error": "An error occurred while closing the raffle"}) , 500
 
 
+@administration.route('/raffles/<int:raffle_id>/draw', methods = ["GET"])
+def get_raffle_draw(raffle_id):
+    """Gets the values needed to verify the draw of a raffle"""
+    try:
+        # Retrieve the specific raffle from the database
+        raffle = Raffle.query.get(raffle_id)
+
+        if not raffle:
+            # Log that the raffle with the specified raffle_id was not found
+            logging.warning(f"Raffle with raffleId {raffle_id} not found")
+
+            # Return a not found response
+            return jsonify({"error": "Raffle not found"}), 404
+
+        # Log the successful retrieval of the draw proof
+        logging.info(f"Draw proof fetched successfully for raffle with raffleId {raffle_id}")
+
+        # Return the draw proof as a JSON response
+        return jsonify(raffle.getDrawProof()), 200
+
+    except Exception as e:
+        # Log any errors that occur during retrieval of the draw proof
+        logging.error(f"Error fetching draw proof for raffle {raffle_id}: {str(e)}")
+
+        # Return an error response
+        return jsonify({"error": "An error occurred while fetching the raffle draw"}) , 500
+
+
 @administration.route('/raffles/<int:raffle_id>/activate', methods = ["POST"])
 def activate_raffle(raffle_id):
     """Activates a raffle"""
@@ -475,7 +614,7 @@ def activate_raffle(raffle_id):
         return jsonify({"error": "An error occurred while activating the raffle"}) , 500
 
 
-@administration.route('/raffles/<int:raffle_id>/deactivate}', methods = ["POST"])
+@administration.route('/raffles/<int:raffle_id>/deactivate', methods = ["POST"])
 def deactivate_raffle(raffle_id):
     """Deactivates a raffle"""
     try:
@@ -515,6 +654,14 @@ def deactivate_raffle(raffle_id):
 def get_raffle_tickets(raffle_id):
     """Gets tickets belonging to a raffle"""
     try:
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
+        # Answer conditional requests without loading tickets
+        validator = Ticket.getValidator(raffle_id = raffle_id)
+        if validator.isFresh():
+            return validator.notModified()
+
         # Retrieve the specific raffle from the database
         raffle = Raffle.query.get(raffle_id)
 
@@ -525,12 +672,30 @@ def get_raffle_tickets(raffle_id):
             # Return a not found response
             return jsonify({"error": "Raffle not found"}), 404
 
-        # Get tickets of the raffle
-        tickets = [{ticket.ticketId: ticket.getDetails()} 
-                for ticket in raffle.tickets]
+        # Stream every ticket of the raffle if the client asked for a stream
+        stream_format = get_stream_format()
+        if stream_format:
+            response = stream_response(load_fields(raffle.tickets, Ticket, fields)
+                    .order_by(Ticket.ticketId), lambda tickets:
+                    [{ticket.ticketId: ticket.getDetails(fields = fields)}
+                        for ticket in tickets], "raffle_tickets",
+                    stream_format)
+            return validator.apply(response)
+
+        # Get a page of tickets of the raffle
+        tickets, next_cursor = paginate(load_fields(raffle.tickets, Ticket, fields),
+                Ticket.ticketId)
+        tickets = [{ticket.ticketId: ticket.getDetails(fields = fields)} 
+                for ticket in tickets]
 
         # Return the tickets as a JSON response
-        return jsonify({"raffle_tickets": tickets}), 200
+        return validator.apply(jsonify({"raffle_tickets": tickets, "next": next_cursor})), 200
+
+    except PaginationError as e:
+        # Log invalid pagination parameters
+        logging.warning(f"Invalid pagination parameters: {str(e)}")
+
+        return jsonify({"error": str(e)}), 400
 
     except Exception as e:
         # Log any errors that occur during extraction of raffle tickets
@@ -540,17 +705,154 @@ def get_raffle_tickets(raffle_id):
         return jsonify({"error": "An error occurred while retrieving raffle tickets"}) , 500
 
 
+@administration.route('/raffles/<int:raffle_id>/tickets/export', methods = ["GET"])
+def export_raffle_tickets(raffle_id):
+    """Streams every ticket of a raffle, as NDJSON unless asked otherwise"""
+    try:
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
+        # Retrieve the specific raffle from the database
+        raffle = Raffle.query.get(raffle_id)
+
+        if not raffle:
+            # Log that the raffle with the specified raffle_id was not found
+            logging.warning(f"Raffle with raffleId {raffle_id} not found")
+
+            # Return a not found response
+            return jsonify({"error": "Raffle not found"}), 404
+
+        # Log the export of the raffle tickets
+        logging.info(f"Exporting tickets of raffle {raffle_id}")
+
+        # Stream the tickets one batch at a time
+        return stream_response(load_fields(raffle.tickets, Ticket, fields)
+                .order_by(Ticket.ticketId), lambda tickets:
+                [ticket.getDetails(fields = fields) for ticket in tickets],
+                "raffle_tickets", get_stream_format(default = "ndjson"))
+
+    except Exception as e:
+        # Log any errors that occur during export of raffle tickets
+        logging.error(f"Error exporting tickets for raffle {raffle_id}: {str(e)}")
+
+        # Return an error response
+        return jsonify({"error": "An error occurred while exporting raffle tickets"}) , 500
+
+
+def get_purchase_items(data, raffle_id = None):
+    """
+    Extracts (raffleId, quantity) pairs from a purchase request, which holds
+    either a quantity for a single raffle or a batch of items
+    Returns None when the request is invalid
+    """
+    if raffle_id is not None:
+        items = [{"raffleId": raffle_id, "quantity": data.get("quantity", 1)}]
+    else:
+        items = data.get("items")
+
+    if not isinstance(items, list) or not items:
+        return None
+
+    pairs = []
+    for item in items:
+        if not isinstance(item, dict):
+            return None
+
+        raffle, quantity = item.get("raffleId"), item.get("quantity", 1)
+        if type(raffle) is not int or type(quantity) is not int or \
+                quantity < 1:
+            return None
+
+        pairs.append((raffle, quantity))
+
+    total = sum(quantity for _, quantity in pairs)
+    if total > flask.current_app.config["MAX_TICKETS_PER_PURCHASE"]:
+        return None
+
+    return pairs
+
+
+def purchase_tickets(data, raffle_id = None):
+    """Purchases the tickets described by a purchase request"""
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+
+    # Check if required fields are present in the request
+    required_fields = ["userId"]
+    if not all (field in data for field in required_fields):
+        return jsonify({"error": "Missing required fields"}), 400
+
+    user_id = data.get("userId")
+    if type(user_id) is not int:
+        return jsonify({"error": "Invalid userId"}), 400
+
+    items = get_purchase_items(data, raffle_id)
+    if items is None:
+        return jsonify({"error": "Invalid ticket quantities"}), 400
+
+    if not db.session.get(User, user_id):
+        # Log that the user with the specified user_id was not found
+        logging.warning(f"User with userId {user_id} not found")
+
+        # Return a not found response
+        return jsonify({"error": "User not found"}), 404
+
+    # Reserve capacity and create all the tickets in one transaction
+    status = Ticket.purchase(user_id, items)
+
+    if status.code != Code.SUCCESS:
+        if not db.session.get(Raffle, status.info):
+            # Log that the raffle with the specified raffle_id was not found
+            logging.warning(f"Raffle with raffleId {status.info} not found")
+
+            # Return a not found response
+            return jsonify({"error": "Raffle not found"}), 404
+
+        # Log that the raffle cannot take more tickets
+        logging.warning(f"Attempted to purchase tickets for unavailable raffle with raffleId {status.info}")
+
+        # Return a conflict response
+        return jsonify({"error": "Raffle is sold out or not open"}), 409
+
+    ticket_ids = [ticket.ticketId for ticket in status.info]
+
+    # Log the successful ticket purchase
+    logging.info(f"Successfully purchased {len(ticket_ids)} tickets for user with userId {user_id}")
+
+    # Return a success message
+    return jsonify({"message": "Tickets purchased successfully",
+        "ticketIds": ticket_ids}), 200
+
+
 @administration.route('/raffles/<int:raffle_id>/purchase', methods = ["POST"])
 def purchase_ticket(raffle_id):
     """Purchases raffle tickets for a book"""
     try:
-        pass
+        # Get purchase details from the request JSON
+        return purchase_tickets(flask.request.get_json(silent = True),
+                raffle_id)
+
     except Exception as e:
-        # Log any errors that occur during 
-        logging.error(f"Error ...: {str(e)}")
+        # Log any errors that occur during ticket purchase
+        logging.error(f"Error purchasing tickets for raffle {raffle_id}: {str(e)}")
 
         # Return an error response
-        return jsonify({"error": "An error occurred while ..."}) , 500
+        return jsonify({"error": "An error occurred while purchasing tickets"}) , 500
+
+
+@administration.route('/raffles/purchase', methods = ["POST"])
+def purchase_tickets_batch():
+    """Purchases tickets for several raffles at once"""
+    try:
+        # Get purchase details from the request JSON
+        return purchase_tickets(flask.request.get_json(silent = True))
+
+    except Exception as e:
+        # Log any errors that occur during ticket purchase
+        logging.error(f"Error purchasing a batch of tickets: {str(e)}")
+
+        # Return an error response
+        return jsonify({"error": "An error occurred while purchasing tickets"}) , 500
 
 
 #------------------------------------------------------------------------------
@@ -560,17 +862,33 @@ def purchase_ticket(raffle_id):
 def get_authors():
     """Get list of all authors"""
     try:
-        # Fetch all authors from the database
-        authors = Author.query.all()
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
+        # Answer conditional requests without loading authors
+        validator = Author.getValidator()
+        if validator.isFresh():
+            return validator.notModified()
+
+        # Fetch a page of authors from the database
+        authors, next_cursor = paginate(load_fields(Author.query, Author, fields),
+                Author.authorId)
 
         # Log the successful retrieval of authors
         logging.info("Authors fetched successfully")
 
         # Retrieve details in jsonfiable format
-        authors = [{author.authorId: author.getDetails()} for author in authors]
+        authors = [{author.authorId: details} for author, details in
+                zip(authors, Author.getBulkDetails(authors, fields))]
 
         # Return the authors as a JSON response
-        return jsonify({"authors": authors}), 200
+        return validator.apply(jsonify({"authors": authors, "next": next_cursor})), 200
+
+    except PaginationError as e:
+        # Log invalid pagination parameters
+        logging.warning(f"Invalid pagination parameters: {str(e)}")
+
+        return jsonify({"error": str(e)}), 400
 
     except Exception as e:
         # Log any errors that occur during fetching authors
@@ -584,10 +902,18 @@ def get_authors():
 def get_author(author_id):
     """Get details of a specific author"""
     try:
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
+        # Answer conditional requests without loading the author
+        validator = Author.getValidator(author_id)
+        if validator.isFresh():
+            return validator.notModified()
+
         author = Author.query.get(author_id)
         if author:
             logging.info(f"Details fetched successfully for author with authorId {author_id}")
-            return jsonify(author.getDetails()), 200
+            return validator.apply(jsonify(author.getDetails(fields = fields))), 200
 
         else:
             # Log that the author with the specified author_id was not found
@@ -607,6 +933,9 @@ def get_author(author_id):
 def get_author_books(author_id):
     """Get books of a particular author"""
     try:
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
         # Retrieve the specific author from the database
         author = Author.query.get(author_id)
 
@@ -618,8 +947,8 @@ def get_author_books(author_id):
             return jsonify({"error": "Author not found"}), 404
 
         # Get books of the author
-        books = [{book.bookId: book.getDetails()} 
-                for book in author.books]
+        books = [{book.bookId: details} for book, details in
+                zip(author.books, Book.getBulkDetails(author.books, fields))]
 
         # Return the books as a JSON response
         return jsonify({"author_books": books}), 200
@@ -700,7 +1029,7 @@ def update_author(author_id):
         return jsonify({"error": "An error occurred while updating author details"}) , 500
 
 
-@administration.route('/authors/{author_id}', methods = ["DELETE"])
+@administration.route('/authors/<int:author_id>', methods = ["DELETE"])
 def delete_author(author_id):
     """Delete an author"""
     try:
@@ -738,17 +1067,43 @@ def delete_author(author_id):
 def get_books():
     """Gets list of all books"""
     try:
-        # Fetch all books from the database
-        books = Book.query.all()
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
+        # Answer conditional requests without loading books
+        validator = Book.getValidator()
+        if validator.isFresh():
+            return validator.notModified()
+
+        # Stream every book if the client asked for a stream
+        stream_format = get_stream_format()
+        if stream_format:
+            response = stream_response(load_fields(Book.query, Book, fields)
+                    .order_by(Book.bookId), lambda books:
+                    [{book.bookId: details} for book, details in
+                        zip(books, Book.getBulkDetails(books, fields))],
+                    "books", stream_format)
+            return validator.apply(response)
+
+        # Fetch a page of books from the database
+        books, next_cursor = paginate(load_fields(Book.query, Book, fields),
+                Book.bookId)
 
         # Log the successful retrieval of books
         logging.info("Books fetched successfully")
 
         # Retrieve details in jsonfiable format
-        books = [{book.bookId: book.getDetails()} for book in books]
+        books = [{book.bookId: details} for book, details in
+                zip(books, Book.getBulkDetails(books, fields))]
 
         # Return the books as a JSON response
-        return jsonify({"books": books}), 200
+        return validator.apply(jsonify({"books": books, "next": next_cursor})), 200
+
+    except PaginationError as e:
+        # Log invalid pagination parameters
+        logging.warning(f"Invalid pagination parameters: {str(e)}")
+
+        return jsonify({"error": str(e)}), 400
 
     except Exception as e:
         # Log any errors that occur during fetching of books 
@@ -762,10 +1117,18 @@ def get_books():
 def get_book(book_id):
     """Gets details of a specific book"""
     try:
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
+        # Answer conditional requests without loading the book
+        validator = Book.getValidator(book_id)
+        if validator.isFresh():
+            return validator.notModified()
+
         book = Book.query.get(book_id)
         if book:
             logging.info(f"Details fetched successfully for book with bookId {book_id}")
-            return jsonify(book.getDetails()), 200
+            return validator.apply(jsonify(book.getDetails(fields = fields))), 200
 
         else:
             # Log that the book with the specified book_id was not found
@@ -785,25 +1148,45 @@ def get_book(book_id):
 def search_books():
     """Gets books fitting query string"""
     try:
-        # Get the search query from the request parameters
-        search_query = flask.request.args.get('1', '')
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
+        # Get the search query and page from the request parameters
+        search_query = flask.request.args.get('q', '')
+        limit = get_limit()
+        cursor = flask.request.args.get('cursor')
+        offset = decode_cursor(cursor) if cursor else 0
+
+        if not isinstance(offset, int) or offset < 0:
+            raise PaginationError("Invalid cursor")
 
-        # Perform a case-insensitive search on the title, publisher and summary 
-        # columns
-        books = Book.query.filter(or_(
-            Book.title.ilike(f"%{search_query}%"),
-            Book.publisher.ilike(f"%{search_query}%"),
-            Book.summary.ilike(f"%{search_query}%")
-            )).all()
+        # Perform a ranked full-text search over the searchable book fields,
+        # fetching one extra result to find out whether another page exists
+        results = Book.search(search_query, offset, limit + 1)
+
+        next_cursor = None
+        if len(results) > limit:
+            results = results[:limit]
+            next_cursor = encode_cursor(offset + limit)
 
         # Log the successful book search
         logging.info(f"Books searched successfully with query: {search_query}")
 
-        # Get jsonifiable book details
-        books_list = [book.getDetails() for book in books]
+        # Get jsonifiable book details along with the matching snippet
+        books_list = []
+        books_details = Book.getBulkDetails([book for book, _ in results], fields)
+        for (book, snippet), details in zip(results, books_details):
+            details["snippet"] = snippet
+            books_list.append(details)
 
         # Return the search results as a JSON response
-        return jsonify({"books": books_list}), 200
+        return jsonify({"books": books_list, "next": next_cursor}), 200
+
+    except PaginationError as e:
+        # Log invalid pagination parameters
+        logging.warning(f"Invalid pagination parameters: {str(e)}")
+
+        return jsonify({"error": str(e)}), 400
 
     except Exception as e:
         # Log any errors that occur during book search
@@ -817,6 +1200,9 @@ def search_books():
 def get_book_categories(book_id):
     """Get categories of a particular book"""
     try:
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
         # Retrieve the specific book from the database
         book = Book.query.get(book_id)
 
@@ -828,8 +1214,8 @@ def get_book_categories(book_id):
             return jsonify({"error": "Book not found"}), 404
 
         # Get categorys of the book
-        categories = [{category.categoryId: category.getDetails()} 
-                for category in book.categories]
+        categories = [{category.categoryId: details} for category, details in
+                zip(book.categories, Category.getBulkDetails(book.categories, fields))]
 
         # Return the categories as a JSON response
         return jsonify({"book_categories": categories}), 200
@@ -847,6 +1233,9 @@ def get_book_categories(book_id):
 def get_book_authors(book_id):
     """Get authors of a particular book"""
     try:
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
         # Retrieve the specific book from the database
         book = Book.query.get(book_id)
 
@@ -858,8 +1247,8 @@ def get_book_authors(book_id):
             return jsonify({"error": "Book not found"}), 404
 
         # Get authors of the book
-        authors = [{author.authorId: author.getDetails()} 
-                for author in book.authors]
+        authors = [{author.authorId: details} for author, details in
+                zip(book.authors, Author.getBulkDetails(book.authors, fields))]
 
         # Return the authors as a JSON response
         return jsonify({"book_authors": authors}), 200
@@ -1032,6 +1421,14 @@ def delete_book(book_id):
 def get_ticket(ticket_id):
     """Get details of a specific ticket"""
     try:
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
+        # Answer conditional requests without loading the ticket
+        validator = Ticket.getValidator(ticket_id)
+        if validator.isFresh():
+            return validator.notModified()
+
         # Retrieve the specific ticket from the database
         ticket = Ticket.query.get(ticket_id)
 
@@ -1045,7 +1442,7 @@ def get_ticket(ticket_id):
         # Log the successful retrieval of ticket details
         logging.info(f"Successfully retrieved details for ticket with ticketId {ticket_id}")
 
-        return jsonify(ticket.getDetails()), 200
+        return validator.apply(jsonify(ticket.getDetails(fields = fields))), 200
 
     except Exception as e:
         # Log any errors that occur during 
@@ -1059,13 +1456,38 @@ def get_ticket(ticket_id):
 def cancel_ticket(ticket_id):
     """Cancels a ticket"""
     try:
-        pass
+        # Retrieve the specific ticket from the database
+        ticket = db.session.get(Ticket, ticket_id)
+
+        if not ticket:
+            # Log that the ticket with the specified ticket_id was not found
+            logging.warning(f"Ticket with ticketId {ticket_id} not found")
+
+            # Return a not found response
+            return jsonify({"error": "Ticket not found"}), 404
+
+        # Cancel the ticket and release its place in the raffle
+        status = ticket.cancel()
+
+        if status.code != Code.SUCCESS:
+            # Log that the ticket cannot be cancelled
+            logging.warning(f"Attempted to cancel ticket with ticketId {ticket_id}: {status.message}")
+
+            # Return a conflict response
+            return jsonify({"error": status.message}), 409
+
+        # Log the successful ticket cancellation
+        logging.info(f"Ticket with ticketId {ticket_id} cancelled successfully")
+
+        # Return a success message
+        return jsonify({"message": "Ticket cancelled successfully"}), 200
+
     except Exception as e:
-        # Log any errors that occur during 
-        logging.error(f"Error ...: {str(e)}")
+        # Log any errors that occur during ticket cancellation
+        logging.error(f"Error cancelling ticket with ticketId {ticket_id}: {str(e)}")
 
         # Return an error response
-        return jsonify({"error": "An error occurred while ..."}) , 500
+        return jsonify({"error": "An error occurred while cancelling the ticket"}) , 500
 
 
 @administration.route('/tickets/<int:ticket_id>/validate', methods = ["GET"])
@@ -1112,6 +1534,54 @@ def validate_ticket(ticket_id):
         return jsonify({"error": "An error occurred while validating the ticket"}) , 500
 
 
+@administration.route('/tickets/verify', methods = ["GET"])
+def verify_ticket():
+    """Checks a signed ticket code without loading the ticket"""
+    try:
+        # Verify the signature and revocation status of the code
+        status = Ticket.verifyCode(flask.request.args.get("code"))
+
+        if status.code == Code.FAILURE:
+            # Log that the ticket code is not valid
+            logging.warning("Rejected an invalid ticket code")
+
+            # Return error response
+            return jsonify({"error": status.message}), 400
+
+        if status.code == Code.FORBIDDEN:
+            # Log that the ticket is cancelled
+            logging.warning(f"Attempted to verify a cancelled ticket with ticketId {status.info['ticketId']}")
+
+            # Return a conflicting response
+            return jsonify({"error": "Ticket is cancelled and cannot be validated",
+                "ticket": status.info}), 409
+
+        # Return a success response with the decoded ticket
+        return jsonify({"message": status.message, "ticket": status.info}), 200
+
+    except Exception as e:
+        # Log any errors that occur during the verification of the code
+        logging.error(f"Error verifying ticket code: {str(e)}")
+
+        # Return an error response
+        return jsonify({"error": "An error occurred while verifying the ticket"}) , 500
+
+
+@administration.route('/cache', methods = ["GET"])
+def get_cache_statistics():
+    """Gets hit, miss and eviction statistics of the cache tiers"""
+    try:
+        # Return the statistics as a JSON response
+        return jsonify({"cache": cache.getStatistics()}), 200
+
+    except Exception as e:
+        # Log any errors that occur during fetching cache statistics
+        logging.error(f"Error fetching cache statistics: {str(e)}")
+
+        # Return an error response
+        return jsonify({"error": "An error occurred while fetching cache statistics"}) , 500
+
+
 #------------------------------------------------------------------------------
 #                               ROLE MANAGEMENT
 #------------------------------------------------------------------------------
@@ -1119,17 +1589,33 @@ def validate_ticket(ticket_id):
 def get_roles():
     """Get list of all roles"""
     try:
-        # Fetch all roles from the database
-        roles = Role.query.all()
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
+        # Answer conditional requests without loading roles
+        validator = Role.getValidator()
+        if validator.isFresh():
+            return validator.notModified()
+
+        # Fetch a page of roles from the database
+        roles, next_cursor = paginate(load_fields(Role.query, Role, fields),
+                Role.roleId)
 
         # Log the successful retrieval of roles
         logging.info("Roles fetched successfully")
 
         # Retrieve details in jsonfiable format
-        roles = [{role.roleId: role.getDetails()} for role in roles]
+        roles = [{role.roleId: details} for role, details in
+                zip(roles, Role.getBulkDetails(roles, fields))]
 
         # Return the roles as a JSON response
-        return jsonify({"roles": roles}), 200
+        return validator.apply(jsonify({"roles": roles, "next": next_cursor})), 200
+
+    except PaginationError as e:
+        # Log invalid pagination parameters
+        logging.warning(f"Invalid pagination parameters: {str(e)}")
+
+        return jsonify({"error": str(e)}), 400
 
     except Exception as e:
         # Log any errors that occur during fetching roles
@@ -1143,10 +1629,18 @@ def get_roles():
 def get_role(role_id):
     """Gets details of a specific role"""
     try:
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
+        # Answer conditional requests without loading the role
+        validator = Role.getValidator(role_id)
+        if validator.isFresh():
+            return validator.notModified()
+
         role = Role.query.get(role_id)
         if role:
             logging.info(f"Details fetched successfully for role with roleId {role_id}")
-            return jsonify(role.getDetails()), 200
+            return validator.apply(jsonify(role.getDetails(fields = fields))), 200
 
         else:
             # Log that the role with the specified role_id was not found
@@ -1269,13 +1763,17 @@ def get_role_users(role_id):
         logging.info(f"User with ID {current_user.userId} requested details for multiple users with role Id {role_id}")
 
         # Checking if the current user has permission to view user details
-        if current_user.can(Permission.VISIT):
+        if not current_user.can(Permission.VISIT):
             logging.warning(f"Unauthorized attempt by user with ID {current_user.userId} to view multiple user details")
             return flask.jsonify({"error": "Unauthorized"}), 403
 
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
         # Fetch Role details from the database
         role = Role.query.get(role_id)
-        users = [user.getDetails() for user in role.users]
+        users = User.getBulkDetails(load_fields(role.users, User, fields).all(),
+                fields)
 
         if users:
             # Log successful user details retrieval
@@ -1302,22 +1800,49 @@ def get_role_users(role_id):
 #------------------------------------------------------------------------------
 #                            NOTIFICATION MANAGEMENT
 #------------------------------------------------------------------------------
-@administration.route('/notifications/<int:notification_id>', methods = ["GET"])
-def get_notification():
-    """Gets details of a particular notification"""
+@administration.route('/notifications', methods = ["GET"])
+def get_notifications():
+    """Gets list of all notifications"""
     try:
-        # Fetch all notifications from the database
-        notifications = Notification.query.all()
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
+        # Answer conditional requests without loading notifications
+        validator = Notification.getValidator()
+        if validator.isFresh():
+            return validator.notModified()
+
+        # Stream every notification if the client asked for a stream
+        stream_format = get_stream_format()
+        if stream_format:
+            response = stream_response(load_fields(Notification.query, Notification,
+                fields).order_by(Notification.notificationId), lambda
+                notifications: [{notification.notificationId:
+                    notification.getDetails(fields = fields)}
+                    for notification in notifications], "notifications",
+                stream_format)
+            return validator.apply(response)
+
+        # Fetch a page of notifications from the database
+        notifications, next_cursor = paginate(load_fields(Notification.query,
+            Notification, fields), Notification.notificationId)
 
         # Log the successful retrieval of notifications
         logging.info("Notifications fetched successfully")
 
         # Retrieve details in jsonfiable format
-        notifications = [{notification.notificationId: notification.getDetails()} 
+        notifications = [{notification.notificationId:
+            notification.getDetails(fields = fields)}
                 for notification in notifications]
 
         # Return the notifications as a JSON response
-        return jsonify({"notifications": notifications}), 200
+        return validator.apply(jsonify({"notifications": notifications, "next": next_cursor})), 200
+
+    except PaginationError as e:
+        # Log invalid pagination parameters
+        logging.warning(f"Invalid pagination parameters: {str(e)}")
+
+        return jsonify({"error": str(e)}), 400
 
     except Exception as e:
         # Log any errors that occur during fetching of notifications 
@@ -1327,6 +1852,40 @@ def get_notification():
         return jsonify({"error": "An error occurred while fetching notifications"}) , 500
 
 
+@administration.route('/notifications/<int:notification_id>', methods = ["GET"])
+def get_notification(notification_id):
+    """Gets details of a particular notification"""
+    try:
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
+        # Answer conditional requests without loading the notification
+        validator = Notification.getValidator(notification_id)
+        if validator.isFresh():
+            return validator.notModified()
+
+        # Retrieve the specific notification from the database
+        notification = Notification.query.get(notification_id)
+
+        if not notification:
+            # Log that the notification was not found
+            logging.warning(f"Notification with notificationId {notification_id} not found")
+
+            # Return a not found response
+            return jsonify({"error": "Notification not found"}), 404
+
+        # Return the notification as a JSON response
+        details = notification.getDetails(fields = fields)
+        return validator.apply(jsonify({"notification": details})), 200
+
+    except Exception as e:
+        # Log any errors that occur during fetching of the notification 
+        logging.error(f"Error fetching notification {notification_id}: {str(e)}")
+
+        # Return an error response
+        return jsonify({"error": "An error occurred while fetching the notification"}) , 500
+
+
 #------------------------------------------------------------------------------
 #                            CATEGORY MANAGEMENT
 #------------------------------------------------------------------------------
@@ -1334,17 +1893,33 @@ def get_notification():
 def get_categories():
     """Get list of all categories"""
     try:
-        # Fetch all categories from the database
-        categories = Category.query.all()
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
+        # Answer conditional requests without loading categories
+        validator = Category.getValidator()
+        if validator.isFresh():
+            return validator.notModified()
+
+        # Fetch a page of categories from the database
+        categories, next_cursor = paginate(load_fields(Category.query, Category, fields),
+                Category.categoryId)
 
         # Log the successful retrieval of categories
         logging.info("Categories fetched successfully")
 
         # Retrieve details in jsonfiable format
-        categories = [{category.categoryId: category.getDetails()} for category in categories]
+        categories = [{category.categoryId: details} for category, details in
+                zip(categories, Category.getBulkDetails(categories, fields))]
 
         # Return the categories as a JSON response
-        return jsonify({"categories": categories}), 200
+        return validator.apply(jsonify({"categories": categories, "next": next_cursor})), 200
+
+    except PaginationError as e:
+        # Log invalid pagination parameters
+        logging.warning(f"Invalid pagination parameters: {str(e)}")
+
+        return jsonify({"error": str(e)}), 400
 
     except Exception as e:
         # Log any errors that occur during fetching categories
@@ -1358,10 +1933,18 @@ def get_categories():
 def get_category(category_id):
     """Gets details of a specific category"""
     try:
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
+        # Answer conditional requests without loading the category
+        validator = Category.getValidator(category_id)
+        if validator.isFresh():
+            return validator.notModified()
+
         category = Category.query.get(category_id)
         if category:
             logging.info(f"Details fetched successfully for category with categoryId {category_id}")
-            return jsonify(category.getDetails()), 200
+            return validator.apply(jsonify(category.getDetails(fields = fields))), 200
 
         else:
             # Log that the category with the specified category_id was not found
@@ -1479,6 +2062,9 @@ def delete_category(category_id):
 def get_category_books(category_id):
     """Get books of a particular category"""
     try:
+        # Retrieve the fields selected by the client
+        fields = get_fields()
+
         # Retrieve the specific category from the database
         category = Category.query.get(category_id)
 
@@ -1490,8 +2076,8 @@ def get_category_books(category_id):
             return jsonify({"error": "Category not found"}), 404
 
         # Get books of the category
-        books = [{book.bookId: book.getDetails()} 
-                for book in category.books]
+        books = [{book.bookId: details} for book, details in
+                zip(category.books, Book.getBulkDetails(category.books, fields))]
 
         # Return the books as a JSON response
         return jsonify({"category_books": books}), 200
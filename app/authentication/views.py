@@ -3,10 +3,14 @@ from flask_login import current_user, login_required
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from flask import Blueprint, request, jsonify, abort
 from ..models import db, User
+from ..hashing import HashingBusy
+from utilities.contacts import normalize_email
+from .. import limiter
 from . import authentication
 
 
 @authentication.route('/login', methods = ['POST'])
+@limiter.limit("login")
 def login_user():
     data = request.json
 
@@ -16,16 +20,26 @@ def login_user():
         return jsonify({"error": "Missing required fields"}), 400
 
     # Find the user by email address
-    user = User.query.filter_by(emailAddress = data.get("emailAddress")).first()
+    user = User.query.filter_by(
+            emailAddress = normalize_email(data.get("emailAddress"))).first()
 
     if user:
-        status = user.login(data.get("password"))
+        try:
+            status = user.login(data.get("password"))
+
+        except HashingBusy:
+            # Log that the password could not be checked in time
+            logging.warning(f"Login for user {user.emailAddress} rejected, hashing is saturated")
+            return jsonify({"error": "Service busy, try again later"}), 503
+
         if status.code == 200:
             # Log successful login
             logging.info(f"User {user.emailAddress} logged in successfully")
 
-            # Generate jwt access token
-            access_token = create_access_token(identity = data.get('emailAddress'))
+            # Generate jwt access token carrying the role's permissions
+            access_token = create_access_token(
+                    identity = user.emailAddress,
+                    additional_claims = user.getClaims())
 
             # Return success response
             return jsonify({
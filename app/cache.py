@@ -0,0 +1,396 @@
+import copy
+import time
+import pickle
+import threading
+from collections import OrderedDict
+import flask
+from sqlalchemy import inspect
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+MISSING = object()
+
+
+class CacheStatistics(object):
+    """Counts the hits, misses and evictions of a cache tier"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+
+    def getDetails(self):
+        """Retrieves the statistics in jsonifiable format"""
+        lookups = self.hits + self.misses
+        return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRatio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                }
+
+
+class LocalCache(object):
+    """
+    Bounded in-process cache that evicts the least recently used entry once
+    it is full and drops entries older than their time to live
+    """
+
+    def __init__(self, max_entries = 10000, ttl = 30):
+        self.maxEntries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.tags = {}
+        self.stats = CacheStatistics()
+        self.lock = threading.Lock()
+
+
+    def get(self, key):
+        """Retrieves a cached value, or MISSING"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return MISSING
+
+            value, expires, tags = entry
+            if expires <= time.monotonic():
+                self._remove(key)
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return MISSING
+
+            self.entries.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+
+    def set(self, key, value, tags = (), ttl = None):
+        """Caches a value under a key and the tags that invalidate it"""
+        expires = time.monotonic() + (ttl or self.ttl)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+            self.entries[key] = (value, expires, tuple(tags))
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+
+            while len(self.entries) > self.maxEntries:
+                self._remove(next(iter(self.entries)))
+                self.stats.evictions += 1
+
+
+    def invalidate(self, tag):
+        """Removes every entry carrying a tag"""
+        with self.lock:
+            for key in list(self.tags.get(tag, ())):
+                self._remove(key)
+                self.stats.invalidations += 1
+
+
+    def clear(self):
+        """Removes every entry"""
+        with self.lock:
+            self.entries.clear()
+            self.tags.clear()
+
+
+    def _remove(self, key):
+        """Removes an entry and its tag references"""
+        value, expires, tags = self.entries.pop(key)
+        for tag in tags:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+
+class SharedCacheStandIn(LocalCache):
+    """
+    Local stand-in for the shared tier, used in development and tests where no
+    shared cache server is available. Values are pickled like they would be on
+    the wire, so callers never share objects with the cache
+    """
+
+    def get(self, key):
+        """Retrieves a cached value, or MISSING"""
+        value = super(SharedCacheStandIn, self).get(key)
+        return value if value is MISSING else pickle.loads(value)
+
+
+    def set(self, key, value, tags = (), ttl = None):
+        """Caches a value under a key and the tags that invalidate it"""
+        super(SharedCacheStandIn, self).set(key, pickle.dumps(value), tags,
+                ttl)
+
+
+class RedisCache(object):
+    """Shared tier backed by Redis, with tags kept in Redis sets"""
+
+    def __init__(self, url, ttl = 300, prefix = "obrs:cache:"):
+        if redis is None:
+            raise RuntimeError("The redis package is required for a Redis "
+                    "cache tier")
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stats = CacheStatistics()
+
+
+    def get(self, key):
+        """Retrieves a cached value, or MISSING"""
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.stats.misses += 1
+            return MISSING
+
+        self.stats.hits += 1
+        return pickle.loads(value)
+
+
+    def set(self, key, value, tags = (), ttl = None):
+        """Caches a value under a key and the tags that invalidate it"""
+        ttl = ttl or self.ttl
+        pipeline = self.client.pipeline()
+        pipeline.set(self.prefix + key, pickle.dumps(value), ex = ttl)
+        for tag in tags:
+            pipeline.sadd(self.prefix + "tag:" + tag, self.prefix + key)
+            pipeline.expire(self.prefix + "tag:" + tag, ttl)
+        pipeline.execute()
+
+
+    def invalidate(self, tag):
+        """Removes every entry carrying a tag"""
+        name = self.prefix + "tag:" + tag
+        keys = self.client.smembers(name)
+        self.client.delete(name, *keys)
+        self.stats.invalidations += len(keys)
+
+
+    def clear(self):
+        """Removes every entry"""
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+
+class Cache(object):
+    """
+    Two-tier cache for derived data such as model details. Lookups go to the
+    bounded in-process tier first and then to the optional shared tier.
+    Entries are tagged with their owning model and primary key, and are
+    invalidated from session events when those objects change. In-process
+    tiers of other workers are only bounded by their time to live
+    """
+
+    def __init__(self, app = None):
+        self.dependencies = {}
+        self.scopes = []
+        self.listeners = []
+        if app is not None:
+            self.init_app(app)
+
+
+    def init_app(self, app):
+        """Creates the cache tiers of an application"""
+        app.config.setdefault("CACHE_ENABLED", True)
+        app.config.setdefault("CACHE_MAX_ENTRIES", 10000)
+        app.config.setdefault("CACHE_LOCAL_TTL", 30)
+        app.config.setdefault("CACHE_SHARED_URL", None)
+        app.config.setdefault("CACHE_SHARED_TTL", 300)
+
+        tiers = [LocalCache(app.config["CACHE_MAX_ENTRIES"],
+            app.config["CACHE_LOCAL_TTL"])]
+
+        url = app.config["CACHE_SHARED_URL"]
+        if url == "local":
+            tiers.append(SharedCacheStandIn(app.config["CACHE_MAX_ENTRIES"],
+                app.config["CACHE_SHARED_TTL"]))
+        elif url:
+            tiers.append(RedisCache(url, app.config["CACHE_SHARED_TTL"]))
+
+        app.extensions["cache"] = tiers
+
+
+    @property
+    def tiers(self):
+        """Retrieves the cache tiers of the current application"""
+        if not flask.has_app_context() or \
+                not flask.current_app.config.get("CACHE_ENABLED"):
+            return []
+
+        return flask.current_app.extensions.get("cache", [])
+
+
+    def register(self, model, **dependencies):
+        """
+        Makes a model cacheable. Dependencies map foreign key attributes to
+        the models whose entries must be invalidated when they change, for
+        counts and association tables
+        """
+        self.dependencies[model] = dependencies
+
+
+    def add_scope(self, scope):
+        """
+        Adds a function returning a request property that cached values vary
+        by, besides the host
+        """
+        self.scopes.append(scope)
+
+
+    def add_listener(self, listener):
+        """
+        Adds a function called with every invalidated tag, for other caches
+        of derived data to follow the same invalidations
+        """
+        self.listeners.append(listener)
+
+
+    def get_many(self, name, ids, load, variant = None):
+        """
+        Retrieves cached values for objects of a model, calling load with the
+        list of missing IDs to compute the rest, which must return a dict.
+        Values computed differently, such as for a subset of fields, are told
+        apart by a variant
+        """
+        tiers = self.tiers
+        if not tiers:
+            return load(list(ids))
+
+        scope = flask.request.host_url if flask.has_request_context() else ""
+        scope = "|".join([scope] + [str(get()) for get in self.scopes])
+        if variant is not None:
+            scope += "|" + ",".join(sorted(variant))
+        keys = {id: f"{name}:{id}@{scope}" for id in ids}
+
+        values = {}
+        missing = []
+        for id, key in keys.items():
+            for index, tier in enumerate(tiers):
+                value = tier.get(key)
+                if value is not MISSING:
+                    # Fill the faster tiers that missed
+                    for faster in tiers[:index]:
+                        faster.set(key, value, (name, f"{name}:{id}"))
+                    values[id] = copy.copy(value)
+                    break
+            else:
+                missing.append(id)
+
+        if missing:
+            loaded = load(missing)
+            for id, value in loaded.items():
+                for tier in tiers:
+                    tier.set(keys[id], value, (name, f"{name}:{id}"))
+                values[id] = copy.copy(value)
+
+        return values
+
+
+    def invalidate(self, name, id = None):
+        """Removes cached values of one object, or of a whole model"""
+        self.apply([name if id is None else f"{name}:{id}"])
+
+
+    def record(self, session, tag):
+        """Records a tag to invalidate once a session commits"""
+        session.info.setdefault("cache_tags", set()).add(tag)
+
+
+    def clear(self):
+        """Removes every cached value"""
+        for tier in self.tiers:
+            tier.clear()
+
+
+    def getStatistics(self):
+        """Retrieves the statistics of every tier"""
+        statistics = {}
+        for tier in self.tiers:
+            details = tier.stats.getDetails()
+            if hasattr(tier, "entries"):
+                details["entries"] = len(tier.entries)
+            statistics[type(tier).__name__] = details
+
+        return statistics
+
+
+    def collect(self, session, instances, changed_only = False):
+        """
+        Records the cache tags affected by changed objects. Dependencies are
+        only followed for foreign keys that changed, unless the object was
+        created or deleted
+        """
+        tags = session.info.setdefault("cache_tags", set())
+        for instance in instances:
+            model = type(instance)
+            if model not in self.dependencies:
+                continue
+
+            state = inspect(instance)
+            id = state.mapper.primary_key_from_instance(instance)[0]
+            tags.add(f"{model.__name__}:{id}")
+
+            for attribute, dependency in self.dependencies[model].items():
+                history = state.attrs[attribute].history
+                if changed_only and not history.has_changes():
+                    continue
+
+                for value in history.sum():
+                    if value is not None:
+                        tags.add(f"{dependency.__name__}:{value}")
+
+        return tags
+
+
+    def after_flush(self, session, context):
+        """Invalidates entries of objects written by a flush"""
+        self.collect(session, list(session.new) + list(session.deleted))
+        self.apply(self.collect(session, session.dirty, changed_only = True))
+
+
+    def after_commit(self, session):
+        """
+        Invalidates the flushed entries again once the transaction is visible,
+        in case another request cached them in between
+        """
+        self.apply(session.info.pop("cache_tags", set()))
+
+
+    def after_rollback(self, session):
+        """Forgets tags recorded in a rolled back transaction"""
+        session.info.pop("cache_tags", None)
+
+
+    def do_orm_execute(self, state):
+        """Invalidates whole models changed by bulk UPDATE or DELETE"""
+        if not (state.is_update or state.is_delete) or state.bind_mapper is None:
+            return
+
+        model = state.bind_mapper.class_
+        if model in self.dependencies:
+            state.session.info.setdefault("cache_tags", set())\
+                    .add(model.__name__)
+            self.invalidate(model.__name__)
+
+
+    def apply(self, tags):
+        """Invalidates a set of tags"""
+        tiers = self.tiers
+        for tag in tags:
+            for tier in tiers:
+                tier.invalidate(tag)
+
+            for listener in self.listeners:
+                listener(tag)
@@ -0,0 +1,156 @@
+import zlib
+import flask
+from werkzeug.wsgi import ClosingIterator
+from .cache import LocalCache, MISSING
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIMETYPES = ("application/json", "application/x-ndjson", "text/html",
+        "text/css", "text/plain", "application/javascript")
+
+
+class BrotliCompressor(object):
+    """Gives a brotli compressor the interface of a zlib compressor"""
+
+    def __init__(self, quality):
+        self.compressor = brotli.Compressor(quality = quality)
+
+
+    def compress(self, data):
+        """Compresses a chunk of data"""
+        return self.compressor.process(data)
+
+
+    def flush(self, mode = zlib.Z_FINISH):
+        """Flushes pending output, finishing the stream by default"""
+        if mode == zlib.Z_FINISH:
+            return self.compressor.finish()
+
+        return self.compressor.flush()
+
+
+class Compress(object):
+    """
+    Compresses responses negotiated through Accept-Encoding with gzip,
+    deflate or brotli when it is installed. Bodies below a size threshold
+    are sent as they are, and streamed responses are compressed chunk by
+    chunk. Compressed bodies of responses carrying an entity tag are cached
+    by tag and encoding, so repeat requests for unchanged catalog resources
+    skip compression
+    """
+
+    def __init__(self, app = None):
+        if app is not None:
+            self.init_app(app)
+
+
+    def init_app(self, app):
+        """Registers compression of the responses of an application"""
+        app.config.setdefault("COMPRESS_ENABLED", True)
+        app.config.setdefault("COMPRESS_MIMETYPES", MIMETYPES)
+        app.config.setdefault("COMPRESS_MIN_SIZE", 500)
+        app.config.setdefault("COMPRESS_LEVEL", 6)
+        app.config.setdefault("COMPRESS_BROTLI_QUALITY", 4)
+        app.config.setdefault("COMPRESS_CACHE_MAX_ENTRIES", 256)
+        app.config.setdefault("COMPRESS_CACHE_TTL", 300)
+
+        app.extensions["compression"] = LocalCache(
+                app.config["COMPRESS_CACHE_MAX_ENTRIES"],
+                app.config["COMPRESS_CACHE_TTL"])
+        app.after_request(self.after_request)
+
+
+    @property
+    def encodings(self):
+        """Retrieves the supported encodings, most preferred first"""
+        return ("br", "gzip", "deflate") if brotli is not None else \
+                ("gzip", "deflate")
+
+
+    @property
+    def cache(self):
+        """Retrieves the compressed body cache of the current application"""
+        return flask.current_app.extensions["compression"]
+
+
+    def getCompressor(self, encoding):
+        """Retrieves a new compressor for an encoding"""
+        config = flask.current_app.config
+        if encoding == "br":
+            return BrotliCompressor(config["COMPRESS_BROTLI_QUALITY"])
+
+        # gzip framing for gzip, zlib framing for HTTP deflate
+        window = 31 if encoding == "gzip" else 15
+        return zlib.compressobj(config["COMPRESS_LEVEL"], zlib.DEFLATED,
+                window)
+
+
+    def after_request(self, response):
+        """Compresses a response if the client accepts it"""
+        config = flask.current_app.config
+        if not config["COMPRESS_ENABLED"] or \
+                response.mimetype not in config["COMPRESS_MIMETYPES"]:
+            return response
+
+        response.vary.add("Accept-Encoding")
+        if response.status_code < 200 or response.status_code >= 300 or \
+                response.status_code == 204 or response.direct_passthrough or \
+                "Content-Encoding" in response.headers:
+            return response
+
+        encoding = flask.request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            return self.compressStream(response, encoding)
+
+        body = response.get_data()
+        if len(body) < config["COMPRESS_MIN_SIZE"]:
+            return response
+
+        # The body length guards against bodies built from stale details
+        etag, weak = response.get_etag()
+        key = f"{encoding}:{etag}:{len(body)}" if etag else None
+        compressed = self.cache.get(key) if key else MISSING
+        if compressed is MISSING:
+            compressor = self.getCompressor(encoding)
+            compressed = compressor.compress(body) + compressor.flush()
+            if key:
+                self.cache.set(key, compressed)
+
+        if len(compressed) >= len(body):
+            return response
+
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+
+    def compressStream(self, response, encoding):
+        """
+        Compresses a streamed response chunk by chunk, flushing after each
+        chunk so clients receive data as soon as it is produced
+        """
+        compressor = self.getCompressor(encoding)
+        iterable = response.response
+        chunks = response.iter_encoded()
+
+        def generate():
+            for chunk in chunks:
+                data = compressor.compress(chunk) + \
+                        compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+
+            yield compressor.flush()
+
+        # Close the original iterable even if streaming never started
+        response.response = ClosingIterator(generate(),
+                [iterable.close] if hasattr(iterable, "close") else [])
+        response.headers.pop("Content-Length", None)
+        response.headers["Content-Encoding"] = encoding
+        return response
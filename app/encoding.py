@@ -0,0 +1,122 @@
+import json
+import uuid
+import decimal
+from datetime import date, datetime, time, timedelta
+import flask
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+COMPACT_KEYS = "compact"
+
+
+def encode_datetime(value):
+    """
+    Encodes a datetime in ISO-8601. Naive values are UTC, and aware values
+    keep their offset, like orjson does
+    """
+    if value.tzinfo is None:
+        return value.isoformat() + "Z"
+
+    if value.utcoffset() == timedelta(0):
+        return value.replace(tzinfo = None).isoformat() + "Z"
+
+    return value.isoformat()
+
+
+ENCODERS = {
+        datetime: encode_datetime,
+        date: date.isoformat,
+        time: time.isoformat,
+        decimal.Decimal: str,
+        uuid.UUID: str,
+        }
+
+
+def encode(value):
+    """
+    Encodes values the json module does not support, looking the encoder up
+    by exact type before falling back to Flask's default conversions
+    """
+    encoder = ENCODERS.get(type(value))
+    if encoder is not None:
+        return encoder(value)
+
+    for kind, encoder in ENCODERS.items():
+        if isinstance(value, kind):
+            return encoder(value)
+
+    return DefaultJSONProvider.default(value)
+
+
+def drop_nulls(value):
+    """Removes keys holding null values from nested dicts"""
+    if isinstance(value, dict):
+        return {key: drop_nulls(item) for key, item in value.items()
+                if item is not None}
+
+    if isinstance(value, (list, tuple)):
+        return [drop_nulls(item) for item in value]
+
+    return value
+
+
+def wants_compact_keys():
+    """Checks if the client asked for nulls to be left out with ?keys=compact"""
+    return flask.has_request_context() and \
+            flask.request.args.get("keys") == COMPACT_KEYS
+
+
+class JSONProvider(DefaultJSONProvider):
+    """
+    JSON provider for API responses. Datetimes are encoded in ISO-8601 rather
+    than HTTP date format, and compact output goes through a reused encoder,
+    or orjson when it is installed, instead of building a new encoder per
+    call. Indented output in debug mode still uses the json module
+    """
+    default = staticmethod(encode)
+    ensure_ascii = False
+
+    def __init__(self, app):
+        super(JSONProvider, self).__init__(app)
+        self.sort_keys = app.config.get("JSON_SORT_KEYS", False)
+        self.encoder = json.JSONEncoder(ensure_ascii = False,
+                sort_keys = self.sort_keys, separators = (",", ":"),
+                default = encode)
+
+        self.options = 0
+        if orjson is not None:
+            self.options = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | \
+                    orjson.OPT_NON_STR_KEYS
+            if self.sort_keys:
+                self.options |= orjson.OPT_SORT_KEYS
+
+
+    def dumps(self, obj, **kwargs):
+        """Serializes data as JSON, taking the fast path for compact output"""
+        if not kwargs or kwargs == {"separators": (",", ":")}:
+            if orjson is not None:
+                return orjson.dumps(obj, default = encode,
+                        option = self.options).decode("utf-8")
+
+            return self.encoder.encode(obj)
+
+        return super(JSONProvider, self).dumps(obj, **kwargs)
+
+
+    def response(self, *args, **kwargs):
+        """
+        Creates a JSON response, leaving out nulls when the client asked for
+        compact keys. Data serialized for storage goes through dumps, so it
+        never depends on the request
+        """
+        obj = self._prepare_response_obj(args, kwargs)
+        return super(JSONProvider, self).response(self.compact_nulls(obj))
+
+
+    def compact_nulls(self, obj):
+        """Removes null values from response data when the client asked to"""
+        return drop_nulls(obj) if wants_compact_keys() else obj
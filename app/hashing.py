@@ -0,0 +1,172 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import flask
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HashingBusy(RuntimeError):
+    """Raised when too many password hashes are already waiting"""
+    pass
+
+
+def run_chunk(function, arguments):
+    """Calls a function with each tuple of arguments of a chunk in turn"""
+    return [function(*args) for args in arguments]
+
+
+class HashingPool(object):
+    """Process pool with a bound on the hashes queued or running on it"""
+
+    def __init__(self, workers, max_queue):
+        self.workers = workers
+        self.executor = None
+        self.slots = threading.BoundedSemaphore(max_queue)
+        self.lock = threading.Lock()
+
+
+    def run(self, function, *args, timeout = None):
+        """Runs a function on the pool, raising HashingBusy when it is full"""
+        if not self.slots.acquire(blocking = False):
+            raise HashingBusy("Too many password hashes are queued")
+
+        return self.wait(self.submit(function, *args), timeout)
+
+
+    def submit(self, function, *args):
+        """
+        Submits a function holding an acquired slot, which is released when
+        the function finishes rather than when the caller stops waiting
+        """
+        try:
+            future = self.getExecutor().submit(function, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+
+        future.add_done_callback(lambda future: self.slots.release())
+        return future
+
+
+    @staticmethod
+    def wait(future, timeout = None):
+        """Retrieves the result of a future, raising HashingBusy on timeout"""
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            raise HashingBusy("Password hashing timed out")
+
+
+    def map(self, function, *iterables, timeout = None, chunksize = 8):
+        """
+        Runs a function over iterables on the pool in small chunks, each
+        holding a slot of its own. At most one chunk per worker is queued at
+        a time, so other hashes are not left waiting behind a whole batch
+        """
+        arguments = list(zip(*iterables))
+        chunks = [arguments[start:start + chunksize]
+                for start in range(0, len(arguments), chunksize)]
+        pending = deque()
+        results = []
+
+        for chunk in chunks:
+            if len(pending) >= self.workers:
+                results.extend(self.wait(pending.popleft(), timeout))
+
+            if not self.slots.acquire(timeout = timeout):
+                raise HashingBusy("Too many password hashes are queued")
+
+            pending.append(self.submit(run_chunk, function, chunk))
+
+        while pending:
+            results.extend(self.wait(pending.popleft(), timeout))
+
+        return results
+
+
+    def getExecutor(self):
+        """Retrieves the process pool, starting it on first use"""
+        if self.executor is None:
+            with self.lock:
+                if self.executor is None:
+                    self.executor = ProcessPoolExecutor(self.workers)
+
+        return self.executor
+
+
+    def shutdown(self):
+        """Stops the worker processes"""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+class PasswordHasher(object):
+    """
+    Hashes and verifies passwords on a bounded process pool, so the work
+    neither holds the GIL of the request worker nor queues without limit.
+    The hashing method, and with it the work factor, is set per config
+    class, and hashes made with other parameters are reported for rehashing
+    """
+
+    def __init__(self, app = None):
+        if app is not None:
+            self.init_app(app)
+
+
+    def init_app(self, app):
+        """Creates the hashing pool of an application"""
+        app.config.setdefault("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+        app.config.setdefault("PASSWORD_HASH_WORKERS", os.cpu_count() or 1)
+        app.config.setdefault("PASSWORD_HASH_MAX_QUEUE", 64)
+        app.config.setdefault("PASSWORD_HASH_TIMEOUT", 10)
+
+        workers = app.config["PASSWORD_HASH_WORKERS"]
+        app.extensions["hashing"] = HashingPool(workers,
+                app.config["PASSWORD_HASH_MAX_QUEUE"]) if workers else None
+
+
+    def run(self, function, *args):
+        """Runs a hashing function on the pool, or inline without one"""
+        pool = flask.current_app.extensions.get("hashing")
+        if pool is None:
+            return function(*args)
+
+        return pool.run(function, *args,
+                timeout = flask.current_app.config["PASSWORD_HASH_TIMEOUT"])
+
+
+    def generate(self, password):
+        """Hashes a password with the configured method"""
+        return self.run(generate_password_hash, password,
+                flask.current_app.config["PASSWORD_HASH_METHOD"])
+
+
+    def generateMany(self, passwords):
+        """
+        Hashes many passwords with the configured method, spread across the
+        pool, for bulk imports
+        """
+        passwords = list(passwords)
+        method = flask.current_app.config["PASSWORD_HASH_METHOD"]
+        pool = flask.current_app.extensions.get("hashing")
+        if pool is None:
+            return [generate_password_hash(password, method)
+                    for password in passwords]
+
+        return pool.map(generate_password_hash, passwords,
+                [method] * len(passwords),
+                timeout = flask.current_app.config["PASSWORD_HASH_TIMEOUT"])
+
+
+    def verify(self, password_hash, password):
+        """Checks a password against a hash"""
+        return self.run(check_password_hash, password_hash, password)
+
+
+    def needsRehash(self, password_hash):
+        """Checks if a hash was made with other than the configured method"""
+        method = password_hash.split("$", 1)[0] if password_hash else None
+        return method != flask.current_app.config["PASSWORD_HASH_METHOD"]
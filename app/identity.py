@@ -0,0 +1,87 @@
+import flask
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from .cache import LocalCache, MISSING
+
+
+class IdentityCache(object):
+    """
+    Short-lived in-process cache of the users behind sessions and access
+    tokens, looked up by more than one key. Entries hold the column values
+    of a user and extra values such as the permissions of its role, and are
+    restored into the current session without a query. Entries are tagged
+    like the details cache, so the same session events invalidate them
+    """
+
+    def __init__(self, app = None):
+        if app is not None:
+            self.init_app(app)
+
+
+    def init_app(self, app):
+        """Creates the identity cache of an application"""
+        app.config.setdefault("IDENTITY_CACHE_MAX_ENTRIES", 10000)
+        app.config.setdefault("IDENTITY_CACHE_TTL", 60)
+
+        app.extensions["identities"] = LocalCache(
+                app.config["IDENTITY_CACHE_MAX_ENTRIES"],
+                app.config["IDENTITY_CACHE_TTL"])
+
+
+    @property
+    def store(self):
+        """Retrieves the identity cache of the current application"""
+        if not flask.has_app_context():
+            return None
+
+        return flask.current_app.extensions.get("identities")
+
+
+    def get(self, key):
+        """Retrieves a cached entry, or MISSING"""
+        store = self.store
+        return MISSING if store is None else store.get(key)
+
+
+    def set(self, keys, entry, tags = ()):
+        """Caches an entry under several keys"""
+        store = self.store
+        if store is None:
+            return
+
+        for key in keys:
+            store.set(key, entry, tags)
+
+
+    def invalidate(self, tag):
+        """Removes every entry carrying a tag"""
+        store = self.store
+        if store is not None:
+            store.invalidate(tag)
+
+
+    @staticmethod
+    def snapshot(instance, **extra):
+        """Retrieves the column values of an instance and extra values"""
+        values = {attribute.key: getattr(instance, attribute.key)
+                for attribute in type(instance).__mapper__.column_attrs}
+        return (values, extra)
+
+
+    @staticmethod
+    def restore(session, model, entry):
+        """
+        Rebuilds an instance from a snapshot and merges it into a session
+        without loading it, setting the extra values as plain attributes
+        """
+        values, extra = entry
+        instance = model.__mapper__.class_manager.new_instance()
+        for key, value in values.items():
+            set_committed_value(instance, key, value)
+
+        make_transient_to_detached(instance)
+        instance = session.merge(instance, load = False)
+        for key, value in extra.items():
+            setattr(instance, key, value)
+
+        return instance
@@ -0,0 +1,118 @@
+import re
+import operator
+from urllib.parse import quote
+import flask
+
+MODES = ("none", "compact", "full")
+DEFAULT_MODE = "full"
+
+ARGUMENT = re.compile(r"<(?:[^:<>]+:)?([^<>]+)>")
+PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+def get_mode():
+    """
+    Retrieves the link mode requested with ?links=none|compact|full.
+    Unknown values fall back to full links
+    """
+    if not flask.has_request_context():
+        return DEFAULT_MODE
+
+    mode = flask.request.args.get("links", DEFAULT_MODE)
+    return mode if mode in MODES else DEFAULT_MODE
+
+
+def get_root():
+    """Retrieves the scheme, host and script root that prefix full links"""
+    if flask.has_request_context():
+        return flask.request.url_root.rstrip("/")
+
+    config = flask.current_app.config
+    if not config.get("SERVER_NAME"):
+        return ""
+
+    return f"{config['PREFERRED_URL_SCHEME']}://{config['SERVER_NAME']}" + \
+            (config.get("APPLICATION_ROOT") or "/").rstrip("/")
+
+
+class LinkBuilder(object):
+    """
+    Builds hypermedia links from path templates compiled once from the URL
+    map, so per-object links are plain string interpolation instead of
+    Werkzeug URL builds. Models declare their links in __links__ as
+    {key: (endpoint, {argument: attribute})}
+    """
+
+    def __init__(self, app = None):
+        if app is not None:
+            self.init_app(app)
+
+
+    def init_app(self, app):
+        """
+        Compiles the path templates of every registered endpoint. Call this
+        after all blueprints are registered
+        """
+        templates = {}
+        for rule in app.url_map.iter_rules():
+            templates.setdefault(rule.endpoint, ARGUMENT.sub(r"{\1}",
+                rule.rule))
+
+        app.extensions["links"] = {"templates": templates, "compiled": {}}
+
+
+    @property
+    def templates(self):
+        """Retrieves the path templates of the current application"""
+        return flask.current_app.extensions["links"]["templates"]
+
+
+    def url(self, endpoint, **values):
+        """Builds a full URL to an endpoint, like url_for with _external"""
+        path = self.templates[endpoint].format(**{key: quote(str(value),
+            safe = "/") for key, value in values.items()})
+        return get_root() + path
+
+
+    def compile(self, model):
+        """
+        Compiles the links of a model into (key, format, getter) tuples,
+        where getter fetches the attributes to interpolate into format
+        """
+        cache = flask.current_app.extensions["links"]["compiled"]
+        compiled = cache.get(model)
+        if compiled is not None:
+            return compiled
+
+        compiled = []
+        for key, (endpoint, arguments) in model.__links__.items():
+            path = self.templates[endpoint]
+            names = PLACEHOLDER.findall(path)
+            attributes = [arguments[name] for name in names]
+            format = PLACEHOLDER.sub("%s", path.replace("%", "%%"))
+
+            getter = operator.attrgetter(*attributes) if attributes else \
+                    (lambda instance: ())
+            if len(attributes) == 1:
+                getter = (lambda get: lambda instance: (get(instance),))(
+                        getter)
+
+            compiled.append((key, format, getter))
+
+        cache[model] = compiled
+        return compiled
+
+
+    def build(self, instance, fields = None):
+        """
+        Retrieves the links of a model instance in the requested mode,
+        limited to the selected fields if any
+        """
+        mode = get_mode()
+        if mode == "none":
+            return {}
+
+        root = get_root() if mode == "full" else ""
+        return {key: root + format % getter(instance)
+                for key, format, getter in self.compile(type(instance))
+                if fields is None or key in fields}
@@ -1,19 +1,38 @@
 import logging
-import random
+import hashlib
+import itertools
+import threading
 import flask
-from flask import url_for
-from datetime import datetime
+import time
+from datetime import datetime, timezone, timedelta
 import flask_login
-from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from . import db, login_manager
+from . import (db, login_manager, jwt, search, cache, links, identities,
+        hasher, presence)
+from .cache import MISSING
+from sqlalchemy.orm.attributes import set_committed_value
 from utilities.file_saver import save_image, is_allowed_file
-from utilities.securities import get_gravatar_hash
+from utilities.fields import select_fields, wants
+from utilities.conditional import Validator
+from utilities.contacts import normalize_email, normalize_phone
+from utilities.importing import ImportReport
+from utilities.securities import (get_gravatar_hash, generate_seed,
+        get_seed_commitment, draw_candidates, permute_number, sign_ticket_code,
+        verify_ticket_code)
 
 # Configure logging
 logging.basicConfig(filename = 'app.log', level = logging.INFO)
 
 
+IMPORT_REQUIRED_FIELDS = ("firstName", "lastName", "emailAddress",
+        "phoneNumber", "password")
+IMPORT_FIELDS = ("firstName", "middleName", "lastName", "gender",
+        "emailAddress", "phoneNumber", "nationality")
+
+USER_STATISTICS = ("rafflesWon", "pastRaffles", "activeRaffles",
+        "notifications", "tasks")
+
+
 class Permission:
     VISIT = 1
     MEMBER = 2
@@ -40,10 +59,25 @@ class Status:
 @login_manager.user_loader
 def load_user(user_id):
     """
-    Queries the database for a record of currently logged in user
+    Retrieves the currently logged in user from the identity cache, or the
+    database on a miss
     Returns User object containing info about logged in user
     """
-    return User.query.get(int(user_id))
+    user = User.getIdentity(user_id = int(user_id))
+    if user is not None:
+        user.ping()
+
+    return user
+
+
+@jwt.user_lookup_loader
+def lookup_user(jwt_header, jwt_data):
+    """Retrieves the user identified by the email address of an access token"""
+    user = User.getIdentity(email_address = jwt_data["sub"])
+    if user is not None:
+        user.ping()
+
+    return user
 
 
 class Anonymous_User(flask_login.AnonymousUserMixin):
@@ -58,9 +92,148 @@ class Anonymous_User(flask_login.AnonymousUserMixin):
 login_manager.anonymous_user = Anonymous_User
 
 
+class SearchableMixin(object):
+    """Keeps a full-text index of the __searchable__ fields of a model"""
+
+    @classmethod
+    def search(cls, expression, offset = 0, limit = 20):
+        """
+        Retrieves instances matching a search expression ranked by relevance
+        Returns a list of (instance, snippet) tuples
+        """
+        if not search.is_supported():
+            return cls.searchByPattern(expression, offset, limit)
+
+        results = search.query_index(cls, expression, offset, limit,
+                getattr(cls, "__searchweights__", None))
+        if not results:
+            return []
+
+        key = search.primary_key(cls)
+        instances = {getattr(instance, key.key): instance for instance in
+                cls.query.filter(key.in_([id for id, _ in results]))}
+
+        return [(instances[id], snippet) for id, snippet in results
+                if id in instances]
+
+
+    @classmethod
+    def searchByPattern(cls, expression, offset = 0, limit = 20):
+        """Retrieves instances matching a search expression by scanning"""
+        pattern = f"%{expression}%"
+        columns = [cls.__table__.c[field] for field in cls.__searchable__]
+        filters = [(column if isinstance(column.type, db.String) else
+            db.cast(column, db.String)).ilike(pattern) for column in columns]
+        key = search.primary_key(cls)
+
+        instances = cls.query.filter(db.or_(*filters)).order_by(key)\
+                .offset(offset).limit(limit)
+        return [(instance, None) for instance in instances]
+
+
+    @classmethod
+    def reindex(cls):
+        """Rebuilds the full-text index of the model from its table"""
+        connection = db.session.connection()
+        if search.is_supported(connection):
+            search.create_index(connection, cls)
+            search.rebuild_index(connection, cls)
+        db.session.commit()
+
+
+    @staticmethod
+    def after_create(target, connection, **kwargs):
+        """Creates the full-text index alongside the table of a model"""
+        for model in SearchableMixin.__subclasses__():
+            if model.__table__ is target and search.is_supported(connection):
+                search.create_index(connection, model)
+
+
+    @staticmethod
+    def before_drop(target, connection, **kwargs):
+        """Drops the full-text index alongside the table of a model"""
+        for model in SearchableMixin.__subclasses__():
+            if model.__table__ is target and search.is_supported(connection):
+                search.drop_index(connection, model)
+
+
+    @staticmethod
+    def after_flush(session, flush_context):
+        """Applies flushed changes of searchable instances to their index"""
+        changed = [instance for instance in session.new | session.dirty
+                if isinstance(instance, SearchableMixin)]
+        deleted = [instance for instance in session.deleted
+                if isinstance(instance, SearchableMixin)]
+
+        if not (changed or deleted):
+            return
+
+        connection = session.connection()
+        if not search.is_supported(connection):
+            return
+
+        for instance in changed:
+            if instance in session.new or instance.isSearchableModified():
+                search.add_to_index(connection, instance)
+
+        for instance in deleted:
+            search.remove_from_index(connection, type(instance),
+                    getattr(instance, search.primary_key(type(instance)).key))
+
+
+    def isSearchableModified(self):
+        """Checks whether any indexed field of the instance has changed"""
+        attributes = db.inspect(self).attrs
+        return any(attributes[field].history.has_changes()
+                for field in self.__searchable__)
+
+
 class User(flask_login.UserMixin, db.Model):
     """Represents a user in the system"""
     __tablename__ = 'users'
+    __links__ = {
+            "uploadProfileImageUrl": ("administration.upload_user_image",
+                {"user_id": "userId"}),
+            "tasksUrl": ("administration.get_user_tasks",
+                {"user_id": "userId"}),
+            "notificationsUrl": ("administration.get_user_notifications",
+                {"user_id": "userId"}),
+            "ticketsUrl": ("administration.get_user_tickets",
+                {"user_id": "userId"}),
+            "deleteUserUrl": ("administration.delete_user",
+                {"user_id": "userId"}),
+            "updateUserUrl": ("administration.update_user",
+                {"user_id": "userId"}),
+            "url": ("administration.get_user",
+                {"user_id": "userId"}),
+            }
+    __fields__ = {
+            "userId": ("userId",),
+            "firstName": ("firstName",),
+            "middleName": ("middleName",),
+            "lastName": ("lastName",),
+            "gender": ("gender",),
+            "emailAddress": ("emailAddress",),
+            "phoneNumber": ("phoneNumber",),
+            "nationality": ("nationality",),
+            "dateCreated": ("dateCreated",),
+            "lastUpdated": ("lastUpdated",),
+            "isSuspended": ("isSuspended",),
+            "isActive": ("isActive",),
+            "isConfirmed": ("isConfirmed",),
+            "rafflesWon": (),
+            "pastRaffles": (),
+            "activeRaffles": (),
+            "notifications": (),
+            "tasks": (),
+            "accountBalance": ("accountBalance",),
+            "avatarUrl": ("emailAddress", "avatarHash"),
+            "imageUrl": ("imageUrl", "emailAddress", "avatarHash"),
+            }
+    __table_args__ = (
+            db.Index('ix_users_emailAddress', 'emailAddress', unique = True),
+            db.Index('ix_users_phoneNumber', 'phoneNumber', unique = True),
+            )
 
     userId = db.Column(db.Integer, primary_key=True, autoincrement=True)
     firstName = db.Column(db.String(50), nullable=False)
@@ -98,14 +271,7 @@ class User(flask_login.UserMixin, db.Model):
         super(User, self).__init__(**kwargs)
         # Assign default role to user
         if self.roleId is None:
-            if self.emailAddress==flask.current_app.config["ADMINISTRATOR_EMAIL"]:
-                role = Role.query.filter_by(name = "Administrator").first()
-
-            else:
-                role = Role.query.filter_by(default = True).first()
-
-            # initialize roleId
-            self.roleId = role.roleId
+            self.roleId = User.getDefaultRoleId(self.emailAddress)
 
         # Generate avatar hash
         if self.emailAddress is not None and self.avatarHash is None:
@@ -146,6 +312,187 @@ class User(flask_login.UserMixin, db.Model):
         return user
 
 
+    @db.validates("emailAddress", "phoneNumber")
+    def validateContacts(self, key, value):
+        """Normalizes email addresses and phone numbers as they are set"""
+        if key == "emailAddress":
+            return normalize_email(value)
+
+        return normalize_phone(value)
+
+
+    @staticmethod
+    def getDuplicateField(error):
+        """
+        Retrieves the unique field an IntegrityError was raised for, or None
+        """
+        message = str(getattr(error, "orig", error))
+        for field in ("emailAddress", "phoneNumber"):
+            if field in message:
+                return field
+
+        return None
+
+
+    @staticmethod
+    def getDefaultRoleId(email_address):
+        """Retrieves the ID of the role given to new users with an email"""
+        role_ids = Role.getIds()
+        if email_address == normalize_email(
+                flask.current_app.config["ADMINISTRATOR_EMAIL"]):
+            return role_ids.get("Administrator")
+
+        return role_ids.get(None)
+
+
+    @staticmethod
+    def prepareImport(record):
+        """
+        Validates and normalizes a record of a bulk import into column values
+        Returns the values and None, or None and the error of the record
+        """
+        missing = [field for field in IMPORT_REQUIRED_FIELDS
+                if not record.get(field)]
+        if missing:
+            return None, f"Missing required fields: {', '.join(missing)}"
+
+        values = {}
+        for field in IMPORT_FIELDS:
+            value = record.get(field)
+            if value is None:
+                default = User.__table__.c[field].default
+                values[field] = default.arg if default is not None else None
+                continue
+
+            if not isinstance(value, str):
+                return None, f"Invalid {field}"
+
+            length = User.__table__.c[field].type.length
+            if length and len(value) > length:
+                return None, f"{field} is longer than {length} characters"
+
+            values[field] = value
+
+        values["emailAddress"] = normalize_email(values["emailAddress"])
+        values["phoneNumber"] = normalize_phone(values["phoneNumber"])
+        if "@" not in values["emailAddress"]:
+            return None, "Invalid email address"
+
+        if not values["phoneNumber"]:
+            return None, "Invalid phone number"
+
+        password = record.get("password")
+        if not isinstance(password, str):
+            return None, "Invalid password"
+
+        values["password"] = password
+        return values, None
+
+
+    @staticmethod
+    def importMany(records, batch_size = 1000):
+        """
+        Imports users from (line, record, error) triples. Records are
+        validated and deduplicated in memory, then each batch is checked
+        against registered contacts with one query, hashed across the
+        hashing pool and inserted with one executemany. Rejected rows are
+        reported without aborting their batch
+        Returns an ImportReport
+        """
+        report = ImportReport()
+        emails, phones = {}, {}
+        batch = []
+        for line, record, error in records:
+            report.rows += 1
+            values = None
+            if error is None:
+                values, error = User.prepareImport(record)
+
+            if error is None and values["emailAddress"] in emails:
+                error = "Email address is repeated from line " \
+                        f"{emails[values['emailAddress']]}"
+
+            if error is None and values["phoneNumber"] in phones:
+                error = "Phone number is repeated from line " \
+                        f"{phones[values['phoneNumber']]}"
+
+            if error is not None:
+                report.addError(line, error)
+                continue
+
+            emails[values["emailAddress"]] = line
+            phones[values["phoneNumber"]] = line
+            batch.append((line, values))
+            if len(batch) >= batch_size:
+                User.insertImport(batch, report)
+                batch = []
+
+        if batch:
+            User.insertImport(batch, report)
+
+        return report.finish()
+
+
+    @staticmethod
+    def insertImport(batch, report):
+        """Inserts a batch of prepared import rows, reporting rejected rows"""
+        registered = db.session.execute(db.select(User.emailAddress,
+            User.phoneNumber).where(db.or_(
+                User.emailAddress.in_([values["emailAddress"]
+                    for line, values in batch]),
+                User.phoneNumber.in_([values["phoneNumber"]
+                    for line, values in batch])))).all()
+        registered_emails = {email for email, phone in registered}
+        registered_phones = {phone for email, phone in registered}
+
+        accepted = []
+        for line, values in batch:
+            if values["emailAddress"] in registered_emails:
+                report.addError(line, "Email address is already registered")
+            elif values["phoneNumber"] in registered_phones:
+                report.addError(line, "Phone number is already registered")
+            else:
+                accepted.append((line, values))
+
+        if not accepted:
+            return
+
+        hashes = hasher.generateMany(values.pop("password")
+                for line, values in accepted)
+        rows = []
+        for (line, values), password_hash in zip(accepted, hashes):
+            values["passwordHash"] = password_hash
+            values["avatarHash"] = get_gravatar_hash(values["emailAddress"])
+            values["roleId"] = User.getDefaultRoleId(values["emailAddress"])
+            rows.append(values)
+
+        try:
+            db.session.execute(db.insert(User), rows)
+            db.session.commit()
+            report.imported += len(rows)
+
+        except db.exc.IntegrityError:
+            # Contacts registered since the lookup, insert row by row
+            db.session.rollback()
+            for line, values in accepted:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(db.insert(User), [values])
+                    report.imported += 1
+
+                except db.exc.IntegrityError as e:
+                    field = User.getDuplicateField(e)
+                    report.addError(line, "Phone number is already registered"
+                            if field == "phoneNumber" else
+                            "Email address is already registered")
+
+            db.session.commit()
+
+        # Role details count their users
+        for role_id in {values["roleId"] for values in rows}:
+            cache.invalidate("Role", role_id)
+
+
     def confirm(self):
         serializer = Serializer(flask.current_app.config["SECRET_KEY"])
 
@@ -167,6 +514,12 @@ class User(flask_login.UserMixin, db.Model):
     def login(self, password):
         """"Authenticates user login"""
         if self.verifyPassword(password):
+            # Upgrade hashes made with outdated parameters
+            if hasher.needsRehash(self.passwordHash):
+                self.password = password
+                db.session.add(self)
+                db.session.commit()
+
             flask_login.login_user(self)
             return Status(Code.SUCCESS, "Login successful")
 
@@ -217,47 +570,123 @@ class User(flask_login.UserMixin, db.Model):
         pass
 
 
-    def getDetails(self):
+    @staticmethod
+    def getStatistics(user_ids, chunk_size = 500):
+        """
+        Retrieves raffle, notification and task counts for multiple users
+        using a fixed number of grouped queries per chunk of user IDs
+        """
+        statistics = {user_id: {
+            "rafflesWon": 0,
+            "pastRaffles": 0,
+            "activeRaffles": 0,
+            "notifications": 0,
+            "tasks": 0,
+            } for user_id in user_ids}
+
+        ongoing = db.and_(db.func.coalesce(Raffle.isClosed, False) == False,
+                Raffle.isActive == True)
+
+        user_ids = list(statistics)
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+
+            # Count won, completed and ongoing raffle tickets per user
+            tickets = db.session.query(
+                    Ticket.userId,
+                    db.func.sum(db.case((Ticket.isWinningTicket == True, 1),
+                        else_ = 0)),
+                    db.func.sum(db.case((ongoing, 0),
+                        (Raffle.raffleId != None, 1), else_ = 0)),
+                    db.func.sum(db.case((ongoing, 1), else_ = 0))
+                    ).outerjoin(Raffle, Raffle.raffleId == Ticket.raffleId)\
+                            .filter(Ticket.userId.in_(chunk))\
+                            .group_by(Ticket.userId)
+
+            for user_id, won, past, pending in tickets:
+                statistics[user_id]["rafflesWon"] = int(won or 0)
+                statistics[user_id]["pastRaffles"] = int(past or 0)
+                statistics[user_id]["activeRaffles"] = int(pending or 0)
+
+            # Count notifications and tasks per user
+            for model, key in ((Notification, "notifications"),
+                    (Task, "tasks")):
+                counts = db.session.query(model.userId, db.func.count())\
+                        .filter(model.userId.in_(chunk))\
+                        .group_by(model.userId)
+
+                for user_id, count in counts:
+                    statistics[user_id][key] = count
+
+        return statistics
+
+
+    @staticmethod
+    def getValidator(user_id = None):
+        """
+        Retrieves a validator for conditional requests of users, covering the
+        tickets, raffles, notifications and tasks their statistics count
+        """
+        users, tickets = User.query, Ticket.query
+        notifications, tasks = Notification.query, Task.query
+        if user_id is not None:
+            users = users.filter(User.userId == user_id)
+            tickets = tickets.filter(Ticket.userId == user_id)
+            notifications = notifications.filter(
+                    Notification.userId == user_id)
+            tasks = tasks.filter(Task.userId == user_id)
+
+        return Validator((users, User.lastUpdated),
+                (tickets, Ticket.lastUpdated),
+                (Raffle.query, Raffle.lastUpdated),
+                (notifications, Notification.lastUpdated),
+                (tasks, Task.taskId))
+
+
+    @staticmethod
+    def getBulkDetails(users, fields = None):
+        """Retrieve details of multiple users without per-user queries"""
+        statistics = {}
+        if wants(fields, *USER_STATISTICS):
+            statistics = User.getStatistics([user.userId for user in users])
+
+        return [user.getDetails(statistics.get(user.userId, {}), fields)
+                for user in users]
+
+
+    def getDetails(self, statistics = None, fields = None):
         """Retrieve user details"""
-        return {
-                "userId": self.userId,
-                "firstName": self.firstName,
-                "middleName": self.middleName,
-                "lastName": self.lastName,
-                "gender": self.gender,
-                "emailAddress": self.emailAddress,
-                "phoneNumber": self.phoneNumber,
-                "nationality": self.nationality,
-                "dateCreated": self.dateCreated,
-                "lastUpdated": self.lastUpdated,
-                "isSuspended": self.isSuspended,
-                "isActive": self.isActive,
-                "isConfirmed": self.isConfirmed,
-                "rafflesWon": len(self.getWonRaffles()),
-                "pastRaffles": len(self.getPastRaffles()),
-                "activeRaffles": len(self.getPendingRaffles()),
-                "notifications": self.notifications.count(),
-                "tasks": self.tasks.count(),
-                "accountBalance": self.accountBalance,
-                "avatarUrl": self.getGravatar(255),
-                "uploadProfileImageUrl": url_for(
-                    "administration.upload_user_image",
-                    user_id = self.userId, _external = True),
-                "tasksUrl": url_for("administration.get_user_tasks",
-                    user_id = self.userId, _external = True),
-                "notificationsUrl":url_for("administration.get_user_notifications",
-                    user_id = self.userId, _external = True),
-                "ticketsUrl": url_for("administration.get_user_tickets",
-                    user_id = self.userId, _external = True),
-                "imageUrl": url_for("static", filename = "images/profiles/" + 
-                    self.imageUrl, _external = True) if self.imageUrl else self.getGravatar(255),
-                "deleteUserUrl": url_for("administration.delete_user",
-                    user_id = self.userId, _external = True),
-                "updateUserUrl": url_for("administration.update_user",
-                    user_id = self.userId, _external = True),
-                "url": url_for("administration.get_user",
-                    user_id = self.userId, _external = True),
-                }
+        if statistics is None and wants(fields, *USER_STATISTICS):
+            statistics = User.getStatistics([self.userId])[self.userId]
+
+        details = select_fields(fields, {
+                "userId": lambda: self.userId,
+                "firstName": lambda: self.firstName,
+                "middleName": lambda: self.middleName,
+                "lastName": lambda: self.lastName,
+                "gender": lambda: self.gender,
+                "emailAddress": lambda: self.emailAddress,
+                "phoneNumber": lambda: self.phoneNumber,
+                "nationality": lambda: self.nationality,
+                "dateCreated": lambda: self.dateCreated,
+                "lastUpdated": lambda: self.lastUpdated,
+                "isSuspended": lambda: self.isSuspended,
+                "isActive": lambda: self.isActive,
+                "isConfirmed": lambda: self.isConfirmed,
+                "rafflesWon": lambda: statistics["rafflesWon"],
+                "pastRaffles": lambda: statistics["pastRaffles"],
+                "activeRaffles": lambda: statistics["activeRaffles"],
+                "notifications": lambda: statistics["notifications"],
+                "tasks": lambda: statistics["tasks"],
+                "accountBalance": lambda: self.accountBalance,
+                "avatarUrl": lambda: self.getGravatar(255),
+                "imageUrl": lambda: links.url("static",
+                    filename = "images/profiles/" + self.imageUrl)
+                if self.imageUrl else self.getGravatar(255),
+                })
+        details.update(links.build(self, fields))
+
+        return details
 
 
     def getWonRaffles(self):
@@ -279,12 +708,15 @@ class User(flask_login.UserMixin, db.Model):
 
 
     def addNotification(self, name, data):
-        """Add a notification for the user"""
-        self.notifications.filter_by(name = name).delete()
+        """
+        Add a notification for the user, replacing earlier ones of the same
+        name. Use Notification.fanOut to notify many users
+        """
+        self.notifications.filter_by(name = name).delete(
+                synchronize_session = False)
 
-        details = {"name": name, "userId": self.userId}
-        notification = Notification.add(details)
-        notification.payloadJSON = json.dumps(data)
+        notification = Notification(name = name, userId = self.userId,
+                payloadJSON = flask.json.dumps(data))
 
         db.session.add(notification)
         return notification
@@ -314,12 +746,12 @@ class User(flask_login.UserMixin, db.Model):
     @password.setter
     def password(self, password):
         """Hashes password"""
-        self.passwordHash = generate_password_hash(password)
+        self.passwordHash = hasher.generate(password)
 
 
     def verifyPassword(self, password):
         """Verifies a user's password"""
-        return check_password_hash(self.passwordHash, password)
+        return hasher.verify(self.passwordHash, password)
 
 
     @staticmethod
@@ -363,8 +795,29 @@ class User(flask_login.UserMixin, db.Model):
 
 
     def ping(self):
-        self.lastSeen = datetime.utcnow()
-        db.session.add(self)
+        """
+        Records that the user was seen, leaving the write to the coalesced
+        last-seen flush instead of the current session
+        """
+        seen = datetime.utcnow()
+        set_committed_value(self, "lastSeen", seen)
+        presence.record(self.userId, seen)
+
+
+    @staticmethod
+    def saveLastSeen(seen):
+        """
+        Writes last-seen times by user ID with one batched UPDATE in its own
+        transaction, leaving lastUpdated untouched
+        """
+        table = User.__table__
+        with db.engine.begin() as connection:
+            connection.execute(table.update()
+                    .where(table.c.userId == db.bindparam("user_id"))
+                    .values(lastSeen = db.bindparam("last_seen"),
+                        lastUpdated = table.c.lastUpdated),
+                    [{"user_id": user_id, "last_seen": last_seen}
+                        for user_id, last_seen in seen.items()])
 
 
     def resetEmailAddress(self, token, email_address):
@@ -395,14 +848,63 @@ class User(flask_login.UserMixin, db.Model):
             return False
 
 
+    @staticmethod
+    def getIdentity(user_id = None, email_address = None):
+        """
+        Retrieves a user by ID or email address through the identity cache,
+        along with the permissions of its role
+        """
+        email_address = normalize_email(email_address)
+        key = f"id:{user_id}" if user_id is not None else \
+                f"email:{email_address}"
+        entry = identities.get(key)
+        if entry is MISSING:
+            user = db.session.get(User, user_id) if user_id is not None else \
+                    User.query.filter_by(emailAddress = email_address).first()
+            if user is None:
+                return None
+
+            entry = identities.snapshot(user,
+                    permissions = user.getPermissions(refresh = True))
+            identities.set((f"id:{user.userId}", f"email:{user.emailAddress}"),
+                    entry, ("User", f"User:{user.userId}", "Role",
+                        f"Role:{user.roleId}"))
+            return user
+
+        return identities.restore(db.session, User, entry)
+
+
+    def getClaims(self):
+        """Retrieves the authorization claims embedded in access tokens"""
+        role = db.session.get(Role, self.roleId) \
+                if self.roleId is not None else None
+
+        return {
+                "perm": role.permissions if role else 0,
+                "role": self.roleId,
+                "roleVersion": role.version if role else None,
+                }
+
+
+    def getPermissions(self, refresh = False):
+        """Retrieves the permission bitmask of the user's role"""
+        permissions = getattr(self, "permissions", None)
+        if permissions is None or refresh:
+            role = db.session.get(Role, self.roleId) \
+                    if self.roleId is not None else None
+            permissions = self.permissions = role.permissions if role else 0
+
+        return permissions
+
+
     def can(self, permission):
         """Checks whether a user has a specific permission"""
-        pass
+        return self.getPermissions() & permission == permission
 
 
     def isAdministrator(self):
         """Checks if the user has administrator privileges"""
-        pass
+        return self.can(Permission.ADMIN)
 
 
     def deactivate(self):
@@ -453,12 +955,34 @@ class User(flask_login.UserMixin, db.Model):
 class Role(db.Model):
     """Represents a role in the system"""
     __tablename__ = 'roles'
+    __links__ = {
+            "deleteRoleUrl": ("administration.delete_role",
+                {"role_id": "roleId"}),
+            "updateRoleUrl": ("administration.update_role",
+                {"role_id": "roleId"}),
+            "usersUrl": ("administration.get_role_users",
+                {"role_id": "roleId"}),
+            "url": ("administration.get_role",
+                {"role_id": "roleId"}),
+            }
+    __fields__ = {
+            "roleId": ("roleId",),
+            "title": ("title",),
+            "description": ("description",),
+            "permissions": ("permissions",),
+            "isDefault": ("default",),
+            "usersCount": (),
+            }
 
     roleId = db.Column(db.Integer, primary_key=True, autoincrement=True)
     title = db.Column(db.String(32), nullable=False)
     description = db.Column(db.Text)
     default = db.Column(db.Boolean, default=False)
     permissions = db.Column(db.Integer, default=0)
+    version = db.Column(db.Integer, default=1, nullable=False,
+            server_default="1")
+    lastUpdated = db.Column(db.DateTime, default=datetime.utcnow,
+            onupdate=datetime.utcnow)
 
     users = db.relationship('User', backref = 'role_users', lazy = 'dynamic')
 
@@ -540,24 +1064,102 @@ class Role(db.Model):
         return self.permissions & permission == permission
 
 
-    def getDetails(self):
+    @staticmethod
+    def getVersion(role_id):
+        """
+        Retrieves the version of the permissions of a role, which access
+        tokens are checked against, through the identity cache
+        """
+        if role_id is None:
+            return None
+
+        versions = identities.get("roles:versions")
+        if versions is MISSING or role_id not in versions:
+            versions = dict(db.session.query(Role.roleId, Role.version))
+            identities.set(("roles:versions",), versions,
+                    ["Role"] + [f"Role:{id}" for id in versions])
+
+        return versions.get(role_id)
+
+
+    @staticmethod
+    def getIds():
+        """
+        Retrieves the IDs of roles by title, with the ID of the default role
+        under None, through the identity cache. The entry is only dropped
+        when roles themselves change, not when users join them
+        """
+        ids = identities.get("roles:ids")
+        if ids is MISSING:
+            roles = db.session.query(Role.roleId, Role.title, Role.default).all()
+            ids = {title: role_id for role_id, title, default in roles}
+            ids[None] = next((role_id for role_id, title, default in roles
+                if default), None)
+            identities.set(("roles:ids",), ids, ("Role",))
+
+        return ids
+
+
+    @staticmethod
+    def before_update(mapper, connection, role):
+        """
+        Bumps the version of a role whose permissions changed, so access
+        tokens carrying the previous permissions are rejected
+        """
+        if db.inspect(role).attrs.permissions.history.has_changes():
+            role.version = (role.version or 0) + 1
+
+
+    @staticmethod
+    def after_change(mapper, connection, role):
+        """Invalidates entries covering every role once a role is written"""
+        cache.record(db.object_session(role), "Role")
+
+
+    @staticmethod
+    def getValidator(role_id = None):
+        """
+        Retrieves a validator for conditional requests of roles, covering the
+        users they count
+        """
+        roles, users = Role.query, User.query
+        if role_id is not None:
+            roles = roles.filter(Role.roleId == role_id)
+            users = users.filter(User.roleId == role_id)
+
+        return Validator((roles, Role.lastUpdated), (users, User.lastUpdated))
+
+
+    @staticmethod
+    def getBulkDetails(roles, fields = None):
+        """Retrieve details of multiple roles, using cached details if any"""
+        roles_by_id = {role.roleId: role for role in roles}
+
+        def load(role_ids):
+            counts = get_link_counts(User.roleId, role_ids) \
+                    if wants(fields, "usersCount") else {}
+            return {role_id: roles_by_id[role_id].getDetails(
+                counts.get(role_id, 0), fields) for role_id in role_ids}
+
+        details = cache.get_many("Role", list(roles_by_id), load, fields)
+        return [details[role.roleId] for role in roles]
+
+
+    def getDetails(self, users_count = None, fields = None):
         """Retrieves role details"""
-        details = {
-                "roleId": self.roleId,
-                "title": self.title,
-                "description": self.description,
-                "permissions": self.permissions,
-                "isDefault": self.default,
-                "usersCount": self.users.count(),
-                "deleteRoleUrl": url_for("administration.delete_role",
-                    role_id = self.roleId, _external = True),
-                "updateRoleUrl": url_for("administration.update_role",
-                    role_id = self.roleId, _external = True),
-                "usersUrl": url_for("administration.get_role_users",
-                    role_id = self.roleId, _external = True),
-                "url": url_for("administration.get_role",
-                    role_id = self.roleId, _external = True),
-                }
+        if users_count is None:
+            return Role.getBulkDetails([self], fields)[0]
+
+        details = select_fields(fields, {
+                "roleId": lambda: self.roleId,
+                "title": lambda: self.title,
+                "description": lambda: self.description,
+                "permissions": lambda: self.permissions,
+                "isDefault": lambda: self.default,
+                "usersCount": lambda: users_count,
+                })
+        details.update(links.build(self, fields))
+
         return details
 
 
@@ -567,11 +1169,45 @@ class Role(db.Model):
 
 
 
-class Book(db.Model):
+class Book(SearchableMixin, db.Model):
     """Represents a book in the system"""
     __tablename__ = 'books'
+    __links__ = {
+            "uploadMultipleImagesUrl": ("administration.upload_book_images",
+                {"book_id": "bookId"}),
+            "uploadCoverImageUrl": ("administration.upload_book_image",
+                {"book_id": "bookId"}),
+            "deleteBookUrl": ("administration.delete_book",
+                {"book_id": "bookId"}),
+            "updateBookUrl": ("administration.update_book",
+                {"book_id": "bookId"}),
+            "url": ("administration.get_book",
+                {"book_id": "bookId"}),
+            "authorsUrl": ("administration.get_book_authors",
+                {"book_id": "bookId"}),
+            "categoriesUrl": ("administration.get_book_categories",
+                {"book_id": "bookId"}),
+            }
+
+    __fields__ = {
+            "bookId": ("bookId",),
+            "title": ("title",),
+            "summary": ("summary",),
+            "publisher": ("publisher",),
+            "yearPublished": ("yearPublished",),
+            "edition": ("edition",),
+            "imageUrl": ("imageUrl",),
+            "dateCreated": ("dateCreated",),
+            "lastUpdated": ("lastUpdated",),
+            "isSuspended": ("isSuspended",),
+            "isActive": ("isSuspended",),
+            "isRaffled": ("rafflesCount",),
+            "authorsCount": (),
+            "categoriesCount": (),
+            }
 
     __searchable__ = ['title', 'publisher', 'yearPublished', 'summary', 'edition']
+    __searchweights__ = [10.0, 3.0, 1.0, 2.0, 1.0]
 
     bookId = db.Column(db.Integer, primary_key=True, autoincrement=True)
     title = db.Column(db.String(255), nullable=False)
@@ -585,23 +1221,76 @@ class Book(db.Model):
             onupdate=datetime.utcnow)
     isSuspended = db.Column(db.Boolean, default = False)
     isActive = db.Column(db.Boolean, default = True)
+    rafflesCount = db.Column(db.Integer, default = 0, nullable = False,
+            server_default = "0")
 
     raffles = db.relationship('Raffle', backref = 'book', lazy = 'dynamic')
-    
-    @property
-    def authors(self):
-        """Retrieves all authors of the book"""
-        authors = Author.query.join(AuthorBook, AuthorBook.authorId == Author.authorId)\
-                .join(Book, Book.bookId == self.bookId).all()
-        return authors
+    authors = db.relationship('Author', secondary = 'author_book',
+            back_populates = 'books', order_by = 'Author.authorId')
+    categories = db.relationship('Category', secondary = 'category_book',
+            back_populates = 'books', order_by = 'Category.categoryId')
 
 
-    @property
-    def categories(self):
-        """Retrieves all categories this book falls under"""
-        categories = Category.query.join(CategoryBook, CategoryBook.categoryId == Category.categoryId)\
-                .join(Book, Book.bookId == self.bookId).all()
-        return categories
+    @staticmethod
+    def getCounts(book_ids):
+        """
+        Retrieves author and category counts for multiple books with a single
+        grouped query over the association tables
+        """
+        counts = {book_id: {"authorsCount": 0, "categoriesCount": 0}
+                for book_id in book_ids}
+        if not counts:
+            return counts
+
+        authors = db.select(AuthorBook.bookId, db.literal("authorsCount"),
+                db.func.count()).where(AuthorBook.bookId.in_(counts))\
+                        .group_by(AuthorBook.bookId)
+        categories = db.select(CategoryBook.bookId,
+                db.literal("categoriesCount"), db.func.count())\
+                        .where(CategoryBook.bookId.in_(counts))\
+                        .group_by(CategoryBook.bookId)
+
+        for book_id, key, count in db.session.execute(
+                db.union_all(authors, categories)):
+            counts[book_id][key] = count
+
+        return counts
+
+
+    @staticmethod
+    def getValidator(book_id = None):
+        """
+        Retrieves a validator for conditional requests of books, covering the
+        author and category links they count
+        """
+        books = Book.query
+        authors, categories = AuthorBook.query, CategoryBook.query
+        if book_id is not None:
+            books = books.filter(Book.bookId == book_id)
+            authors = authors.filter(AuthorBook.bookId == book_id)
+            categories = categories.filter(CategoryBook.bookId == book_id)
+
+        return Validator((books, Book.lastUpdated),
+                (authors, AuthorBook.authorBookId),
+                (categories, CategoryBook.categoryBookId))
+
+
+    @staticmethod
+    def getBulkDetails(books, fields = None):
+        """
+        Retrieve details of multiple books without per-book queries, using
+        cached details if any
+        """
+        books_by_id = {book.bookId: book for book in books}
+
+        def load(book_ids):
+            counts = Book.getCounts(book_ids) \
+                    if wants(fields, "authorsCount", "categoriesCount") else {}
+            return {book_id: books_by_id[book_id].getDetails(
+                counts.get(book_id, {}), fields) for book_id in book_ids}
+
+        details = cache.get_many("Book", list(books_by_id), load, fields)
+        return [details[book.bookId] for book in books]
 
 
     def __repr__(self):
@@ -627,7 +1316,8 @@ class Book(db.Model):
 
     def remove(self):
         """Removes a book"""
-        pass
+        db.session.delete(self)
+        db.session.commit()
 
 
     def updateDetails(self, details = {}):
@@ -706,7 +1396,39 @@ class Book(db.Model):
 
     def isRaffled(self):
         """Checks if a book is already raffled"""
-        return self.raffles.count() > 0
+        return (self.rafflesCount or 0) > 0
+
+
+    @staticmethod
+    def repairCounters(chunk_size = 500):
+        """
+        Rebuilds the raffle counters of all books from the raffles table,
+        one grouped query and one bulk update per chunk of book IDs
+        Returns the number of books processed
+        """
+        processed = 0
+        last_id = 0
+        while True:
+            book_ids = db.session.scalars(db.select(Book.bookId)
+                    .where(Book.bookId > last_id)
+                    .order_by(Book.bookId).limit(chunk_size)).all()
+            if not book_ids:
+                break
+
+            counts = dict(db.session.execute(
+                db.select(Raffle.bookId, db.func.count())
+                .where(Raffle.bookId.in_(book_ids))
+                .group_by(Raffle.bookId)).all())
+
+            db.session.execute(db.update(Book), [{"bookId": book_id,
+                "rafflesCount": counts.get(book_id, 0)}
+                for book_id in book_ids])
+            db.session.commit()
+
+            processed += len(book_ids)
+            last_id = book_ids[-1]
+
+        return processed
 
 
     def isActive(self):
@@ -714,46 +1436,61 @@ class Book(db.Model):
         return self.isActive and not self.isSuspended
 
 
-    def getDetails(self):
+    def getDetails(self, counts = None, fields = None):
         """Retrieves book details"""
-        return {
-                "bookId": self.bookId,
-                "title": self.title,
-                "summary": self.summary,
-                "publisher": self.publisher,
-                "yearPublished": self.yearPublished,
-                "edition": self.edition,
-                "imageUrl": url_for("static", filename = "images/books/" + 
-                    (self.imageUrl or "book.jpg"), 
-                    _external = True),
-                "dateCreated": self.dateCreated,
-                "lastUpdated": self.lastUpdated,
-                "isSuspended": self.isSuspended,
-                "isActive": self.isActive(),
-                "isRaffled": self.isRaffled(),
-                "authorsCount": len(self.authors),
-                "categoriesCount": len(self.categories),
-                "uploadMultipleImagesUrl": url_for(
-                    "administration.upload_book_images", 
-                    book_id = self.bookId, _external = True),
-                "uploadCoverImageUrl": url_for("administration.upload_book_image",
-                    book_id = self.bookId, _external = True),
-                "deleteBookUrl": url_for("administration.delete_book",
-                    book_id = self.bookId, _external = True),
-                "updateBookUrl": url_for("administration.update_book",
-                    book_id = self.bookId, _external = True),
-                "url": url_for("administration.get_book", book_id = self.bookId,
-                    _external = True),
-                "authorsUrl": url_for("administration.get_book_authors",
-                    book_id = self.bookId, _external = True),
-                "categoriesUrl": url_for("administration.get_book_categories", 
-                    book_id = self.bookId, _external = True),
-                }
+        if counts is None:
+            return Book.getBulkDetails([self], fields)[0]
+
+        details = select_fields(fields, {
+                "bookId": lambda: self.bookId,
+                "title": lambda: self.title,
+                "summary": lambda: self.summary,
+                "publisher": lambda: self.publisher,
+                "yearPublished": lambda: self.yearPublished,
+                "edition": lambda: self.edition,
+                "imageUrl": lambda: links.url("static",
+                    filename = "images/books/" + (self.imageUrl or "book.jpg")),
+                "dateCreated": lambda: self.dateCreated,
+                "lastUpdated": lambda: self.lastUpdated,
+                "isSuspended": lambda: self.isSuspended,
+                "isActive": lambda: self.isActive(),
+                "isRaffled": lambda: self.isRaffled(),
+                "authorsCount": lambda: counts["authorsCount"],
+                "categoriesCount": lambda: counts["categoriesCount"],
+                })
+        details.update(links.build(self, fields))
+
+        return details
 
 
 class Author(db.Model):
     """Represents an author in the system"""
     __tablename__ = 'authors'
+    __links__ = {
+            "booksUrl": ("administration.get_author_books",
+                {"author_id": "authorId"}),
+            "deleteAuthorUrl": ("administration.delete_author",
+                {"author_id": "authorId"}),
+            "updateAuthorUrl": ("administration.update_author",
+                {"author_id": "authorId"}),
+            "url": ("administration.get_author",
+                {"author_id": "authorId"}),
+            }
+    __fields__ = {
+            "authorId": ("authorId",),
+            "firstName": ("firstName",),
+            "middleName": ("middleName",),
+            "lastName": ("lastName",),
+            "gender": ("gender",),
+            "emailAddress": ("emailAddress",),
+            "phoneNumber": ("phoneNumber",),
+            "imageUrl": ("imageUrl",),
+            "nationality": ("nationality",),
+            "dateCreated": ("dateCreated",),
+            "lastUpdated": ("lastUpdated",),
+            "summary": ("summary",),
+            "booksCount": (),
+            }
 
     authorId = db.Column(db.Integer, primary_key=True, autoincrement=True)
     firstName = db.Column(db.String(50), nullable=False)
@@ -769,19 +1506,50 @@ class Author(db.Model):
     lastUpdated = db.Column(db.DateTime, default=datetime.utcnow, 
             onupdate=datetime.utcnow)
 
+    books = db.relationship('Book', secondary = 'author_book',
+            back_populates = 'authors', order_by = 'Book.bookId')
+
 
     def __repr__(self):
         """Retrieves a string representation of the Author object"""
         return f"<Author(authorId={self.authorId}, firstName={self.firstName}, lastName={self.lastName})>"
 
 
-    @property
-    def books(self):
-        """Retrieves all books by the author"""
-        books = Book.query.join(AuthorBook, AuthorBook.bookId == Book.bookId)\
-                .join(Author, Author.authorId == self.authorId).all()
-        return books
-    
+    @staticmethod
+    def getBooksCounts(author_ids):
+        """Retrieves book counts for multiple authors with one grouped query"""
+        return get_link_counts(AuthorBook.authorId, author_ids)
+
+
+    @staticmethod
+    def getValidator(author_id = None):
+        """
+        Retrieves a validator for conditional requests of authors, covering
+        the book links they count
+        """
+        authors, books = Author.query, AuthorBook.query
+        if author_id is not None:
+            authors = authors.filter(Author.authorId == author_id)
+            books = books.filter(AuthorBook.authorId == author_id)
+
+        return Validator((authors, Author.lastUpdated),
+                (books, AuthorBook.authorBookId))
+
+
+    @staticmethod
+    def getBulkDetails(authors, fields = None):
+        """Retrieve details of multiple authors without per-author queries"""
+        authors_by_id = {author.authorId: author for author in authors}
+
+        def load(author_ids):
+            counts = Author.getBooksCounts(author_ids) \
+                    if wants(fields, "booksCount") else {}
+            return {author_id: authors_by_id[author_id].getDetails(
+                counts.get(author_id, 0), fields) for author_id in author_ids}
+
+        details = cache.get_many("Author", list(authors_by_id), load, fields)
+        return [details[author.authorId] for author in authors]
+
 
     @staticmethod
     def add(details = {}):
@@ -828,36 +1596,70 @@ class Author(db.Model):
         pass
 
 
-    def getDetails(self):
+    def getDetails(self, books_count = None, fields = None):
         """Retrieve author details"""
-        return {
-                "authorId": self.authorId,
-                "firstName": self.firstName,
-                "middleName": self.middleName,
-                "lastName": self.lastName,
-                "gender": self.gender,
-                "emailAddress": self.emailAddress,
-                "phoneNumber": self.phoneNumber,
-                "imageUrl": self.imageUrl,
-                "nationality": self.nationality,
-                "dateCreated": self.dateCreated,
-                "lastUpdated": self.lastUpdated,
-                "summary": self.summary,
-                "booksCount": len(self.books),
-                "booksUrl": url_for("administration.get_author_books", 
-                    author_id = self.authorId, _external = True),
-                "deleteAuthorUrl": url_for("administration.delete_author",
-                    author_id = self.authorId, _external = True),
-                "updateAuthorUrl": url_for("administration.update_author",
-                    author_id = self.authorId, _external = True),
-                "url": url_for("administration.get_author", 
-                    author_id = self.authorId, _external = True),
-                }
+        if books_count is None:
+            return Author.getBulkDetails([self], fields)[0]
+
+        details = select_fields(fields, {
+                "authorId": lambda: self.authorId,
+                "firstName": lambda: self.firstName,
+                "middleName": lambda: self.middleName,
+                "lastName": lambda: self.lastName,
+                "gender": lambda: self.gender,
+                "emailAddress": lambda: self.emailAddress,
+                "phoneNumber": lambda: self.phoneNumber,
+                "imageUrl": lambda: self.imageUrl,
+                "nationality": lambda: self.nationality,
+                "dateCreated": lambda: self.dateCreated,
+                "lastUpdated": lambda: self.lastUpdated,
+                "summary": lambda: self.summary,
+                "booksCount": lambda: books_count,
+                })
+        details.update(links.build(self, fields))
+
+        return details
 
 
 class Raffle(db.Model):
     """Represents a raffle in the system"""
     __tablename__ = 'raffles'
+    __links__ = {
+            "updateRaffleurl": ("administration.update_raffle",
+                {"raffle_id": "raffleId"}),
+            "purchaseTicketUrl": ("administration.purchase_ticket",
+                {"raffle_id": "raffleId"}),
+            "ticketsUrl": ("administration.get_raffle_tickets",
+                {"raffle_id": "raffleId"}),
+            "closeRaffleUrl": ("administration.close_raffle",
+                {"raffle_id": "raffleId"}),
+            "deactivateRaffleUrl": ("administration.deactivate_raffle",
+                {"raffle_id": "raffleId"}),
+            "activateRaffleUrl": ("administration.activate_raffle",
+                {"raffle_id": "raffleId"}),
+            "drawUrl": ("administration.get_raffle_draw",
+                {"raffle_id": "raffleId"}),
+            "url": ("administration.get_raffle",
+                {"raffle_id": "raffleId"}),
+            }
+    __fields__ = {
+            "raffleId": ("raffleId",),
+            "participantLimit": ("participantLimit",),
+            "startTime": ("startTime",),
+            "endTime": ("endTime",),
+            "price": ("price",),
+            "bookId": ("bookId",),
+            "dateCreated": ("dateCreated",),
+            "lastUpdated": ("lastUpdated",),
+            "isClosed": ("isClosed",),
+            "isOngoing": ("isClosed", "isActive"),
+            "ticketsPurchased": ("ticketsSold",),
+            "ticketsCancelled": ("ticketsCancelled",),
+            "participantsCount": ("participantsCount",),
+            "revenue": ("revenue",),
+            "drawCommitment": ("drawCommitment",),
+            "bookDetails": ("bookId",),
+            }
 
     raffleId = db.Column(db.Integer, primary_key=True, autoincrement=True)
     dateCreated = db.Column(db.DateTime, default=datetime.utcnow)
@@ -869,6 +1671,17 @@ class Raffle(db.Model):
     isClosed = db.Column(db.Boolean, default=False)
     isActive = db.Column(db.Boolean, default=False)
     price = db.Column(db.Float, default=0, nullable=False, server_default="1")
+    drawCommitment = db.Column(db.String(64))
+    drawSeed = db.Column(db.String(64))
+    drawPopulation = db.Column(db.Integer)
+    ticketsSold = db.Column(db.Integer, default=0, nullable=False,
+            server_default="0")
+    ticketsCancelled = db.Column(db.Integer, default=0, nullable=False,
+            server_default="0")
+    participantsCount = db.Column(db.Integer, default=0, nullable=False,
+            server_default="0")
+    revenue = db.Column(db.Float, default=0, nullable=False,
+            server_default="0")
 
     tickets = db.relationship('Ticket', backref = 'raffle', lazy = 'dynamic')
 
@@ -893,7 +1706,16 @@ class Raffle(db.Model):
                 price = details.get('price')
                 )
 
+        # Commit to the draw seed before any ticket is sold
+        raffle.commitDrawSeed()
+
         db.session.add(raffle)
+
+        # Count the raffle against its book in the same transaction
+        db.session.execute(db.update(Book)
+                .where(Book.bookId == raffle.bookId)
+                .values(rafflesCount = Book.rafflesCount + 1)
+                .execution_options(synchronize_session = False))
         db.session.commit()
 
         return raffle
@@ -904,28 +1726,243 @@ class Raffle(db.Model):
         pass
 
 
-    def close(self):
+    def close(self, winners = 1):
         """Closes a raffle"""
         # Draw raffle for winner
-        self.getWinner()
+        self.draw(winners)
 
         # Deactivate the raffle
-        self.deactivate()
+        self.isActive = False
 
         # Close the raffle
         self.isClosed = True
         self.endTime = datetime.utcnow()
 
         db.session.add(self)
-        db.sessioncommit()
+        db.session.commit()
+
+        # Notify every participant, then the winners
+        payload = {"raffleId": self.raffleId}
+        Notification.fanOut("raffle_closed", payload, raffle_id = self.raffleId)
+        Notification.fanOut("raffle_won", payload, user_ids = db.select(
+            Ticket.userId).where(Ticket.raffleId == self.raffleId,
+                Ticket.isWinningTicket == True))
+
+
+    @staticmethod
+    def reserveTickets(raffle_id, quantity = 1):
+        """
+        Reserves capacity for tickets on an ongoing raffle with a single
+        conditional UPDATE on its counters, so concurrent buyers never push
+        ticketsSold past participantLimit.
+        The reservation belongs to the current transaction and is released if
+        it is rolled back.
+        Returns True when the tickets were reserved
+        """
+        result = db.session.execute(db.update(Raffle)
+                .where(Raffle.raffleId == raffle_id,
+                    Raffle.ticketsSold + quantity <= Raffle.participantLimit,
+                    Raffle.isActive == True,
+                    db.func.coalesce(Raffle.isClosed, False) == False)
+                .values(ticketsSold = Raffle.ticketsSold + quantity,
+                    revenue = Raffle.revenue + Raffle.price * quantity)
+                .execution_options(synchronize_session = False))
+
+        return result.rowcount == 1
+
+
+    @staticmethod
+    def addParticipant(raffle_ids, user_id):
+        """
+        Counts a user as a participant of the raffles they hold no active
+        tickets in yet. Call this after reserveTickets and before inserting
+        the tickets, while the reservation keeps concurrent buyers out
+        """
+        held = db.session.scalars(db.select(Ticket.raffleId).distinct()
+                .where(Ticket.userId == user_id,
+                    Ticket.raffleId.in_(raffle_ids),
+                    Ticket.isCancelled == False)).all()
+
+        new = set(raffle_ids) - set(held)
+        if new:
+            db.session.execute(db.update(Raffle)
+                    .where(Raffle.raffleId.in_(new))
+                    .values(participantsCount = Raffle.participantsCount + 1)
+                    .execution_options(synchronize_session = False))
+
+        return new
+
+
+    @staticmethod
+    def repairCounters(chunk_size = 500):
+        """
+        Rebuilds the ticket counters of all raffles from the tickets table,
+        one grouped query and one bulk update per chunk of raffle IDs, so
+        drifted counters can be fixed without locking the whole table
+        Returns the number of raffles processed
+        """
+        active = Ticket.isCancelled == False
+        processed = 0
+        last_id = 0
+        while True:
+            raffles = db.session.execute(db.select(Raffle.raffleId,
+                Raffle.price).where(Raffle.raffleId > last_id)
+                .order_by(Raffle.raffleId).limit(chunk_size)).all()
+            if not raffles:
+                break
+
+            raffle_ids = [raffle_id for raffle_id, _ in raffles]
+            counts = {row[0]: row[1:] for row in db.session.execute(
+                db.select(Ticket.raffleId,
+                    db.func.sum(db.case((active, 1), else_ = 0)),
+                    db.func.sum(db.case((active, 0), else_ = 1)),
+                    db.func.count(db.distinct(db.case((active,
+                        Ticket.userId)))))
+                .where(Ticket.raffleId.in_(raffle_ids))
+                .group_by(Ticket.raffleId))}
+
+            rows = []
+            for raffle_id, price in raffles:
+                sold, cancelled, participants = counts.get(raffle_id,
+                        (0, 0, 0))
+                rows.append({
+                    "raffleId": raffle_id,
+                    "ticketsSold": int(sold or 0),
+                    "ticketsCancelled": int(cancelled or 0),
+                    "participantsCount": participants,
+                    "revenue": int(sold or 0) * (price or 0),
+                    })
+
+            db.session.execute(db.update(Raffle), rows)
+            db.session.commit()
+
+            processed += len(raffles)
+            last_id = raffle_ids[-1]
+
+        return processed
+
+
+    def commitDrawSeed(self):
+        """Generates the draw seed and publishes its commitment"""
+        if self.drawSeed is None:
+            self.drawSeed = generate_seed()
+            self.drawCommitment = get_seed_commitment(self.drawSeed)
+
+
+    def getEligibleTickets(self):
+        """Retrieves a query of tickets eligible for the draw"""
+        return self.tickets.filter(Ticket.isCancelled == False)\
+                .order_by(Ticket.ticketId)
+
+
+    def draw(self, winners = 1):
+        """
+        Draws the winning tickets of a raffle.
+        Ticket IDs between the first and last eligible ticket are tried in an
+        order derived from the committed seed, and the first eligible ones
+        win. Each batch of IDs is one seek on the (raffleId, isCancelled,
+        ticketId) index, so the cost depends on how densely the raffle's
+        tickets fill that range rather than on how many there are
+        """
+        self.commitDrawSeed()
+
+        self.drawPopulation, first, last = self.getDrawRange()
+        tickets = [ticket.declareWon() for ticket in
+                self.getDrawWinners(winners, first, last)]
+
+        db.session.add(self)
+        return tickets
+
+
+    def getDrawRange(self):
+        """
+        Retrieves the number of eligible tickets and the first and last of
+        their IDs with one statement
+        """
+        return db.session.query(db.func.count(Ticket.ticketId),
+                db.func.min(Ticket.ticketId), db.func.max(Ticket.ticketId))\
+                        .filter(Ticket.raffleId == self.raffleId,
+                                Ticket.isCancelled == False).one()
+
+
+    def getDrawWinners(self, winners, first, last, batch_size = 64):
+        """
+        Retrieves the first eligible tickets in the order the draw seed gives
+        to the IDs between first and last, trying the IDs in batches. IDs of
+        cancelled tickets or of other raffles are skipped
+        """
+        candidates = draw_candidates(self.drawSeed, first, last,
+                str(self.raffleId))
+        winners = min(winners, self.drawPopulation or 0)
+
+        tickets = []
+        while len(tickets) < winners:
+            batch = list(itertools.islice(candidates, batch_size))
+            if not batch:
+                break
+
+            found = {ticket.ticketId: ticket for ticket in
+                    self.getEligibleTickets().filter(Ticket.ticketId.in_(batch))}
+            tickets.extend(found[ticket_id] for ticket_id in batch
+                    if ticket_id in found)
+
+        return tickets[:winners]
 
 
     def getWinner(self):
         """Retrieves the winner of a raffle"""
-        winner = Use
+        winner = self.tickets.filter_by(isWinningTicket = True)\
+                .order_by(Ticket.ticketId).first()
         return winner
 
 
+    def getDrawProof(self):
+        """
+        Retrieves the values needed to re-verify a draw. The seed is only
+        revealed once the raffle is closed
+        """
+        proof = {
+                "raffleId": self.raffleId,
+                "drawCommitment": self.drawCommitment,
+                "drawSeed": None,
+                "eligibleTickets": self.drawPopulation,
+                "ticketRange": None,
+                "winningTickets": [],
+                }
+
+        if self.isClosed:
+            population, first, last = self.getDrawRange()
+            proof["drawSeed"] = self.drawSeed
+            proof["ticketRange"] = [first, last]
+            proof["winningTickets"] = [ticket.ticketId for ticket in
+                    self.tickets.filter_by(isWinningTicket = True)\
+                            .order_by(Ticket.ticketId)]
+
+        return proof
+
+
+    def verifyDraw(self):
+        """Checks that the revealed seed matches its commitment and winners"""
+        if not self.isClosed or self.drawSeed is None:
+            return False
+
+        if self.drawCommitment and \
+                get_seed_commitment(self.drawSeed) != self.drawCommitment:
+            return False
+
+        # Tickets of closed raffles cannot be cancelled, so the eligible
+        # tickets are still those the draw saw
+        population, first, last = self.getDrawRange()
+        if population != self.drawPopulation:
+            return False
+
+        proof = self.getDrawProof()
+        expected = sorted(ticket.ticketId for ticket in self.getDrawWinners(
+            len(proof["winningTickets"]), first, last))
+
+        return expected == proof["winningTickets"]
+
+
     def activate(self):
         """Activates a raffle"""
         if self.isClosed:
@@ -945,7 +1982,7 @@ class Raffle(db.Model):
             return "Cannot deactivate a closed raffle", 400
 
         if self.isActive:
-            self.Active = False
+            self.isActive = False
 
         db.session.add(self)
         db.session.commit()
@@ -957,42 +1994,96 @@ class Raffle(db.Model):
         return not self.isClosed and self.isActive
 
 
-    def getDetails(self):
+    @staticmethod
+    def getValidator(raffle_id = None):
+        """
+        Retrieves a validator for conditional requests of raffles, covering
+        the books whose details they embed
+        """
+        raffles, book_id = Raffle.query, None
+        if raffle_id is not None:
+            raffles = raffles.filter(Raffle.raffleId == raffle_id)
+            book_id = db.select(Raffle.bookId).where(
+                    Raffle.raffleId == raffle_id).scalar_subquery()
+
+        return Validator((raffles, Raffle.lastUpdated)) + \
+                Book.getValidator(book_id)
+
+
+    @staticmethod
+    def getBulkDetails(raffles, fields = None):
+        """Retrieve details of multiple raffles and their books in bulk"""
+        if not wants(fields, "bookDetails"):
+            return [raffle.getDetails(fields = fields) for raffle in raffles]
+
+        book_ids = {raffle.bookId for raffle in raffles}
+        books = Book.query.filter(Book.bookId.in_(book_ids)).all() \
+                if book_ids else []
+        book_details = dict(zip([book.bookId for book in books],
+            Book.getBulkDetails(books)))
+
+        return [raffle.getDetails(book_details.get(raffle.bookId), fields)
+                for raffle in raffles]
+
+
+    def getDetails(self, book_details = None, fields = None):
         """Retrieves raffle details"""
-        return {
-                "raffleId": self.raffleId,
-                "participantLimit": self.participantLimit,
-                "startTime": self.startTime,
-                "endTime": self.endTime,
-                "price": self.price,
-                "bookId": self.bookId,
-                "dateCreated": self.dateCreated,
-                "lastUpdated": self.lastUpdated,
-                "isClosed": self.isClosed,
-                "isOngoing": self.isOngoing(),
-                "ticketsPurchased": self.tickets.count(),
-                "updateRaffleurl": url_for("administration.update_raffle",
-                    raffle_id = self.raffleId, _external = True),
-                "purchaseTicketUrl": url_for("administration.purchase_ticket",
-                    raffle_id = self.raffleId, _external = True),
-                "ticketsUrl": url_for("administration.get_raffle_tickets",
-                    raffle_id = self.raffleId, _external = True),
-                "closeRaffleUrl": url_for("administration.close_raffle",
-                    raffle_id = self.raffleId, _external = True),
-                "deactivateRaffleUrl": url_for("administration.deactivate_raffle",
-                    raffle_id = self.raffleId, _external = True),
-                "activateRaffleUrl": url_for("administration.activate_raffle",
-                    raffle_id = self.raffleId, _external = True),
-                "url": url_for("administration.get_raffle",
-                    raffle_id = self.raffleId, _external = True),
-                "bookDetails": self.getBook.getDetails()
-                }
+        if book_details is None and self.bookId is not None and \
+                wants(fields, "bookDetails"):
+            book_details = self.getBook.getDetails()
+
+        details = select_fields(fields, {
+                "raffleId": lambda: self.raffleId,
+                "participantLimit": lambda: self.participantLimit,
+                "startTime": lambda: self.startTime,
+                "endTime": lambda: self.endTime,
+                "price": lambda: self.price,
+                "bookId": lambda: self.bookId,
+                "dateCreated": lambda: self.dateCreated,
+                "lastUpdated": lambda: self.lastUpdated,
+                "isClosed": lambda: self.isClosed,
+                "isOngoing": lambda: self.isOngoing(),
+                "ticketsPurchased": lambda: self.ticketsSold,
+                "ticketsCancelled": lambda: self.ticketsCancelled,
+                "participantsCount": lambda: self.participantsCount,
+                "revenue": lambda: self.revenue,
+                "drawCommitment": lambda: self.drawCommitment,
+                "bookDetails": lambda: book_details,
+                })
+        details.update(links.build(self, fields))
+
+        return details
 
 
 
 class Ticket(db.Model):
     """Represents a ticket in the system"""
     __tablename__ = 'tickets'
+    __links__ = {
+            "validateTicketUrl": ("administration.validate_ticket",
+                {"ticket_id": "ticketId"}),
+            "cancelTicketUrl": ("administration.cancel_ticket",
+                {"ticket_id": "ticketId"}),
+            "url": ("administration.get_ticket",
+                {"ticket_id": "ticketId"}),
+            }
+    __fields__ = {
+            "selfId": ("ticketId",),
+            "raffleId": ("raffleId",),
+            "isWinningTicket": ("isWinningTicket",),
+            "dateCreated": ("dateCreated",),
+            "lastUpdated": ("lastUpdated",),
+            "uniqueNumber": ("uniqueNumber",),
+            "isCancelled": ("isCancelled",),
+            "userId": ("userId",),
+            "ticketCode": ("ticketId", "raffleId", "uniqueNumber", "dateCreated"),
+            }
+    __table_args__ = (
+            db.Index('ix_tickets_raffleId_ticketId', 'raffleId', 'ticketId'),
+            db.Index('ix_tickets_raffleId_isCancelled_ticketId', 'raffleId',
+                'isCancelled', 'ticketId'),
+            db.Index('ix_tickets_userId_raffleId', 'userId', 'raffleId'),
+            )
 
     ticketId = db.Column(db.Integer, primary_key=True, autoincrement=True)
     raffleId = db.Column(db.Integer, db.ForeignKey('raffles.raffleId'))
@@ -1000,8 +2091,10 @@ class Ticket(db.Model):
     isWinningTicket = db.Column(db.Boolean, default=False)
     dateCreated = db.Column(db.DateTime, default=datetime.utcnow)
     lastUpdated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    uniqueNumber = db.Column(db.String, nullable=False)
-    isCancelled = db.Column(db.Boolean, default=False)
+    uniqueNumber = db.Column(db.Integer, nullable=False, unique=True,
+            index=True)
+    isCancelled = db.Column(db.Boolean, default=False, nullable=False,
+            server_default=db.false())
 
 
     def __repr__(self):
@@ -1016,63 +2109,378 @@ class Ticket(db.Model):
 
     @staticmethod
     def create(details = {}):
-        """Creates a new ticket"""
-        ticket = Ticket(
-                raffleId = details.get("raffleId"),
-                userId = details.get("userId"),
-                uniqueNumber = random.randrange(20231411, 20300000)
-                )
+        """
+        Creates a new ticket if the raffle still has capacity
+        Returns None when the raffle is sold out or not ongoing
+        """
+        status = Ticket.purchase(details.get("userId"),
+                [(details.get("raffleId"), 1)])
 
-        db.session.add(ticket)
+        if status.code != Code.SUCCESS:
+            return None
+
+        return status.info[0]
+
+
+    @staticmethod
+    def purchase(user_id, items):
+        """
+        Purchases tickets on one or more raffles in a single transaction.
+        Capacity is reserved once per raffle and all tickets are inserted with
+        one multi-row INSERT, so the cost barely depends on the quantity.
+        Takes a list of (raffleId, quantity) pairs
+        Returns a Status whose info holds the created tickets on success, or
+        the ID of the raffle without enough capacity on failure
+        """
+        quantities = {}
+        for raffle_id, quantity in items:
+            quantities[raffle_id] = quantities.get(raffle_id, 0) + quantity
+
+        # Take the numbers before the transaction starts writing, since new
+        # blocks are reserved on a separate connection
+        numbers = iter(Ticket.generateNumbers(sum(quantities.values())))
+
+        # Reserve in a fixed order so concurrent batches cannot deadlock, on
+        # a savepoint so a failure only undoes this purchase's reservations
+        savepoint = db.session.begin_nested()
+        for raffle_id in sorted(quantities):
+            if not Raffle.reserveTickets(raffle_id, quantities[raffle_id]):
+                savepoint.rollback()
+                return Status(Code.FAILURE, "Raffle is sold out or not open",
+                        raffle_id)
+
+        Raffle.addParticipant(list(quantities), user_id)
+
+        rows = [{"raffleId": raffle_id, "userId": user_id,
+            "uniqueNumber": next(numbers)}
+            for raffle_id, quantity in quantities.items()
+            for _ in range(quantity)]
+
+        tickets = db.session.scalars(db.insert(Ticket).returning(Ticket),
+                rows).all()
+        savepoint.commit()
         db.session.commit()
 
-        return ticket
+        return Status(Code.SUCCESS, "Tickets purchased successfully", tickets)
+
+
+    @staticmethod
+    def generateNumbers(count = 1):
+        """
+        Generates unique ticket numbers from the block reserved by this worker.
+        Sequence values are obfuscated with a keyed permutation and offset
+        past the range of legacy random ticket numbers.
+        Call this before the current transaction writes, because reserving a
+        new block waits for other writers on databases with a single writer
+        """
+        app = flask.current_app
+        allocator = app.extensions.get("ticket_numbers")
+        if allocator is None:
+            allocator = app.extensions.setdefault("ticket_numbers",
+                    BlockAllocator("tickets.uniqueNumber",
+                        app.config["TICKET_NUMBER_BLOCK_SIZE"]))
+
+        key = hashlib.sha256(b"tickets.uniqueNumber:" +
+                app.config["TICKET_NUMBER_KEY"].encode("utf-8")).digest()
+
+        return [TICKET_NUMBER_OFFSET + permute_number(value, key,
+            TICKET_NUMBER_DOMAIN) for value in allocator.allocate(count)]
 
 
     def cancel(self):
-        """Cancels a ticket"""
-        pass
+        """
+        Cancels a ticket and releases its place in the raffle, updating the
+        raffle counters in the same transaction
+        Returns a Status describing the outcome
+        """
+        raffle = db.session.get(Raffle, self.raffleId)
+        if raffle is None or raffle.isClosed:
+            return Status(Code.FAILURE, "Raffle is already closed", self)
+
+        # Only the first of concurrent cancellations changes the counters
+        result = db.session.execute(db.update(Ticket)
+                .where(Ticket.ticketId == self.ticketId,
+                    Ticket.isCancelled == False)
+                .values(isCancelled = True, lastUpdated = datetime.utcnow())
+                .execution_options(synchronize_session = False))
+
+        if result.rowcount != 1:
+            db.session.rollback()
+            return Status(Code.FAILURE, "Ticket is already cancelled", self)
+
+        remaining = db.session.scalar(db.select(db.exists()
+            .where(Ticket.userId == self.userId,
+                Ticket.raffleId == self.raffleId,
+                Ticket.isCancelled == False)))
+
+        db.session.execute(db.update(Raffle)
+                .where(Raffle.raffleId == self.raffleId)
+                .values(ticketsSold = Raffle.ticketsSold - 1,
+                    ticketsCancelled = Raffle.ticketsCancelled + 1,
+                    revenue = Raffle.revenue - Raffle.price,
+                    participantsCount = Raffle.participantsCount -
+                    (0 if remaining else 1))
+                .execution_options(synchronize_session = False))
+        db.session.commit()
 
+        # Stop the signed code of the ticket from passing check-in
+        Ticket.getRevocations().add(self.ticketId)
 
-    def getDetails(self):
-        """Retrieves ticket details"""
-        return {
-                "selfId": self.ticketId,
-                "raffleId": self.raffleId,
-                "isWinningTicket": self.hasWon(),
-                "dateCreated": self.dateCreated,
-                "lastUpdated": self.lastUpdated,
-                "uniqueNumber": self.uniqueNumber,
-                "isCancelled": self.isCancelled,
-                "userId": self.userId,
-                "validateTicketUrl": url_for("administration.validate_ticket",
-                    ticket_id = self.ticketId, _external = True),
-                "cancelTicketUrl": url_for("administration.cancel_ticket",
-                    ticket_id = self.ticketId, _external = True),
-                "url": url_for("administration.get_ticket",
-                    ticket_id = self.ticketId, _external = True),
+        return Status(Code.SUCCESS, "Ticket cancelled successfully", self)
+
+
+    @staticmethod
+    def getCodeKey():
+        """Retrieves the key used to sign ticket codes"""
+        return hashlib.sha256(b"tickets.code:" +
+                flask.current_app.config["SECRET_KEY"].encode("utf-8")).digest()
+
+
+    @staticmethod
+    def getRevocations():
+        """Retrieves the revocation set of cancelled tickets of this worker"""
+        app = flask.current_app
+        revocations = app.extensions.get("ticket_revocations")
+        if revocations is None:
+            revocations = app.extensions.setdefault("ticket_revocations",
+                    RevocationSet(app.config["TICKET_REVOCATION_REFRESH"],
+                        app.config["TICKET_REVOCATION_OVERLAP"]))
+
+        return revocations
+
+
+    def getCode(self):
+        """Retrieves the signed check-in code of the ticket"""
+        issued_at = int(self.dateCreated.replace(tzinfo = timezone.utc)
+                .timestamp())
+        return sign_ticket_code(Ticket.getCodeKey(), self.ticketId,
+                self.raffleId, self.uniqueNumber, issued_at)
+
+
+    @staticmethod
+    def verifyCode(code):
+        """
+        Verifies a signed ticket code without loading the ticket, checking
+        only the signature and the in-memory revocation set
+        Returns a Status whose info holds the decoded ticket fields
+        """
+        fields = verify_ticket_code(Ticket.getCodeKey(), code or "")
+        if fields is None:
+            return Status(Code.FAILURE, "Ticket code is invalid")
+
+        ticket_id, raffle_id, unique_number, issued_at = fields
+        info = {
+                "ticketId": ticket_id,
+                "raffleId": raffle_id,
+                "uniqueNumber": unique_number,
+                "issuedAt": datetime.fromtimestamp(issued_at, timezone.utc)
+                .replace(tzinfo = None),
                 }
 
+        if ticket_id in Ticket.getRevocations():
+            return Status(Code.FORBIDDEN, "Ticket is cancelled", info)
+
+        return Status(Code.SUCCESS, "Ticket is valid", info)
+
+
+    @staticmethod
+    def getValidator(ticket_id = None, raffle_id = None):
+        """Retrieves a validator for conditional requests of tickets"""
+        tickets = Ticket.query
+        if ticket_id is not None:
+            tickets = tickets.filter(Ticket.ticketId == ticket_id)
+        if raffle_id is not None:
+            tickets = tickets.filter(Ticket.raffleId == raffle_id)
+
+        return Validator((tickets, Ticket.lastUpdated))
+
+
+    def getDetails(self, fields = None):
+        """Retrieves ticket details"""
+        details = select_fields(fields, {
+                "selfId": lambda: self.ticketId,
+                "raffleId": lambda: self.raffleId,
+                "isWinningTicket": lambda: self.hasWon(),
+                "dateCreated": lambda: self.dateCreated,
+                "lastUpdated": lambda: self.lastUpdated,
+                "uniqueNumber": lambda: self.uniqueNumber,
+                "isCancelled": lambda: self.isCancelled,
+                "userId": lambda: self.userId,
+                "ticketCode": lambda: self.getCode(),
+                })
+        details.update(links.build(self, fields))
+
+        return details
+
 
     def isValid(self):
         """Checks if the ticket is valid"""
-        pass
+        return not self.isCancelled and \
+                self.ticketId not in Ticket.getRevocations()
 
 
     def hasWon(self):
         """Checks if a ticket has won"""
-        return ticket.isWinningTicket
+        return bool(self.isWinningTicket)
 
 
     def declareWon(self):
         """Declares a ticket as won"""
-        pass
+        self.isWinningTicket = True
+        db.session.add(self)
+        return self
+
+
+
+# Ticket numbers are 10 digit numbers starting at 1000000000, which keeps
+# them clear of the 8 digit random numbers issued before the allocator
+TICKET_NUMBER_OFFSET = 10 ** 9
+TICKET_NUMBER_DOMAIN = 10 ** 9
+
+
+class Sequence(db.Model):
+    """Represents a named counter handing out blocks of unique values"""
+    __tablename__ = 'sequences'
+
+    name = db.Column(db.String(64), primary_key=True)
+    nextValue = db.Column(db.Integer, nullable=False, default=0)
+
+
+    def __repr__(self):
+        """Retrieves a string representation of the Sequence object"""
+        return f"<Sequence(name={self.name}, nextValue={self.nextValue})>"
+
+
+    @staticmethod
+    def reserveBlock(name, size):
+        """
+        Reserves the next block of values of a sequence in its own short
+        transaction, so the block stays reserved even if the caller's
+        transaction is rolled back
+        Returns the first value of the block
+        """
+        table = Sequence.__table__
+        for attempt in range(2):
+            try:
+                with db.engine.begin() as connection:
+                    updated = connection.execute(table.update()
+                            .where(table.c.name == name)
+                            .values(nextValue = table.c.nextValue + size))
+
+                    if updated.rowcount == 0:
+                        connection.execute(table.insert()
+                                .values(name = name, nextValue = size))
+                        return 0
+
+                    return connection.execute(db.select(table.c.nextValue)
+                            .where(table.c.name == name)).scalar() - size
+
+            except db.exc.IntegrityError:
+                # Another worker created the sequence first
+                if attempt:
+                    raise
+
+
+class BlockAllocator(object):
+    """
+    Hands out unique values from blocks reserved on a Sequence, so only one
+    database round trip is needed per block instead of per value
+    """
+
+    def __init__(self, name, block_size = 1000):
+        self.name = name
+        self.blockSize = block_size
+        self.nextValue = 0
+        self.endValue = 0
+        self.lock = threading.Lock()
+
+
+    def allocate(self, count = 1):
+        """Retrieves the next unique values of the sequence"""
+        values = []
+        with self.lock:
+            while len(values) < count:
+                if self.nextValue >= self.endValue:
+                    size = max(self.blockSize, count - len(values))
+                    self.nextValue = Sequence.reserveBlock(self.name, size)
+                    self.endValue = self.nextValue + size
+
+                taken = min(count - len(values), self.endValue - self.nextValue)
+                values.extend(range(self.nextValue, self.nextValue + taken))
+                self.nextValue += taken
+
+        return values
+
+
+class RevocationSet(object):
+    """
+    Keeps the IDs of cancelled tickets in memory so signed ticket codes can be
+    checked without a database lookup. Cancellations in this worker are added
+    immediately, and cancellations made by other workers are picked up by a
+    periodic incremental reload. Each reload reaches back an overlap margin
+    before the newest time seen, so cancellations committed late with an
+    earlier lastUpdated are still loaded
+    """
+
+    def __init__(self, refresh_interval = 30, overlap = 300):
+        self.refreshInterval = refresh_interval
+        self.overlap = timedelta(seconds = overlap)
+        self.ticketIds = set()
+        self.loadedUntil = None
+        self.refreshedAt = None
+        self.lock = threading.Lock()
 
 
+    def add(self, ticket_id):
+        """Revokes a ticket"""
+        with self.lock:
+            self.ticketIds.add(ticket_id)
+
+
+    def __contains__(self, ticket_id):
+        """Checks if a ticket is revoked"""
+        if self.refreshedAt is None or \
+                time.monotonic() - self.refreshedAt >= self.refreshInterval:
+            self.refresh()
+
+        return ticket_id in self.ticketIds
+
+
+    def refresh(self):
+        """Loads tickets cancelled since the last refresh"""
+        with self.lock:
+            query = db.select(Ticket.ticketId, Ticket.lastUpdated)\
+                    .where(Ticket.isCancelled == True)
+            if self.loadedUntil is not None:
+                query = query.where(Ticket.lastUpdated >=
+                        self.loadedUntil - self.overlap)
+
+            for ticket_id, last_updated in db.session.execute(query):
+                self.ticketIds.add(ticket_id)
+                if last_updated and (self.loadedUntil is None or
+                        last_updated > self.loadedUntil):
+                    self.loadedUntil = last_updated
+
+            self.refreshedAt = time.monotonic()
+
 
 class Notification(db.Model):
     """Represents a notification in the system"""
     __tablename__ = 'notifications'
+    __links__ = {
+            "userUrl": ("administration.get_user",
+                {"user_id": "userId"}),
+            "url": ("administration.get_notification",
+                {"notification_id": "notificationId"}),
+            }
+    __fields__ = {
+            "notificationId": ("notificationId",),
+            "name": ("name",),
+            "payloadJSON": ("payloadJSON",),
+            "dateCreated": ("dateCreated",),
+            "lastUpdated": ("lastUpdated",),
+            "userId": ("userId",),
+            }
 
     notificationId = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(64), nullable=False)
@@ -1102,20 +2510,76 @@ class Notification(db.Model):
         return notification
 
 
-    def getDetails(self):
+    @staticmethod
+    def fanOut(name, payload, raffle_id = None, user_ids = None,
+            chunk_size = 1000):
+        """
+        Notifies the participants of a raffle, or the users selected by a
+        query of user IDs, replacing their earlier notifications of the same
+        name. Recipients are walked in chunks of user IDs, each with one
+        DELETE, one executemany INSERT and one commit, and the payload is
+        encoded once
+        Returns the number of users notified
+        """
+        if user_ids is None:
+            user_ids = db.select(Ticket.userId).where(
+                    Ticket.raffleId == raffle_id, Ticket.isCancelled == False)
+
+        recipients = user_ids.subquery()
+        user_id = recipients.c[0]
+        payload_json = flask.json.dumps(payload)
+
+        notified = 0
+        last_id = None
+        while True:
+            chunk = db.select(user_id).distinct().where(user_id.isnot(None))
+            if last_id is not None:
+                chunk = chunk.where(user_id > last_id)
+
+            chunk_ids = db.session.scalars(chunk.order_by(user_id)
+                    .limit(chunk_size)).all()
+            if not chunk_ids:
+                break
+
+            db.session.execute(db.delete(Notification)
+                    .where(Notification.name == name,
+                        Notification.userId.in_(chunk_ids))
+                    .execution_options(synchronize_session = False))
+            db.session.execute(db.insert(Notification), [{"name": name,
+                "userId": chunk_id, "payloadJSON": payload_json}
+                for chunk_id in chunk_ids])
+            db.session.commit()
+
+            notified += len(chunk_ids)
+            last_id = chunk_ids[-1]
+
+        return notified
+
+
+    @staticmethod
+    def getValidator(notification_id = None):
+        """Retrieves a validator for conditional requests of notifications"""
+        notifications = Notification.query
+        if notification_id is not None:
+            notifications = notifications.filter(
+                    Notification.notificationId == notification_id)
+
+        return Validator((notifications, Notification.lastUpdated))
+
+
+    def getDetails(self, fields = None):
         """Retrieves notification details"""
-        return {
-                "notificationId": self.notificationId,
-                "name": self.name,
-                "payloadJSON": self.payloadJSON,
-                "dateCreated": self.dateCreated,
-                "lastUpdated": self.lastUpdated,
-                "userId": self.userId,
-                "userUrl": url_for("administration.get_user", 
-                    user_id = self.userId, _external = True),
-                "url": url_for("administration.get_notification", 
-                    notification_id = self.notificationId, _external = True)
-                }
+        details = select_fields(fields, {
+                "notificationId": lambda: self.notificationId,
+                "name": lambda: self.name,
+                "payloadJSON": lambda: self.payloadJSON,
+                "dateCreated": lambda: self.dateCreated,
+                "lastUpdated": lambda: self.lastUpdated,
+                "userId": lambda: self.userId,
+                })
+        details.update(links.build(self, fields))
+
+        return details
 
 
     def getContent(self):
@@ -1177,23 +2641,75 @@ class Task(db.Model):
 
 class Category(db.Model):
     __tablename__ = 'categories'
+    __links__ = {
+            "deleteCategoryUrl": ("administration.delete_category",
+                {"category_id": "categoryId"}),
+            "updateCategoryUrl": ("administration.update_category",
+                {"category_id": "categoryId"}),
+            "url": ("administration.get_category",
+                {"category_id": "categoryId"}),
+            "booksUrl": ("administration.get_category_books",
+                {"category_id": "categoryId"}),
+            }
+    __fields__ = {
+            "categoryId": ("categoryId",),
+            "name": ("name",),
+            "description": ("description",),
+            "booksCount": (),
+            }
 
     categoryId = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(50))
     description = db.Column(db.Text)
+    lastUpdated = db.Column(db.DateTime, default=datetime.utcnow,
+            onupdate=datetime.utcnow)
+
+    books = db.relationship('Book', secondary = 'category_book',
+            back_populates = 'categories', order_by = 'Book.bookId')
 
 
     def __repr__(self):
         """Retrieves a string representation of the Category object"""
         return f"<Category(categoryId={self.categoryId}, name={self.name})>"
-   
 
-    @property
-    def books(self):
-        """Retrieves all books belonging to this category"""
-        books = Book.query.join(CategoryBook, CategoryBook.bookId == Book.bookId)\
-                .join(Category, Category.categoryId == self.categoryId).all()
-        return books
+
+    @staticmethod
+    def getBooksCounts(category_ids):
+        """Retrieves book counts for multiple categories with one grouped query"""
+        return get_link_counts(CategoryBook.categoryId, category_ids)
+
+
+    @staticmethod
+    def getValidator(category_id = None):
+        """
+        Retrieves a validator for conditional requests of categories, covering
+        the book links they count
+        """
+        categories, books = Category.query, CategoryBook.query
+        if category_id is not None:
+            categories = categories.filter(Category.categoryId == category_id)
+            books = books.filter(CategoryBook.categoryId == category_id)
+
+        return Validator((categories, Category.lastUpdated),
+                (books, CategoryBook.categoryBookId))
+
+
+    @staticmethod
+    def getBulkDetails(categories, fields = None):
+        """Retrieve details of multiple categories without per-category queries"""
+        categories_by_id = {category.categoryId: category
+                for category in categories}
+
+        def load(category_ids):
+            counts = Category.getBooksCounts(category_ids) \
+                    if wants(fields, "booksCount") else {}
+            return {category_id: categories_by_id[category_id].getDetails(
+                counts.get(category_id, 0), fields)
+                for category_id in category_ids}
+
+        details = cache.get_many("Category", list(categories_by_id), load,
+                fields)
+        return [details[category.categoryId] for category in categories]
 
 
     @staticmethod
@@ -1226,28 +2742,30 @@ class Category(db.Model):
         return self
 
 
-    def getDetails(self):
+    def getDetails(self, books_count = None, fields = None):
         """Retrieve details of the Category"""
-        return {
-                "categoryId": self.categoryId,
-                "name": self.name,
-                "description": self.description,
-                "booksCount": len(self.books),
-                "deleteCategoryUrl": url_for("administration.delete_category",
-                    category_id = self.categoryId, _external = True),
-                "updateCategoryUrl": url_for("administration.update_category",
-                    category_id = self.categoryId, _external = True),
-                "url": url_for("administration.get_category", 
-                    category_id = self.categoryId, _external = True),
-                "booksUrl": url_for("administration.get_category_books", 
-                    category_id = self.categoryId, _external = True),
-                }
+        if books_count is None:
+            return Category.getBulkDetails([self], fields)[0]
+
+        details = select_fields(fields, {
+                "categoryId": lambda: self.categoryId,
+                "name": lambda: self.name,
+                "description": lambda: self.description,
+                "booksCount": lambda: books_count,
+                })
+        details.update(links.build(self, fields))
+
+        return details
 
 
 # Association Tables
 class AuthorBook(db.Model):
-    """Represents a relationship between a category and a book in the system"""
-    __table_name_ = 'author_book',
+    """Represents a relationship between an author and a book in the system"""
+    __tablename__ = 'author_book'
+    __table_args__ = (
+            db.Index('ix_author_book_bookId_authorId', 'bookId', 'authorId'),
+            db.Index('ix_author_book_authorId_bookId', 'authorId', 'bookId'),
+            )
 
     authorBookId = db.Column(db.Integer, primary_key=True, autoincrement=True)
     authorId = db.Column(db.Integer, db.ForeignKey('authors.authorId'))
@@ -1261,6 +2779,12 @@ class AuthorBook(db.Model):
 class CategoryBook(db.Model):
     """Represents a relationship between a category and a book in the system"""
     __tablename__ = 'category_book'
+    __table_args__ = (
+            db.Index('ix_category_book_bookId_categoryId', 'bookId',
+                'categoryId'),
+            db.Index('ix_category_book_categoryId_bookId', 'categoryId',
+                'bookId'),
+            )
 
     categoryBookId = db.Column(db.Integer, primary_key=True, autoincrement=True)
     categoryId = db.Column(db.Integer, db.ForeignKey('categories.categoryId'))
@@ -1269,3 +2793,37 @@ class CategoryBook(db.Model):
 
     def __repr__(self):
         return f"<CategoryBook(categoryBookId={self.categoryBookId})>"
+
+
+def get_link_counts(column, ids):
+    """Counts association rows per ID of one side of a many-to-many link"""
+    counts = {id: 0 for id in ids}
+    if counts:
+        counts.update(db.session.execute(db.select(column, db.func.count())
+            .where(column.in_(counts)).group_by(column)).all())
+
+    return counts
+
+
+# Invalidate cached details when their rows, counts or links change
+cache.register(Book)
+cache.register(Author)
+cache.register(Category)
+cache.register(Role)
+cache.register(User, roleId = Role)
+cache.register(AuthorBook, bookId = Book, authorId = Author)
+cache.register(CategoryBook, bookId = Book, categoryId = Category)
+db.event.listen(db.session, "after_flush", cache.after_flush)
+db.event.listen(db.session, "after_commit", cache.after_commit)
+db.event.listen(db.session, "after_rollback", cache.after_rollback)
+db.event.listen(db.session, "do_orm_execute", cache.do_orm_execute)
+db.event.listen(Role, "before_update", Role.before_update)
+db.event.listen(Role, "after_insert", Role.after_change)
+db.event.listen(Role, "after_update", Role.after_change)
+db.event.listen(Role, "after_delete", Role.after_change)
+presence.register(User.saveLastSeen)
+
+# Keep full-text indexes in sync with their tables
+db.event.listen(db.session, "after_flush", SearchableMixin.after_flush)
+db.event.listen(Book.__table__, "after_create", SearchableMixin.after_create)
+db.event.listen(Book.__table__, "before_drop", SearchableMixin.before_drop)
@@ -0,0 +1,134 @@
+import time
+import logging
+import threading
+from datetime import datetime
+from collections import OrderedDict
+import flask
+
+
+class LastSeenBuffer(object):
+    """
+    Last-seen times waiting to be written, and when each user's was last
+    taken for writing. Users written within the interval are skipped, and
+    the least recently written users are forgotten once the buffer is full
+    """
+
+    def __init__(self, interval, flush_interval, max_pending = 1000,
+            max_users = 100000):
+        self.interval = interval
+        self.flushInterval = flush_interval
+        self.maxPending = max_pending
+        self.maxUsers = max_users
+        self.pending = {}
+        self.written = OrderedDict()
+        self.flushedAt = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def record(self, user_id, seen, now):
+        """
+        Buffers the last-seen time of a user unless one was taken within the
+        interval
+        Returns True when the buffer is due to be flushed
+        """
+        with self.lock:
+            written = self.written.get(user_id)
+            if written is None or now - written >= self.interval:
+                self.written[user_id] = now
+                self.written.move_to_end(user_id)
+                self.pending[user_id] = seen
+
+                while len(self.written) > self.maxUsers:
+                    self.written.popitem(last = False)
+
+            return bool(self.pending) and (len(self.pending) >= self.maxPending
+                    or now - self.flushedAt >= self.flushInterval)
+
+
+    def take(self, now):
+        """Retrieves and clears the buffered last-seen times"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushedAt = now
+            return pending
+
+
+    def restore(self, pending):
+        """Buffers last-seen times again after a failed write"""
+        with self.lock:
+            for user_id, seen in pending.items():
+                if user_id not in self.pending or self.pending[user_id] < seen:
+                    self.pending[user_id] = seen
+
+
+class PresenceTracker(object):
+    """
+    Coalesces last-seen updates of users. Times are recorded in memory and
+    written as one batched UPDATE every flush interval, at most once per
+    user per interval, so tracking presence on every request does not turn
+    reads into writes. Times buffered when a worker stops are lost
+    """
+
+    def __init__(self, app = None):
+        self.writer = None
+        if app is not None:
+            self.init_app(app)
+
+
+    def init_app(self, app):
+        """Creates the last-seen buffer of an application"""
+        app.config.setdefault("LAST_SEEN_ENABLED", True)
+        app.config.setdefault("LAST_SEEN_INTERVAL", 300)
+        app.config.setdefault("LAST_SEEN_FLUSH_INTERVAL", 30)
+        app.config.setdefault("LAST_SEEN_MAX_PENDING", 1000)
+        app.config.setdefault("LAST_SEEN_MAX_USERS", 100000)
+
+        app.extensions["presence"] = LastSeenBuffer(
+                app.config["LAST_SEEN_INTERVAL"],
+                app.config["LAST_SEEN_FLUSH_INTERVAL"],
+                app.config["LAST_SEEN_MAX_PENDING"],
+                app.config["LAST_SEEN_MAX_USERS"])
+
+
+    def register(self, writer):
+        """Sets the function writing a dict of last-seen times by user ID"""
+        self.writer = writer
+
+
+    @property
+    def buffer(self):
+        """Retrieves the last-seen buffer of the current application"""
+        if not flask.has_app_context():
+            return None
+
+        return flask.current_app.extensions.get("presence")
+
+
+    def record(self, user_id, seen = None):
+        """Records that a user was seen, flushing the buffer when it is due"""
+        buffer = self.buffer
+        if buffer is None or user_id is None or \
+                not flask.current_app.config["LAST_SEEN_ENABLED"]:
+            return
+
+        if buffer.record(user_id, seen or datetime.utcnow(), time.monotonic()):
+            self.flush()
+
+
+    def flush(self):
+        """Writes the buffered last-seen times"""
+        buffer = self.buffer
+        if buffer is None or self.writer is None:
+            return
+
+        pending = buffer.take(time.monotonic())
+        if not pending:
+            return
+
+        try:
+            self.writer(pending)
+
+        except Exception as e:
+            # Keep the times for the next flush rather than failing a request
+            logging.error(f"Error writing last-seen times: {str(e)}")
+            buffer.restore(pending)
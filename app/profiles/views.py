@@ -14,7 +14,7 @@ def get_user_details(user_id):
     logging.info(f"User with ID {current_user.userId} requested details for user with ID {user_id}")
 
     # Checking if the current user has permission to view user details
-    if current_user.can(Permission.VISIT):
+    if not current_user.can(Permission.VISIT):
         logging.warning(f"Unauthorized attempt by user with ID {current_user.userId} to view user details for user with ID {user_id}")
         return flask.jsonify({"error": "Unauthorized"}), 403
 
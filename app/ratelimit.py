@@ -0,0 +1,189 @@
+import math
+import time
+import threading
+from functools import wraps
+from collections import OrderedDict
+import flask
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class WindowStore(object):
+    """
+    Compact in-process store of sliding window counters. Each key keeps only
+    the index of its current fixed window and the counts of that window and
+    the previous one, and the least recently used keys are dropped once the
+    store is full
+    """
+
+    def __init__(self, max_keys = 100000):
+        self.maxKeys = max_keys
+        self.windows = OrderedDict()
+        self.lock = threading.Lock()
+
+
+    def hit(self, key, period, now):
+        """
+        Counts a hit on a key and retrieves the counts of the current and
+        previous windows of the given period
+        """
+        index = int(now // period)
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None:
+                window = self.windows[key] = [index, 0, 0]
+            else:
+                self.windows.move_to_end(key)
+
+            if window[0] != index:
+                window[2] = window[1] if window[0] == index - 1 else 0
+                window[0], window[1] = index, 0
+
+            window[1] += 1
+            current, previous = window[1], window[2]
+
+            while len(self.windows) > self.maxKeys:
+                self.windows.popitem(last = False)
+
+        return current, previous
+
+
+    def clear(self):
+        """Removes every counter"""
+        with self.lock:
+            self.windows.clear()
+
+
+class SharedWindowStoreStandIn(WindowStore):
+    """
+    Local stand-in for the shared store, used in development and tests where
+    no shared server is available
+    """
+    pass
+
+
+class RedisWindowStore(object):
+    """Shared store of sliding window counters kept in Redis"""
+
+    def __init__(self, url, prefix = "obrs:ratelimit:"):
+        if redis is None:
+            raise RuntimeError("The redis package is required for a shared "
+                    "rate limit store")
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+
+    def hit(self, key, period, now):
+        """
+        Counts a hit on a key and retrieves the counts of the current and
+        previous windows of the given period
+        """
+        index = int(now // period)
+        current_key = f"{self.prefix}{key}:{index}"
+
+        pipeline = self.client.pipeline()
+        pipeline.incr(current_key)
+        pipeline.expire(current_key, 2 * period)
+        pipeline.get(f"{self.prefix}{key}:{index - 1}")
+        current, expired, previous = pipeline.execute()
+
+        return current, int(previous or 0)
+
+
+    def clear(self):
+        """Removes every counter"""
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+
+def get_address():
+    """Retrieves the address of the client"""
+    return flask.request.remote_addr or "unknown"
+
+
+def get_field(name):
+    """Retrieves a normalized field of the JSON body of the request"""
+    data = flask.request.get_json(silent = True)
+    value = data.get(name) if isinstance(data, dict) else None
+    return str(value).strip().lower() if value is not None else None
+
+
+class RateLimiter(object):
+    """
+    Sliding window rate limiter. Rules name limits of (hits, seconds) per
+    client address ("ip") or per field of the JSON body, and views opt in
+    with the limit decorator, which answers 429 before the view runs. The
+    count of a window is estimated from the current fixed window and the
+    overlapping share of the previous one
+    """
+
+    def __init__(self, app = None):
+        if app is not None:
+            self.init_app(app)
+
+
+    def init_app(self, app):
+        """Creates the counter store of an application"""
+        app.config.setdefault("RATELIMIT_ENABLED", True)
+        app.config.setdefault("RATELIMIT_RULES", {})
+        app.config.setdefault("RATELIMIT_MAX_KEYS", 100000)
+        app.config.setdefault("RATELIMIT_SHARED_URL", None)
+
+        url = app.config["RATELIMIT_SHARED_URL"]
+        if url == "local":
+            store = SharedWindowStoreStandIn(app.config["RATELIMIT_MAX_KEYS"])
+        elif url:
+            store = RedisWindowStore(url)
+        else:
+            store = WindowStore(app.config["RATELIMIT_MAX_KEYS"])
+
+        app.extensions["ratelimit"] = store
+
+
+    @property
+    def store(self):
+        """Retrieves the counter store of the current application"""
+        return flask.current_app.extensions["ratelimit"]
+
+
+    def check(self, rule):
+        """
+        Counts a request against the limits of a rule
+        Returns the seconds to wait when a limit is exceeded, or None
+        """
+        now = time.time()
+        for name, (limit, period) in \
+                flask.current_app.config["RATELIMIT_RULES"].get(rule, {}).items():
+            value = get_address() if name == "ip" else get_field(name)
+            if value is None:
+                continue
+
+            current, previous = self.store.hit(f"{rule}:{name}:{value}",
+                    period, now)
+            elapsed = (now % period) / period
+            if current + previous * (1 - elapsed) > limit:
+                return max(1, math.ceil(period - now % period))
+
+        return None
+
+
+    def limit(self, rule):
+        """Decorates a view with the limits of a rule"""
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if flask.current_app.config["RATELIMIT_ENABLED"]:
+                    retry_after = self.check(rule)
+                    if retry_after is not None:
+                        response = flask.jsonify(
+                                {"error": "Too many requests"})
+                        response.headers["Retry-After"] = str(retry_after)
+                        return response, 429
+
+                return f(*args, **kwargs)
+            return decorated_function
+        return decorator
@@ -1,9 +1,14 @@
 import logging
 from flask import Blueprint, request, jsonify
+from sqlalchemy.exc import IntegrityError
 from app.models import db, User
+from app.hashing import HashingBusy
+from utilities.contacts import normalize_email
+from app import limiter
 from . import registration
 
 @registration.route('/register', methods = ['POST'])
+@limiter.limit("register")
 def register_user():
     data = request.json
 
@@ -14,17 +19,37 @@ def register_user():
         logging.error("Required fields are missing")
         return jsonify({"error": "Missing required fields"}), 400
 
-    # Check if the email address is already registered
-    if User.query.filter_by(emailAddress = data.get('emailAddress')).first():
-        logging.error("Email address provided is already registered")
-        return jsonify({"error": "Email address is already registered"}), 400
+    # Add user to the database, relying on the unique indexes of the email
+    # address and phone number to reject duplicates in the same round trip
+    try:
+        user = User.register(details = data)
 
-    # Check if the phone number is already registered
-    if User.query.filter_by(phoneNumber = data.get('phoneNumber')).first():
-        logging.error("Phone number provided is already registered")
-        return jsonify({"error": "Phone number is already registered"}), 400
+    except HashingBusy:
+        # Log that the password could not be hashed in time
+        logging.warning("Registration rejected, hashing is saturated")
+        return jsonify({"error": "Service busy, try again later"}), 503
 
-    # Add user to the database
-    if User.register(details = data):
+    except IntegrityError as e:
+        db.session.rollback()
+
+        # The database reports one violated index, so an email address
+        # taken as well is looked up to keep it reported first
+        field = User.getDuplicateField(e)
+        if field == "phoneNumber" and User.query.filter_by(
+                emailAddress = normalize_email(data.get("emailAddress"))).first():
+            field = "emailAddress"
+
+        if field == "emailAddress":
+            logging.error("Email address provided is already registered")
+            return jsonify({"error": "Email address is already registered"}), 400
+
+        if field == "phoneNumber":
+            logging.error("Phone number provided is already registered")
+            return jsonify({"error": "Phone number is already registered"}), 400
+
+        logging.error(f"Registration failed: {str(e)}")
+        return jsonify({"error": "Invalid registration details"}), 400
+
+    if user:
         logging.info(f"User with email address {data.get('emailAddress')} registered successfully")
         return jsonify({"message": "User registered successfully"}), 201
@@ -0,0 +1,134 @@
+import re
+import html
+from sqlalchemy import text
+from . import db
+
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+SNIPPET_ELLIPSIS = "..."
+SNIPPET_TOKENS = 12
+
+# Control characters never found in indexed text, marking matches until the
+# text around them is escaped
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+INDEX_TABLE = re.compile(r"\w+_fts(_(data|idx|content|docsize|config))?")
+
+
+def is_supported(connection = None):
+    """Checks whether the database supports the full-text index"""
+    dialect = connection.dialect if connection is not None else \
+            db.engine.dialect
+    return dialect.name == "sqlite"
+
+
+def index_name(model):
+    """Returns the name of the full-text index of a searchable model"""
+    return f"{model.__tablename__}_fts"
+
+
+def is_index_table(name):
+    """Checks whether a table belongs to a full-text index"""
+    return INDEX_TABLE.fullmatch(name) is not None
+
+
+def primary_key(model):
+    """Returns the primary key column of a searchable model"""
+    return model.__mapper__.primary_key[0]
+
+
+def create_index(connection, model):
+    """Creates the full-text index of a searchable model"""
+    columns = ", ".join(model.__searchable__)
+    connection.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS "
+        f"{index_name(model)} USING fts5({columns}, tokenize = 'unicode61 "
+        f"remove_diacritics 2')"))
+
+
+def drop_index(connection, model):
+    """Drops the full-text index of a searchable model"""
+    connection.execute(text(f"DROP TABLE IF EXISTS {index_name(model)}"))
+
+
+def add_to_index(connection, instance):
+    """Adds or replaces the index entry of a model instance"""
+    model = type(instance)
+    columns = ", ".join(model.__searchable__)
+    values = ", ".join(f":{field}" for field in model.__searchable__)
+
+    parameters = {field: _stringify(getattr(instance, field))
+            for field in model.__searchable__}
+    parameters["rowid"] = getattr(instance, primary_key(model).key)
+
+    connection.execute(text(f"INSERT OR REPLACE INTO {index_name(model)} "
+        f"(rowid, {columns}) VALUES (:rowid, {values})"), parameters)
+
+
+def remove_from_index(connection, model, id):
+    """Removes the index entry of a model instance"""
+    connection.execute(text(f"DELETE FROM {index_name(model)} "
+        f"WHERE rowid = :rowid"), {"rowid": id})
+
+
+def rebuild_index(connection, model):
+    """Repopulates the full-text index of a model from its table"""
+    columns = ", ".join(model.__searchable__)
+    connection.execute(text(f"DELETE FROM {index_name(model)}"))
+    connection.execute(text(f"INSERT INTO {index_name(model)} "
+        f"(rowid, {columns}) SELECT {primary_key(model).name}, {columns} "
+        f"FROM {model.__tablename__}"))
+
+
+def build_match_expression(query):
+    """
+    Converts free text into an FTS5 match expression, quoting every term and
+    treating the last one as a prefix so that results update as users type
+    Returns None when the query contains no searchable terms
+    """
+    terms = re.findall(r"\w+", query or "")
+    if not terms:
+        return None
+
+    terms = ['"' + term + '"' for term in terms]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def query_index(model, query, offset = 0, limit = 20, weights = None):
+    """
+    Searches the full-text index of a model
+    Returns a list of (id, snippet) tuples ordered by BM25 rank, where the
+    snippets are escaped HTML with the matches marked
+    """
+    expression = build_match_expression(query)
+    if expression is None:
+        return []
+
+    index = index_name(model)
+    weights = weights or [1.0] * len(model.__searchable__)
+    rank = f"bm25({index}, {', '.join(str(float(w)) for w in weights)})"
+
+    rows = db.session.execute(text(f"SELECT rowid, snippet({index}, -1, "
+        f":start, :end, :ellipsis, :tokens) FROM {index} WHERE {index} "
+        f"MATCH :expression ORDER BY {rank} LIMIT :limit OFFSET :offset"), {
+            "start": MATCH_START,
+            "end": MATCH_END,
+            "ellipsis": SNIPPET_ELLIPSIS,
+            "tokens": SNIPPET_TOKENS,
+            "expression": expression,
+            "limit": limit,
+            "offset": offset,
+            })
+
+    return [(id, mark_snippet(snippet)) for id, snippet in rows]
+
+
+def mark_snippet(snippet):
+    """Escapes the text of a snippet and only then marks its matches"""
+    return html.escape(snippet or "").replace(MATCH_START, SNIPPET_START)\
+            .replace(MATCH_END, SNIPPET_END)
+
+
+def _stringify(value):
+    """Converts a column value into indexable text"""
+    return "" if value is None else str(value)
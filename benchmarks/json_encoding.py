@@ -0,0 +1,69 @@
+import os
+import time
+from flask.json.provider import DefaultJSONProvider
+from app import create_app, db
+from app.encoding import JSONProvider
+from app.models import Role, Book, Raffle
+
+
+def prepare(objects):
+    """Creates a fresh schema with the given number of raffles and books"""
+    db.drop_all()
+    db.create_all()
+    Role.insert_roles()
+
+    db.session.execute(db.insert(Book), [{"title": f"Book {index}",
+        "publisher": "Benchmark", "yearPublished": 2023, "edition": 1,
+        "summary": "A benchmark book " * 8} for index in range(objects)])
+    db.session.execute(db.insert(Raffle), [{"bookId": index + 1,
+        "participantLimit": 100, "price": 100, "isActive": True}
+        for index in range(objects)])
+    db.session.commit()
+
+
+def measure(provider, payload, repeat):
+    """Retrieves the best time to encode a payload in compact form"""
+    best = None
+    for attempt in range(repeat):
+        start = time.perf_counter()
+        provider.dumps(payload, separators = (",", ":"))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def run(sizes = (1000, 10000), repeat = 5):
+    """
+    Encodes raffle details, which embed book details, with Flask's default
+    JSON provider and with the application's provider
+    Returns a dictionary with the best encoding time of each provider per size
+    """
+    app = create_app('benchmark')
+    results = {}
+
+    with app.app_context():
+        for size in sizes:
+            prepare(size)
+
+            with app.test_request_context():
+                raffles = Raffle.query.order_by(Raffle.raffleId).all()
+                payload = {"raffles": [{raffle.raffleId: details}
+                    for raffle, details in
+                    zip(raffles, Raffle.getBulkDetails(raffles))]}
+
+                default = measure(DefaultJSONProvider(app), payload, repeat)
+                custom = measure(JSONProvider(app), payload, repeat)
+
+            results[f"default{size}"] = default
+            results[f"provider{size}"] = custom
+            results[f"speedup{size}"] = default / custom
+
+        db.drop_all()
+        db.engine.dispose()
+
+    database = app.config['SQLALCHEMY_DATABASE_URI']
+    if database.startswith('sqlite:///') and os.path.exists(database[10:]):
+        os.remove(database[10:])
+
+    return results
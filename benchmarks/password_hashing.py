@@ -0,0 +1,66 @@
+import os
+import time
+import threading
+from app import create_app, hasher
+
+
+def measure(app, logins, threads, password_hash):
+    """Retrieves the logins per second achieved by concurrent verifications"""
+    hasher.init_app(app)
+    barrier = threading.Barrier(threads)
+
+    def verify(worker):
+        with app.app_context():
+            barrier.wait()
+            for attempt in range(worker, logins, threads):
+                hasher.verify(password_hash, "password123")
+
+    workers = [threading.Thread(target = verify, args = (worker,))
+            for worker in range(threads)]
+
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    pool = app.extensions["hashing"]
+    if pool is not None:
+        pool.shutdown()
+
+    return logins / elapsed
+
+
+def run(logins = 200, threads = 16, workers = None):
+    """
+    Verifies passwords hashed with the configured method from concurrent
+    request threads, inline and on the process pool
+    Returns a dictionary with the logins per second and per core of each
+    """
+    app = create_app('benchmark')
+    cores = os.cpu_count() or 1
+    workers = workers or app.config["PASSWORD_HASH_WORKERS"]
+
+    with app.app_context():
+        password_hash = hasher.generate("password123")
+
+    app.config["PASSWORD_HASH_WORKERS"] = 0
+    inline = measure(app, logins, threads, password_hash)
+
+    app.config["PASSWORD_HASH_WORKERS"] = workers
+    app.config["PASSWORD_HASH_MAX_QUEUE"] = max(threads,
+            app.config["PASSWORD_HASH_MAX_QUEUE"])
+    pooled = measure(app, logins, threads, password_hash)
+
+    return {
+            "method": app.config["PASSWORD_HASH_METHOD"],
+            "cores": cores,
+            "workers": workers,
+            "logins": logins,
+            "threads": threads,
+            "inlineLoginsPerSecond": inline,
+            "inlineLoginsPerSecondPerCore": inline / cores,
+            "pooledLoginsPerSecond": pooled,
+            "pooledLoginsPerSecondPerCore": pooled / cores,
+            }
@@ -0,0 +1,79 @@
+import os
+import time
+import tracemalloc
+from app import create_app, db
+from app.models import Role, Book, Raffle, Ticket
+
+
+def prepare(tickets, chunk_size = 10000):
+    """Creates a fresh schema with one raffle holding the given tickets"""
+    db.drop_all()
+    db.create_all()
+    Role.insert_roles()
+
+    book = Book(title = "Benchmark", publisher = "Benchmark",
+            yearPublished = 2023, edition = 1)
+    db.session.add(book)
+    db.session.commit()
+
+    raffle = Raffle(participantLimit = tickets, bookId = book.bookId,
+            price = 100, isActive = True)
+    db.session.add(raffle)
+    db.session.commit()
+
+    for start in range(0, tickets, chunk_size):
+        db.session.execute(db.insert(Ticket), [{"raffleId": raffle.raffleId,
+            "uniqueNumber": number + 1} for number in
+            range(start, min(start + chunk_size, tickets))])
+        db.session.commit()
+
+    return raffle.raffleId
+
+
+def run(tickets = 100000, batch_size = 1000):
+    """
+    Streams a full NDJSON export of one raffle's tickets through the test
+    client. Returns a dictionary with the time to the first chunk, the total
+    time and the peak memory allocated while streaming, which should not grow
+    with the number of tickets
+    """
+    app = create_app('benchmark')
+    app.config["STREAM_BATCH_SIZE"] = batch_size
+
+    with app.app_context():
+        raffle_id = prepare(tickets)
+
+    client = app.test_client()
+    lines = 0
+    first_chunk = None
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = client.get(f"/api/administration/raffles/{raffle_id}"
+            "/tickets/export", buffered = False)
+    for chunk in response.response:
+        if first_chunk is None:
+            first_chunk = time.perf_counter() - start
+        lines += chunk.count(b"\n")
+    response.close()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    with app.app_context():
+        db.drop_all()
+        db.engine.dispose()
+
+    database = app.config['SQLALCHEMY_DATABASE_URI']
+    if database.startswith('sqlite:///') and os.path.exists(database[10:]):
+        os.remove(database[10:])
+
+    return {
+            "tickets": tickets,
+            "batchSize": batch_size,
+            "linesStreamed": lines,
+            "secondsToFirstChunk": first_chunk,
+            "seconds": elapsed,
+            "ticketsPerSecond": lines / elapsed,
+            "peakMemoryBytes": peak,
+            }
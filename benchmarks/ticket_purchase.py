@@ -0,0 +1,103 @@
+import os
+import time
+import threading
+from sqlalchemy.exc import OperationalError
+from app import create_app, db
+from app.models import Role, User, Book, Raffle, Ticket
+
+
+def prepare(participant_limit, users):
+    """Creates a fresh schema with one ongoing raffle and its buyers"""
+    db.drop_all()
+    db.create_all()
+    Role.insert_roles()
+
+    buyers = [User(firstName = "Buyer", lastName = str(index),
+        emailAddress = f"buyer{index}@example.com",
+        phoneNumber = f"07{index:08d}", passwordHash = "!")
+        for index in range(users)]
+    db.session.add_all(buyers)
+
+    book = Book(title = "Benchmark", publisher = "Benchmark",
+            yearPublished = 2023, edition = 1)
+    db.session.add(book)
+    db.session.commit()
+
+    raffle = Raffle.open({"participantLimit": participant_limit,
+        "bookId": book.bookId, "price": 100})
+    raffle.activate()
+
+    return raffle.raffleId, [buyer.userId for buyer in buyers]
+
+
+def run(attempts = 2000, threads = 32, participant_limit = 1000, users = 50):
+    """
+    Races concurrent buyers on one raffle through Ticket.create
+    Returns a dictionary with the achieved purchases per second and the number
+    of oversold tickets, which must be zero
+    """
+    app = create_app('benchmark')
+
+    with app.app_context():
+        raffle_id, user_ids = prepare(participant_limit, users)
+
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+    counts = {"purchased": 0, "rejected": 0, "errors": 0}
+
+    def buy(worker):
+        with app.app_context():
+            barrier.wait()
+            for attempt in range(worker, attempts, threads):
+                outcome = "purchased"
+                try:
+                    ticket = Ticket.create({"raffleId": raffle_id,
+                        "userId": user_ids[attempt % len(user_ids)]})
+                    if ticket is None:
+                        outcome = "rejected"
+
+                except OperationalError:
+                    db.session.rollback()
+                    outcome = "errors"
+
+                with lock:
+                    counts[outcome] += 1
+
+            db.session.remove()
+
+    workers = [threading.Thread(target = buy, args = (worker,))
+            for worker in range(threads)]
+
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        raffle = db.session.get(Raffle, raffle_id)
+        tickets = raffle.tickets.count()
+        sold = raffle.ticketsSold
+
+        db.drop_all()
+        db.engine.dispose()
+
+    database = app.config['SQLALCHEMY_DATABASE_URI']
+    if database.startswith('sqlite:///') and os.path.exists(database[10:]):
+        os.remove(database[10:])
+
+    return {
+            "attempts": attempts,
+            "threads": threads,
+            "participantLimit": participant_limit,
+            "purchased": counts["purchased"],
+            "rejected": counts["rejected"],
+            "errors": counts["errors"],
+            "ticketsInserted": tickets,
+            "ticketsSold": sold,
+            "oversold": max(0, tickets - participant_limit),
+            "counterMismatch": tickets != sold,
+            "seconds": elapsed,
+            "purchasesPerSecond": counts["purchased"] / elapsed,
+            }
@@ -22,6 +22,56 @@ class Config:
             '/app/static/images/books/')
     UPLOAD_EXTENSIONS = ['.jpg', '.gif', '.jpeg', '.png']
 
+    ITEMS_PER_PAGE = 50
+    MAX_ITEMS_PER_PAGE = 500
+    STREAM_BATCH_SIZE = 1000
+    IMPORT_BATCH_SIZE = 1000
+    JSON_SORT_KEYS = False
+
+    TICKET_NUMBER_BLOCK_SIZE = 1000
+    # Keys the permutation of ticket numbers, never change it once tickets
+    # are issued or new numbers collide with existing ones
+    TICKET_NUMBER_KEY = os.environ.get('TICKET_NUMBER_KEY') or \
+            'obrs-ticket-numbers'
+    MAX_TICKETS_PER_PURCHASE = 500
+    TICKET_REVOCATION_REFRESH = 30
+    TICKET_REVOCATION_OVERLAP = 300
+
+    CACHE_ENABLED = True
+    CACHE_MAX_ENTRIES = 10000
+    CACHE_LOCAL_TTL = 30
+    CACHE_SHARED_URL = os.environ.get('CACHE_SHARED_URL')
+    CACHE_SHARED_TTL = 300
+    IDENTITY_CACHE_MAX_ENTRIES = 10000
+    IDENTITY_CACHE_TTL = 60
+    LAST_SEEN_ENABLED = True
+    LAST_SEEN_INTERVAL = 300
+    LAST_SEEN_FLUSH_INTERVAL = 30
+
+    PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or
+            os.cpu_count() or 1)
+    PASSWORD_HASH_MAX_QUEUE = 64
+    PASSWORD_HASH_TIMEOUT = 10
+
+    RATELIMIT_ENABLED = True
+    RATELIMIT_RULES = {
+            'login': {'ip': (30, 60), 'emailAddress': (10, 300)},
+            'register': {'ip': (10, 3600)},
+            }
+    RATELIMIT_MAX_KEYS = 100000
+    RATELIMIT_SHARED_URL = os.environ.get('RATELIMIT_SHARED_URL')
+    # Reverse proxies in front of the app whose X-Forwarded-For and
+    # X-Forwarded-Proto headers are trusted, or 0 to trust none
+    PROXY_COUNT = int(os.environ.get('PROXY_COUNT') or 0)
+
+    COMPRESS_ENABLED = True
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 4
+    COMPRESS_CACHE_MAX_ENTRIES = 256
+    COMPRESS_CACHE_TTL = 300
+
     ADMINISTRATOR_EMAIL = os.environ.get('ADMINISTRATOR_EMAIL') or\
             'administrator@obrs.co.ke'
 
@@ -41,6 +91,13 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or 'sqlite://'
     WTF_CRF_ENABLED = False
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    PASSWORD_HASH_WORKERS = 0
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.environ.get('BENCHMARK_DATABASE_URL') or \
+            'sqlite:///' + os.path.join(basedir, 'data-benchmark.sqlite')
 
 
 class ProductionConfig(Config):
@@ -88,6 +145,7 @@ class UnixConfig(ProductionConfig):
 config = {
         'development' : DevelopmentConfig,
         'testing' : TestingConfig,
+        'benchmark' : BenchmarkConfig,
         'production' : ProductionConfig,
         'heroku' : HerokuConfig,
         'docker' : DockerConfig,
@@ -1,7 +1,9 @@
 from functools import wraps
 from flask import abort
 from flask_login import current_user
-from .models import Permission
+from flask_jwt_extended import (verify_jwt_in_request, get_jwt,
+        get_current_user)
+from app.models import Permission, Role
 
 
 def permission_required(permission):
@@ -17,3 +19,30 @@ def permission_required(permission):
 
 def admin_required(f):
     return permission_required(Permission.ADMIN)(f)
+
+
+def token_permission_required(permission):
+    """
+    Authorizes from the permissions claimed by the access token. Tokens
+    minted before their user moved to another role, or before the
+    permissions of their role changed, are rejected. The user and role
+    versions are checked through the identity cache
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            verify_jwt_in_request()
+            claims = get_jwt()
+            if get_current_user().roleId != claims.get("role") or \
+                    Role.getVersion(claims.get("role")) != \
+                    claims.get("roleVersion"):
+                abort(401)
+            if claims.get("perm", 0) & permission != permission:
+                abort(403)
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def token_admin_required(f):
+    return token_permission_required(Permission.ADMIN)(f)
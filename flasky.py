@@ -5,7 +5,7 @@ from dotenv import load_dotenv
 from flask_migrate import Migrate, upgrade
 
 from app import create_app, db
-from app.models import (User, Role)
+from app.models import (User, Role, Raffle, Book)
 
 
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
@@ -69,6 +69,94 @@ def profile(length, profile_dir):
     app.run()
 
 
+@app.cli.command("benchmark-purchases")
+@click.option("--attempts", default = 2000, help = "Number of purchase attempts.")
+@click.option("--threads", default = 32, help = "Number of concurrent buyers.")
+@click.option("--limit", default = 1000, help = "Participant limit of the raffle.")
+def benchmark_purchases(attempts, threads, limit):
+    """Race concurrent ticket purchases on a single raffle."""
+    from benchmarks.ticket_purchase import run
+    results = run(attempts = attempts, threads = threads,
+            participant_limit = limit)
+
+    for key, value in results.items():
+        print(f"{key}: {value}")
+
+
+@app.cli.command("benchmark-export")
+@click.option("--tickets", default = 100000, help = "Number of tickets exported.")
+@click.option("--batch-size", default = 1000, help = "Rows fetched per batch.")
+def benchmark_export(tickets, batch_size):
+    """Measure the speed and peak memory of a streamed ticket export."""
+    from benchmarks.ticket_export import run
+    results = run(tickets = tickets, batch_size = batch_size)
+
+    for key, value in results.items():
+        print(f"{key}: {value}")
+
+
+@app.cli.command("benchmark-json")
+@click.option("--repeat", default = 5, help = "Encodings timed per size.")
+def benchmark_json(repeat):
+    """Compare JSON providers on raffle details of 1k and 10k objects."""
+    from benchmarks.json_encoding import run
+    results = run(repeat = repeat)
+
+    for key, value in results.items():
+        print(f"{key}: {value}")
+
+
+@app.cli.command("benchmark-hashing")
+@click.option("--logins", default = 200, help = "Number of password checks.")
+@click.option("--threads", default = 16, help = "Number of request threads.")
+@click.option("--workers", default = 0, help = "Hashing processes, 0 for config.")
+def benchmark_hashing(logins, threads, workers):
+    """Measure password verifications per second, inline and pooled."""
+    from benchmarks.password_hashing import run
+    results = run(logins = logins, threads = threads, workers = workers)
+
+    for key, value in results.items():
+        print(f"{key}: {value}")
+
+
+@app.cli.command("import-users")
+@click.argument("path", type = click.Path(exists = True, dir_okay = False))
+@click.option("--format", "import_format", default = None,
+        type = click.Choice(["csv", "ndjson"]),
+        help = "Input format, guessed from the file extension by default.")
+@click.option("--batch-size", default = 1000,
+        help = "Number of rows hashed and inserted per batch.")
+def import_users(path, import_format, batch_size):
+    """Import users from a CSV or NDJSON file."""
+    from utilities.importing import get_import_format, read_records
+    import_format = get_import_format(import_format, path)
+    if import_format is None:
+        raise click.BadParameter("Cannot guess the format, pass --format",
+                param_hint = "path")
+
+    with open(path, "rb") as stream:
+        report = User.importMany(read_records(stream, import_format),
+                batch_size = batch_size)
+
+    details = report.getDetails()
+    for error in details.pop("errors"):
+        print(f"line {error['line']}: {error['error']}")
+
+    for key, value in details.items():
+        print(f"{key}: {value}")
+
+
+@app.cli.command("repair-counters")
+@click.option("--chunk-size", default = 500,
+        help = "Number of rows rebuilt per transaction.")
+def repair_counters(chunk_size):
+    """Rebuild denormalized raffle and book counters."""
+    raffles = Raffle.repairCounters(chunk_size = chunk_size)
+    books = Book.repairCounters(chunk_size = chunk_size)
+
+    print(f"Repaired counters of {raffles} raffles and {books} books")
+
+
 @app.cli.command()
 def deploy():
     """Run deployment tasks."""
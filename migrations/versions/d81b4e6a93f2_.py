@@ -0,0 +1,36 @@
+"""empty message
+
+Revision ID: d81b4e6a93f2
+Revises: a3c1f7e20b64
+Create Date: 2026-10-18 10:03:17.551290
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81b4e6a93f2'
+down_revision = 'a3c1f7e20b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Full-text index over Book.__searchable__ (SQLite FTS5 only)
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5("
+            "title, publisher, yearPublished, summary, edition, "
+            "tokenize = 'unicode61 remove_diacritics 2')")
+    op.execute("INSERT INTO books_fts (rowid, title, publisher, yearPublished, "
+            "summary, edition) SELECT bookId, title, publisher, yearPublished, "
+            "summary, edition FROM books")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute("DROP TABLE IF EXISTS books_fts")
@@ -1,7 +1,12 @@
 import unittest
+import contextlib
+import collections
 import flask
 from app import create_app, db
-from app.models import Role
+from app.models import Role, User
+
+Statement = collections.namedtuple("Statement",
+        ["statement", "parameters", "executemany"])
 
 class BaseTestCase(unittest.TestCase):
     def setUp(self):
@@ -18,6 +23,35 @@ class BaseTestCase(unittest.TestCase):
         self.app_context.pop()
 
 
+    def create_user(self, index):
+        user = User(
+                firstName = "User",
+                lastName = str(index),
+                emailAddress = f"user{index}@example.com",
+                phoneNumber = f"07000000{index:02d}",
+                password = "password123"
+                )
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+
+    @contextlib.contextmanager
+    def capture_statements(self, prefix = ""):
+        """Collects the statements starting with prefix run inside the block"""
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith(prefix):
+                statements.append(Statement(statement, parameters,
+                    executemany))
+
+        db.event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            db.event.remove(db.engine, "before_cursor_execute", record)
+
+
     def test_app_exists(self):
         self.assertFalse(flask.current_app is None)
 
@@ -0,0 +1,769 @@
+import io
+import json
+import hashlib
+import base64
+import flask
+from datetime import timedelta
+from sqlalchemy.exc import IntegrityError
+from flask_jwt_extended import create_access_token
+from app import db, search
+from app.cache import MISSING
+from tests import BaseTestCase
+from utilities.securities import permute_number, draw_candidates
+from app.models import (User, Role, Book, Raffle, Ticket, Notification,
+        Sequence, RevocationSet, Author, Category)
+
+
+class AdministrationTestCase(BaseTestCase):
+    def create_raffle(self, is_active = True, is_closed = False):
+        book = Book(title = "Book", publisher = "Publisher",
+                yearPublished = 2020, edition = 1)
+        db.session.add(book)
+        db.session.commit()
+
+        raffle = Raffle(participantLimit = 10, bookId = book.bookId, price = 50,
+                isActive = is_active, isClosed = is_closed)
+        db.session.add(raffle)
+        db.session.commit()
+        return raffle
+
+
+    def test_bulk_user_details_match_individual_details(self):
+        users = [self.create_user(index) for index in range(3)]
+        ongoing = self.create_raffle()
+        closed = self.create_raffle(is_active = False, is_closed = True)
+
+        db.session.add_all([
+            Ticket(raffleId = ongoing.raffleId, userId = users[0].userId,
+                uniqueNumber = 1),
+            Ticket(raffleId = closed.raffleId, userId = users[0].userId,
+                uniqueNumber = 2, isWinningTicket = True),
+            Ticket(raffleId = closed.raffleId, userId = users[1].userId,
+                uniqueNumber = 3),
+            Notification(name = "raffle_closed", userId = users[1].userId),
+            ])
+        db.session.commit()
+
+        with self.app.test_request_context():
+            details = User.getBulkDetails(users)
+
+            for user, bulk in zip(users, details):
+                self.assertEqual(bulk, user.getDetails())
+                self.assertEqual(bulk["rafflesWon"], len(user.getWonRaffles()))
+                self.assertEqual(bulk["pastRaffles"],
+                        len(user.getPastRaffles()))
+                self.assertEqual(bulk["activeRaffles"],
+                        len(user.getPendingRaffles()))
+                self.assertEqual(bulk["notifications"],
+                        user.notifications.count())
+
+        self.assertEqual(details[0]["rafflesWon"], 1)
+        self.assertEqual(details[0]["activeRaffles"], 1)
+        self.assertEqual(details[1]["pastRaffles"], 1)
+        self.assertEqual(details[2]["tasks"], 0)
+
+
+    def test_books_are_paginated_with_cursor(self):
+        for index in range(5):
+            db.session.add(Book(title = f"Book {index}", publisher = "Publisher",
+                yearPublished = 2020, edition = 1))
+        db.session.commit()
+
+        response = self.client.get("/api/administration/books?limit=2")
+        self.assertEqual(response.status_code, 200)
+        page = response.get_json()
+        self.assertEqual([list(book)[0] for book in page["books"]], ["1", "2"])
+        self.assertIsNotNone(page["next"])
+
+        seen = []
+        cursor = page["next"]
+        while cursor:
+            response = self.client.get(
+                    f"/api/administration/books?limit=2&cursor={cursor}")
+            page = response.get_json()
+            seen.extend(list(book)[0] for book in page["books"])
+            cursor = page["next"]
+
+        self.assertEqual(seen, ["3", "4", "5"])
+
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get("/api/administration/books?cursor=%%%")
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get("/api/administration/books?limit=0")
+        self.assertEqual(response.status_code, 400)
+
+        # Well-formed cursors must still point past a scalar key
+        for value in ([1], {}, None, True):
+            cursor = base64.urlsafe_b64encode(json.dumps(
+                {"after": value}).encode("utf-8")).decode("ascii")
+            response = self.client.get(
+                    f"/api/administration/books?cursor={cursor}")
+            self.assertEqual(response.status_code, 400)
+
+
+    def test_book_search_is_ranked_and_kept_in_sync(self):
+        first = Book.add({"title": "Python Tricks", "publisher": "Leanpub",
+            "yearPublished": 2017, "edition": 1,
+            "summary": "A buffet of awesome Python features"})
+        second = Book.add({"title": "Cooking Basics", "publisher": "Python Press",
+            "yearPublished": 2019, "edition": 2, "summary": "Recipes"})
+
+        response = self.client.get("/api/administration/books/search?q=pyth")
+        self.assertEqual(response.status_code, 200)
+        books = response.get_json()["books"]
+        self.assertEqual([book["bookId"] for book in books],
+                [first.bookId, second.bookId])
+        self.assertIn("<mark>", books[0]["snippet"])
+
+        # Updates and deletions are reflected in the index
+        second.updateDetails({"title": "Cooking Basics", "publisher": "Penguin",
+            "yearPublished": 2019, "edition": 2, "summary": "Recipes"})
+        db.session.commit()
+        first.remove()
+
+        response = self.client.get("/api/administration/books/search?q=python")
+        self.assertEqual(response.get_json()["books"], [])
+
+        response = self.client.get("/api/administration/books/search?q=penguin")
+        self.assertEqual(len(response.get_json()["books"]), 1)
+
+        # Indexed text is escaped before the matches are marked
+        Book.add({"title": "<b>Bold</b> & Brave", "publisher": "Penguin",
+            "yearPublished": 2020, "edition": 1})
+        response = self.client.get("/api/administration/books/search?q=bold")
+        self.assertEqual(response.get_json()["books"][0]["snippet"],
+                "&lt;b&gt;<mark>Bold</mark>&lt;/b&gt; &amp; Brave")
+
+        # Autogenerated migrations leave the index tables alone
+        self.assertTrue(search.is_index_table("books_fts_docsize"))
+        self.assertFalse(search.is_index_table("books"))
+
+
+    def test_book_pattern_search_casts_numeric_fields(self):
+        book = Book.add({"title": "Cooking Basics", "publisher": "Penguin",
+            "yearPublished": 2019, "edition": 2, "summary": "Recipes"})
+
+        # The fallback compares numbers as text rather than applying ilike
+        # to Integer columns, which PostgreSQL rejects
+        self.assertEqual([found.bookId for found, snippet in
+            Book.searchByPattern("2019")], [book.bookId])
+        self.assertEqual(Book.searchByPattern("1999"), [])
+
+
+    def test_raffle_draw_is_verifiable(self):
+        user = self.create_user(1)
+        book = Book.add({"title": "Book", "publisher": "Publisher",
+            "yearPublished": 2020, "edition": 1})
+        raffle = Raffle.open({"participantLimit": 100, "bookId": book.bookId,
+            "price": 50})
+        raffle.activate()
+
+        # Tickets of another raffle are interleaved with the raffle's
+        other = self.create_raffle()
+        for number in range(40):
+            db.session.add(Ticket(raffleId = raffle.raffleId if number % 2
+                else other.raffleId, userId = user.userId,
+                uniqueNumber = number, isCancelled = number % 8 == 1))
+        db.session.commit()
+
+        # The seed stays hidden until the raffle is closed
+        response = self.client.get(
+                f"/api/administration/raffles/{raffle.raffleId}/draw")
+        proof = response.get_json()
+        self.assertIsNone(proof["drawSeed"])
+        self.assertEqual(proof["drawCommitment"], raffle.drawCommitment)
+
+        response = self.client.post(
+                f"/api/administration/raffles/{raffle.raffleId}/close")
+        self.assertIn(b"Raffle closed successfully", response.data)
+
+        winner = raffle.getWinner()
+        self.assertTrue(winner.isWinningTicket)
+        self.assertFalse(winner.isCancelled)
+        self.assertEqual(raffle.tickets.filter_by(isWinningTicket = True)
+                .count(), 1)
+
+        response = self.client.get(
+                f"/api/administration/raffles/{raffle.raffleId}/draw")
+        proof = response.get_json()
+        self.assertEqual(proof["eligibleTickets"], 15)
+        self.assertEqual(proof["winningTickets"], [winner.ticketId])
+        self.assertTrue(raffle.verifyDraw())
+
+        # Re-deriving the winner from the revealed seed: the first eligible
+        # ticket in the order the seed gives to the range of ticket IDs
+        eligible = {ticket.ticketId for ticket in raffle.getEligibleTickets()}
+        candidates = draw_candidates(proof["drawSeed"], *proof["ticketRange"],
+                str(raffle.raffleId))
+        self.assertEqual([next(ticket_id for ticket_id in candidates
+            if ticket_id in eligible)], proof["winningTickets"])
+        self.assertEqual(sorted(draw_candidates(proof["drawSeed"],
+            *proof["ticketRange"])), list(range(proof["ticketRange"][0],
+                proof["ticketRange"][1] + 1)))
+
+        # Draws of several winners skip missing tickets without failing
+        raffle = Raffle.open({"participantLimit": 100, "bookId": book.bookId,
+            "price": 50})
+        raffle.activate()
+        db.session.add_all([Ticket(raffleId = raffle.raffleId,
+            userId = user.userId, uniqueNumber = 100 + number)
+            for number in range(3)])
+        db.session.commit()
+        raffle.close(winners = 5)
+        self.assertEqual(raffle.tickets.filter_by(isWinningTicket = True)
+                .count(), 3)
+        self.assertTrue(raffle.verifyDraw())
+
+
+    def test_ticket_purchase_respects_participant_limit(self):
+        user = self.create_user(1)
+        raffle = self.create_raffle()
+        raffle.participantLimit = 2
+        db.session.commit()
+
+        url = f"/api/administration/raffles/{raffle.raffleId}/purchase"
+        for _ in range(2):
+            response = self.client.post(url, json = {"userId": user.userId})
+            self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(url, json = {"userId": user.userId})
+        self.assertEqual(response.status_code, 409)
+
+        db.session.refresh(raffle)
+        self.assertEqual(raffle.ticketsSold, 2)
+        self.assertEqual(raffle.tickets.count(), 2)
+
+        response = self.client.post(
+                "/api/administration/raffles/999/purchase",
+                json = {"userId": user.userId})
+        self.assertEqual(response.status_code, 404)
+
+        # Buyers must be existing users, and bodies JSON objects
+        raffle.participantLimit = 10
+        db.session.commit()
+        for data in ({"userId": str(user.userId)}, {"userId": True},
+                {"userId": None}, [user.userId]):
+            response = self.client.post(url, json = data)
+            self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(url, json = {"userId": 999})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(url, data = "userId=1",
+                content_type = "application/x-www-form-urlencoded")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(raffle.tickets.count(), 2)
+
+
+    def test_ticket_numbers_are_unique_and_obfuscated(self):
+        self.app.config["TICKET_NUMBER_BLOCK_SIZE"] = 10
+
+        # Numbers are keyed by their own setting, not by the rotatable secret
+        self.app.config["SECRET_KEY"] = "rotated"
+        key = hashlib.sha256(b"tickets.uniqueNumber:" +
+                self.app.config["TICKET_NUMBER_KEY"].encode("utf-8")).digest()
+        numbers = Ticket.generateNumbers(25)
+        self.assertEqual(numbers[0],
+                10 ** 9 + permute_number(0, key, 10 ** 9))
+
+        numbers += Ticket.generateNumbers(5)
+
+        self.assertEqual(len(set(numbers)), 30)
+        self.assertTrue(all(1000000000 <= number < 2000000000
+            for number in numbers))
+        self.assertNotEqual(numbers, sorted(numbers))
+
+        # Two blocks were reserved rather than one round trip per number
+        sequence = db.session.get(Sequence, "tickets.uniqueNumber")
+        self.assertEqual(sequence.nextValue, 35)
+
+
+    def test_bulk_ticket_purchase_is_all_or_nothing(self):
+        user = self.create_user(1)
+        first = self.create_raffle()
+        second = self.create_raffle()
+
+        response = self.client.post(
+                f"/api/administration/raffles/{first.raffleId}/purchase",
+                json = {"userId": user.userId, "quantity": 4})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()["ticketIds"]), 4)
+
+        # The second raffle cannot take 11 tickets, so nothing is purchased
+        response = self.client.post("/api/administration/raffles/purchase",
+                json = {"userId": user.userId, "items": [
+                    {"raffleId": first.raffleId, "quantity": 2},
+                    {"raffleId": second.raffleId, "quantity": 11}]})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(first.tickets.count(), 4)
+        self.assertEqual(second.tickets.count(), 0)
+
+        # A failed purchase leaves other pending work of the session alone
+        user.firstName = "Pending"
+        status = Ticket.purchase(user.userId, [(first.raffleId, 1),
+            (second.raffleId, 11)])
+        self.assertEqual(status.code, 400)
+        self.assertEqual(user.firstName, "Pending")
+        self.assertEqual(db.session.scalar(db.select(User.firstName)
+            .where(User.userId == user.userId)), "Pending")
+        self.assertEqual(db.session.get(Raffle, first.raffleId).ticketsSold, 4)
+        db.session.rollback()
+
+        response = self.client.post("/api/administration/raffles/purchase",
+                json = {"userId": user.userId, "items": [
+                    {"raffleId": first.raffleId, "quantity": 2},
+                    {"raffleId": second.raffleId, "quantity": 10}]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()["ticketIds"]), 12)
+        self.assertEqual(db.session.get(Raffle, second.raffleId).ticketsSold,
+                10)
+
+        response = self.client.post("/api/administration/raffles/purchase",
+                json = {"userId": user.userId, "items": [
+                    {"raffleId": first.raffleId, "quantity": 0}]})
+        self.assertEqual(response.status_code, 400)
+
+
+    def test_raffle_counters_track_purchases_and_cancellations(self):
+        first, second = self.create_user(1), self.create_user(2)
+        book = Book.add({"title": "Book", "publisher": "Publisher",
+            "yearPublished": 2020, "edition": 1})
+        raffle = Raffle.open({"participantLimit": 10, "bookId": book.bookId,
+            "price": 50})
+        raffle.activate()
+        self.assertTrue(db.session.get(Book, book.bookId).isRaffled())
+
+        Ticket.purchase(first.userId, [(raffle.raffleId, 2)])
+        Ticket.purchase(first.userId, [(raffle.raffleId, 1)])
+        ticket = Ticket.purchase(second.userId,
+                [(raffle.raffleId, 1)]).info[0]
+
+        db.session.refresh(raffle)
+        self.assertEqual((raffle.ticketsSold, raffle.participantsCount,
+            raffle.revenue), (4, 2, 200))
+
+        response = self.client.post(
+                f"/api/administration/tickets/{ticket.ticketId}/cancel")
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(
+                f"/api/administration/tickets/{ticket.ticketId}/cancel")
+        self.assertEqual(response.status_code, 409)
+
+        db.session.refresh(raffle)
+        expected = (3, 1, 1, 150)
+        self.assertEqual((raffle.ticketsSold, raffle.ticketsCancelled,
+            raffle.participantsCount, raffle.revenue), expected)
+
+        # Tickets always carry a cancellation flag, so they are either
+        # counted as sold or cancelled
+        with self.assertRaises(IntegrityError):
+            db.session.execute(db.update(Ticket)
+                    .where(Ticket.raffleId == raffle.raffleId)
+                    .values(isCancelled = None))
+        db.session.rollback()
+
+        # Rebuilding drifted counters reproduces the maintained values
+        raffle.ticketsSold = raffle.participantsCount = 0
+        db.session.commit()
+        self.assertEqual(Raffle.repairCounters(chunk_size = 1), 1)
+
+        db.session.refresh(raffle)
+        self.assertEqual((raffle.ticketsSold, raffle.ticketsCancelled,
+            raffle.participantsCount, raffle.revenue), expected)
+
+        with self.app.test_request_context():
+            self.assertEqual(raffle.getDetails()["ticketsPurchased"], 3)
+
+
+    def test_signed_ticket_codes_are_verified_without_database(self):
+        user = self.create_user(1)
+        raffle = self.create_raffle()
+        ticket = Ticket.purchase(user.userId, [(raffle.raffleId, 1)]).info[0]
+
+        with self.app.test_request_context():
+            code = ticket.getCode()
+
+        response = self.client.get(f"/api/administration/tickets/verify?code={code}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["ticket"]["uniqueNumber"],
+                ticket.uniqueNumber)
+
+        tampered = code[:-2] + ("AA" if code[-2:] != "AA" else "BB")
+        response = self.client.get(
+                f"/api/administration/tickets/verify?code={tampered}")
+        self.assertEqual(response.status_code, 400)
+
+        # Cancellation revokes the code in this worker immediately
+        self.assertEqual(ticket.cancel().code, 200)
+        response = self.client.get(f"/api/administration/tickets/verify?code={code}")
+        self.assertEqual(response.status_code, 409)
+
+        # Other workers pick the cancellation up from the database
+        revocations = RevocationSet(refresh_interval = 0)
+        self.assertIn(ticket.ticketId, revocations)
+
+        # A cancellation committed after the last reload but stamped before
+        # the newest time seen is still picked up
+        late = Ticket.purchase(user.userId, [(raffle.raffleId, 1)]).info[0]
+        self.assertNotIn(late.ticketId, revocations)
+        db.session.execute(db.update(Ticket)
+                .where(Ticket.ticketId == late.ticketId)
+                .values(isCancelled = True, lastUpdated =
+                    revocations.loadedUntil - timedelta(seconds = 5)))
+        db.session.commit()
+        self.assertIn(late.ticketId, revocations)
+
+
+    def test_book_links_only_include_related_rows(self):
+        books = [Book.add({"title": f"Book {index}", "publisher": "Publisher",
+            "yearPublished": 2020, "edition": 1}) for index in range(3)]
+        authors = [Author.add({"firstName": f"Author {index}"})
+                for index in range(2)]
+        category = Category.create({"name": "Fiction"})
+
+        books[0].authors.extend(authors)
+        books[0].categories.append(category)
+        books[1].authors.append(authors[1])
+        db.session.commit()
+
+        self.assertEqual(books[0].authors, authors)
+        self.assertEqual(books[2].authors, [])
+        self.assertEqual(authors[1].books, books[:2])
+        self.assertEqual(category.books, [books[0]])
+
+        # Counts for a page of books come from one query
+        self.assertEqual(Book.getCounts([book.bookId for book in books]), {
+            books[0].bookId: {"authorsCount": 2, "categoriesCount": 1},
+            books[1].bookId: {"authorsCount": 1, "categoriesCount": 0},
+            books[2].bookId: {"authorsCount": 0, "categoriesCount": 0},
+            })
+
+        response = self.client.get("/api/administration/books")
+        details = [list(book.values())[0]
+                for book in response.get_json()["books"]]
+        self.assertEqual([book["authorsCount"] for book in details], [2, 1, 0])
+
+        response = self.client.get(
+                f"/api/administration/authors/{authors[1].authorId}/books")
+        self.assertEqual(response.status_code, 200)
+
+
+    def test_links_match_url_for_and_follow_requested_mode(self):
+        raffle = self.create_raffle()
+
+        with self.app.test_request_context():
+            details = raffle.getDetails()
+            for key, (endpoint, arguments) in Raffle.__links__.items():
+                self.assertEqual(details[key], flask.url_for(endpoint,
+                    _external = True, **{argument: getattr(raffle, attribute)
+                        for argument, attribute in arguments.items()}))
+
+            self.assertEqual(details["bookDetails"]["imageUrl"],
+                    flask.url_for("static", filename = "images/books/book.jpg",
+                        _external = True))
+
+        url = f"/api/administration/raffles/{raffle.raffleId}"
+        details = self.client.get(url + "?links=compact").get_json()
+        self.assertEqual(details["url"], url)
+
+        details = self.client.get(url + "?links=none").get_json()
+        self.assertNotIn("url", details)
+        self.assertNotIn("url", details["bookDetails"])
+        self.assertIn("imageUrl", details["bookDetails"])
+
+
+    def test_sparse_fieldsets_skip_unrequested_work(self):
+        user = self.create_user(1)
+        raffle = self.create_raffle()
+        Ticket.purchase(user.userId, [(raffle.raffleId, 1)])
+
+        # Every field of getDetails is registered on its model
+        with self.app.test_request_context():
+            for instance in (user, raffle, raffle.getBook,
+                    raffle.tickets.first()):
+                model = type(instance)
+                self.assertEqual(set(instance.getDetails()),
+                        set(model.__fields__) | set(model.__links__))
+
+        with self.capture_statements() as statements:
+            response = self.client.get(
+                    "/api/administration/books?fields=bookId,title,url")
+
+        book = list(response.get_json()["books"][0].values())[0]
+        self.assertEqual(set(book), {"bookId", "title", "url"})
+
+        # Besides the validator, neither unrequested columns nor counts were
+        # queried
+        self.assertEqual(len(statements), 2)
+        self.assertNotIn("summary", statements[1].statement)
+
+        response = self.client.get("/api/administration/raffles"
+                "?fields=raffleId,ticketsPurchased")
+        raffle_details = list(response.get_json()["raffles"][0].values())[0]
+        self.assertEqual(raffle_details, {"raffleId": raffle.raffleId,
+            "ticketsPurchased": 1})
+
+        # Fields backed by methods shadowing columns load their columns only
+        response = self.client.get(
+                "/api/administration/books?fields=bookId,isActive")
+        self.assertEqual(response.status_code, 200)
+        book = list(response.get_json()["books"][0].values())[0]
+        self.assertEqual(book, {"bookId": book["bookId"], "isActive": True})
+
+
+    def test_collections_stream_in_batches(self):
+        self.app.config["STREAM_BATCH_SIZE"] = 2
+        for index in range(5):
+            db.session.add(Book(title = f"Book {index}", publisher = "Publisher",
+                yearPublished = 2020, edition = 1))
+        db.session.commit()
+
+        expected = self.client.get("/api/administration/books").get_json()
+
+        response = self.client.get("/api/administration/books?stream=json")
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.get_json(), expected)
+
+        response = self.client.get("/api/administration/books",
+                headers = {"Accept": "application/x-ndjson"})
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.get_data(as_text = True).splitlines()
+        self.assertEqual([flask.json.loads(line) for line in lines],
+                expected["books"])
+
+        raffle = self.create_raffle()
+        db.session.add_all([Ticket(raffleId = raffle.raffleId,
+            uniqueNumber = number) for number in range(1, 6)])
+        db.session.commit()
+
+        response = self.client.get(f"/api/administration/raffles/"
+                f"{raffle.raffleId}/tickets/export?fields=selfId")
+        lines = response.get_data(as_text = True).splitlines()
+        self.assertEqual([flask.json.loads(line)["selfId"] for line in lines],
+                [ticket.ticketId for ticket in raffle.tickets])
+
+
+    def test_conditional_requests_skip_unchanged_resources(self):
+        raffle = self.create_raffle()
+
+        response = self.client.get("/api/administration/raffles")
+        etag = response.headers["ETag"]
+        self.assertIsNotNone(response.last_modified)
+
+        with self.capture_statements() as statements:
+            response = self.client.get("/api/administration/raffles",
+                    headers = {"If-None-Match": etag})
+
+        # Only the validator was queried
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(len(statements), 1)
+
+        # Other representations and changed rows get new tags
+        response = self.client.get("/api/administration/raffles?links=none",
+                headers = {"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
+        book, author = raffle.getBook, Author.add({"firstName": "Author"})
+        book.authors.append(author)
+        db.session.commit()
+        response = self.client.get("/api/administration/raffles",
+                headers = {"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+        # A raffle only changes with its own book
+        url = f"/api/administration/raffles/{raffle.raffleId}"
+        etag = self.client.get(url).headers["ETag"]
+        other = self.create_raffle().getBook
+        other.title = "Other"
+        db.session.commit()
+        response = self.client.get(url, headers = {"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        book.title = "Changed"
+        db.session.commit()
+        response = self.client.get(url, headers = {"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
+        # Conditional requests are authorized first
+        user = self.create_user(1)
+        url = f"/api/administration/users/{user.userId}"
+        with self.app.test_request_context(url):
+            etag = User.getValidator(user.userId).etag
+        response = self.client.get(url, headers = {"If-None-Match": etag})
+        self.assertEqual(response.status_code, 403)
+
+        db.session.add(Ticket(raffleId = raffle.raffleId, uniqueNumber = 1))
+        db.session.commit()
+        ticket = raffle.tickets.first()
+
+        url = f"/api/administration/tickets/{ticket.ticketId}"
+        last_modified = self.client.get(url).headers["Last-Modified"]
+        response = self.client.get(url, headers = {
+            "If-Modified-Since": last_modified})
+        self.assertEqual(response.status_code, 304)
+
+        ticket.isCancelled = True
+        ticket.lastUpdated = ticket.lastUpdated.replace(
+                year = ticket.lastUpdated.year + 1)
+        db.session.commit()
+        response = self.client.get(url, headers = {
+            "If-Modified-Since": last_modified})
+        self.assertEqual(response.status_code, 200)
+
+
+    def test_users_are_imported_in_batches_with_row_errors(self):
+        administrator = self.create_user(0)
+        administrator.roleId = Role.query.filter_by(
+                title = "Administrator").first().roleId
+        db.session.commit()
+        headers = {"Authorization": "Bearer " + create_access_token(
+            identity = administrator.emailAddress,
+            additional_claims = administrator.getClaims())}
+
+        rows = "\n".join([
+            "firstName,lastName,emailAddress,phoneNumber,password",
+            "Jane,Doe, Jane.Doe@Example.com ,0711 111 111,password123",
+            "Jim,Doe,jim.doe@example.com,0722222222,password123",
+            "Joe,Doe,,0733333333,password123",
+            "Jan,Doe,JANE.DOE@example.com,0744444444,password123",
+            "Ann,Doe,ann.doe@example.com,0700000000,password123",
+            "Amy,Doe,amy.doe@example.com,0755555555,password123,extra",
+            ])
+
+        with self.capture_statements("INSERT INTO users") as statements:
+            response = self.client.post("/api/administration/users/import",
+                    headers = headers, data = {"file":
+                        (io.BytesIO(rows.encode("utf-8")), "users.csv")},
+                    content_type = "multipart/form-data")
+
+        self.assertEqual(response.status_code, 200)
+        report = response.get_json()
+        self.assertEqual((report["rows"], report["imported"], report["failed"]),
+                (6, 2, 4))
+        self.assertEqual([error["line"] for error in report["errors"]],
+                [4, 5, 6, 7])
+        self.assertIn("Missing required fields: emailAddress",
+                report["errors"][0]["error"])
+        self.assertEqual(report["errors"][1]["error"],
+                "Email address is repeated from line 2")
+        self.assertEqual(report["errors"][3]["error"],
+                "Row has more values than the header")
+        self.assertEqual(report["errors"][2]["error"],
+                "Phone number is already registered")
+        self.assertIsNotNone(report["rowsPerSecond"])
+        self.assertEqual([statement.executemany for statement in statements],
+                [True])
+
+        user = User.query.filter_by(emailAddress = "jane.doe@example.com").first()
+        self.assertEqual(user.phoneNumber, "0711111111")
+        self.assertTrue(user.verifyPassword("password123"))
+        self.assertEqual(user.roleId,
+                Role.query.filter_by(default = True).first().roleId)
+
+        # NDJSON bodies stream without a file upload
+        lines = "\n".join([
+            '{"firstName": "Kim", "lastName": "Doe", '
+            '"emailAddress": "kim.doe@example.com", '
+            '"phoneNumber": "0766666666", "password": "password123"}',
+            '{"firstName": "Kim"',
+            '',
+            '{"firstName": "Jim", "lastName": "Doe", '
+            '"emailAddress": "jim.doe@example.com", '
+            '"phoneNumber": "0777777777", "password": "password123"}',
+            ])
+        response = self.client.post("/api/administration/users/import",
+                headers = headers, data = lines,
+                content_type = "application/x-ndjson")
+        report = response.get_json()
+        self.assertEqual((report["rows"], report["imported"]), (3, 1))
+        self.assertEqual(report["errors"], [
+            {"line": 2, "error": "Line is not valid JSON"},
+            {"line": 4, "error": "Email address is already registered"}])
+
+        # Undecodable and unparseable rows are reported without ending it
+        rows = b"\n".join([
+            b"firstName,lastName,emailAddress,phoneNumber,password",
+            b"Lee,Doe,lee.doe@example.com,0788888888,password123",
+            b"L\xe9a,Doe,lea.doe@example.com,0799999999,password123",
+            b"Ray,Doe,ray.doe@example.com," + b"0" * 200000 + b",password123",
+            b"Roy,Doe,roy.doe@example.com,0712121212,password123",
+            ])
+        response = self.client.post("/api/administration/users/import",
+                headers = headers, data = {"file":
+                    (io.BytesIO(rows), "users.csv")},
+                content_type = "multipart/form-data")
+        report = response.get_json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((report["rows"], report["imported"]), (4, 2))
+        self.assertEqual([error["line"] for error in report["errors"]], [3, 4])
+        self.assertEqual(report["errors"][0]["error"], "Line is not valid UTF-8")
+        self.assertTrue(report["errors"][1]["error"].startswith(
+            "Row is not valid CSV"))
+
+        # Only administrators may import
+        response = self.client.post("/api/administration/users/import",
+                headers = {"Authorization": "Bearer " + create_access_token(
+                    identity = user.emailAddress,
+                    additional_claims = user.getClaims())},
+                data = lines, content_type = "application/x-ndjson")
+        self.assertEqual(response.status_code, 403)
+
+
+    def test_closing_a_raffle_fans_out_notifications_in_chunks(self):
+        users = [self.create_user(index) for index in range(5)]
+        raffle = self.create_raffle()
+        other = self.create_raffle()
+        db.session.add_all([
+            Ticket(raffleId = raffle.raffleId, userId = users[0].userId,
+                uniqueNumber = 1),
+            Ticket(raffleId = raffle.raffleId, userId = users[0].userId,
+                uniqueNumber = 2),
+            Ticket(raffleId = raffle.raffleId, userId = users[1].userId,
+                uniqueNumber = 3),
+            Ticket(raffleId = raffle.raffleId, userId = users[2].userId,
+                uniqueNumber = 4),
+            Ticket(raffleId = raffle.raffleId, userId = users[3].userId,
+                uniqueNumber = 5, isCancelled = True),
+            Ticket(raffleId = other.raffleId, userId = users[4].userId,
+                uniqueNumber = 6),
+            Notification(name = "raffle_closed", userId = users[1].userId,
+                payloadJSON = '{"raffleId": 0}'),
+            ])
+        db.session.commit()
+        user_ids = [user.userId for user in users]
+        User.getIdentity(user_ids[0])
+
+        with self.capture_statements("INSERT INTO notifications") \
+                as statements:
+            notified = Notification.fanOut("raffle_closed",
+                    {"raffleId": raffle.raffleId}, raffle_id = raffle.raffleId,
+                    chunk_size = 2)
+
+        # Each participant is notified once, replacing earlier notifications
+        self.assertEqual(notified, 3)
+        self.assertEqual([len(statement.parameters) if statement.executemany
+            else 1 for statement in statements], [2, 1])
+        notifications = Notification.query.filter_by(name = "raffle_closed")\
+                .order_by(Notification.userId).all()
+        self.assertEqual([notification.userId for notification in notifications],
+                user_ids[:3])
+        self.assertEqual({notification.payloadJSON
+            for notification in notifications},
+            {flask.json.dumps({"raffleId": raffle.raffleId})})
+
+        # Recipients keep their cached identities
+        self.assertIsNot(self.app.extensions["identities"].get(
+            f"id:{user_ids[0]}"), MISSING)
+
+        # Closing notifies participants and the winner
+        raffle = db.session.get(Raffle, raffle.raffleId)
+        raffle.close()
+        winner = raffle.getWinner()
+        self.assertEqual(Notification.query.filter_by(
+            name = "raffle_closed").count(), 3)
+        self.assertEqual([notification.userId for notification in
+            Notification.query.filter_by(name = "raffle_won")],
+            [winner.userId])
@@ -1,7 +1,14 @@
+import time
+from unittest import mock
 import flask
-from app import create_app, db
+import threading
+from werkzeug.security import generate_password_hash, check_password_hash
+from config import config
+from app import create_app, db, hasher
 from tests import BaseTestCase
-from app.models import User
+from app.models import User, Role, Permission
+from app.ratelimit import WindowStore, get_address
+from app.hashing import HashingBusy
 
 
 class AuthenticationTestCase(BaseTestCase):
@@ -89,3 +96,229 @@ class AuthenticationTestCase(BaseTestCase):
         response = self.client.post("/api/authentication/login", json = login_data)
         self.assertEqual(response.status_code, 401)
         self.assertIn(b"User not found", response.data)
+
+
+    def test_identity_cache_serves_tokens_and_follows_changes(self):
+        user = User(firstName = "John", lastName = "Doe",
+                emailAddress = "john.doe@example.com",
+                phoneNumber = "0700000000", password = "password123")
+        db.session.add(user)
+        db.session.commit()
+
+        response = self.client.post("/api/authentication/login", json = {
+            "emailAddress": "john.doe@example.com", "password": "password123"})
+        headers = {"Authorization":
+                f"Bearer {response.get_json()['access_token']}"}
+
+        response = self.client.get("/api/administration/users",
+                headers = headers)
+        self.assertEqual(response.status_code, 200)
+
+        user_id, role_id = user.userId, user.roleId
+        db.session.expunge_all()
+
+        with self.capture_statements() as statements, \
+                self.app.test_request_context():
+            identity = User.getIdentity(email_address = "john.doe@example.com")
+            self.assertTrue(identity.can(Permission.VISIT))
+            self.assertFalse(identity.isAdministrator())
+
+        # Neither the user nor its role were queried
+        self.assertEqual(statements, [])
+
+        # Losing a permission takes effect on the next request
+        role = db.session.get(Role, role_id)
+        role.removePermission(Permission.VISIT)
+        db.session.commit()
+        self.assertFalse(User.getIdentity(user_id = user_id)
+                .can(Permission.VISIT))
+
+        # Changed email addresses are no longer found by the old one
+        user = db.session.get(User, user_id)
+        user.emailAddress = "john@example.com"
+        db.session.commit()
+        db.session.expunge_all()
+        self.assertIsNone(User.getIdentity(
+            email_address = "john.doe@example.com"))
+        self.assertEqual(User.getIdentity(user_id = user_id).emailAddress,
+                "john@example.com")
+
+
+    def test_tokens_carry_permissions_until_their_role_changes(self):
+        user = User(firstName = "John", lastName = "Doe",
+                emailAddress = "john.doe@example.com",
+                phoneNumber = "0700000000", password = "password123")
+        db.session.add(user)
+        db.session.commit()
+        role = db.session.get(Role, user.roleId)
+        version = role.version
+
+        def login():
+            response = self.client.post("/api/authentication/login", json = {
+                "emailAddress": "john.doe@example.com",
+                "password": "password123"})
+            return {"Authorization":
+                    f"Bearer {response.get_json()['access_token']}"}
+
+        headers = login()
+        self.assertEqual(self.client.get("/api/administration/users",
+            headers = headers).status_code, 200)
+
+        # Reinserting unchanged roles keeps issued tokens valid
+        Role.insert_roles()
+        self.assertEqual(role.version, version)
+        self.assertEqual(self.client.get("/api/administration/users",
+            headers = headers).status_code, 200)
+
+        role.removePermission(Permission.VISIT)
+        db.session.commit()
+        self.assertEqual(role.version, version + 1)
+
+        # Stale tokens are rejected and fresh ones lack the permission
+        self.assertEqual(self.client.get("/api/administration/users",
+            headers = headers).status_code, 401)
+        self.assertEqual(self.client.get("/api/administration/users",
+            headers = login()).status_code, 403)
+
+        # Tokens minted before their user moved to another role are rejected
+        role.addPermission(Permission.VISIT)
+        db.session.commit()
+        headers = login()
+        user.roleId = Role.query.filter_by(
+                title = "Administrator").first().roleId
+        db.session.commit()
+        self.assertEqual(self.client.get("/api/administration/users",
+            headers = headers).status_code, 401)
+        self.assertEqual(self.client.get("/api/administration/users",
+            headers = login()).status_code, 200)
+
+
+    def test_passwords_are_rehashed_and_hashing_is_bounded(self):
+        user = User(firstName = "John", lastName = "Doe",
+                emailAddress = "john.doe@example.com",
+                phoneNumber = "0700000000",
+                passwordHash = generate_password_hash("password123",
+                    "pbkdf2:sha256:2000"))
+        db.session.add(user)
+        db.session.commit()
+
+        login_data = {"emailAddress": "john.doe@example.com",
+                "password": "password123"}
+        response = self.client.post("/api/authentication/login",
+                json = login_data)
+        self.assertEqual(response.status_code, 200)
+
+        # The hash was upgraded to the configured parameters
+        db.session.refresh(user)
+        self.assertTrue(user.passwordHash.startswith(
+            self.app.config["PASSWORD_HASH_METHOD"] + "$"))
+        self.assertTrue(user.verifyPassword("password123"))
+
+        # Hashes run on worker processes, and are refused once saturated
+        self.app.config["PASSWORD_HASH_WORKERS"] = 1
+        hasher.init_app(self.app)
+        try:
+            self.assertTrue(user.verifyPassword("password123"))
+            self.assertFalse(user.verifyPassword("password345"))
+
+            # Hashes stuck behind a busy worker are refused once they time
+            # out, and keep their slot until they finish
+            pool = self.app.extensions["hashing"]
+            pool.slots = threading.BoundedSemaphore(2)
+            pool.slots.acquire()
+            busy = pool.submit(time.sleep, 0.5)
+            self.app.config["PASSWORD_HASH_TIMEOUT"] = 0.05
+            response = self.client.post("/api/authentication/login",
+                    json = login_data)
+            self.assertEqual(response.status_code, 503)
+            self.assertFalse(pool.slots.acquire(blocking = False))
+
+            busy.result()
+
+            # Bulk hashes take a slot per chunk, and wait for free slots
+            self.app.config["PASSWORD_HASH_TIMEOUT"] = 10
+            hashes = hasher.generateMany(f"password{index}"
+                    for index in range(20))
+            self.assertEqual(len(hashes), 20)
+            self.assertTrue(check_password_hash(hashes[19], "password19"))
+            self.assertTrue(pool.slots.acquire(blocking = False))
+            self.assertTrue(pool.slots.acquire(blocking = False))
+            self.app.config["PASSWORD_HASH_TIMEOUT"] = 0.05
+            with self.assertRaises(HashingBusy):
+                hasher.generateMany(["password123"])
+
+            pool.slots.release()
+            pool.slots.release()
+            pool.shutdown()
+            self.assertTrue(pool.slots.acquire(blocking = False))
+            self.assertTrue(pool.slots.acquire(blocking = False))
+            response = self.client.post("/api/authentication/login",
+                    json = login_data)
+            self.assertEqual(response.status_code, 503)
+
+        finally:
+            self.app.extensions["hashing"].shutdown()
+
+
+    def test_login_bursts_are_limited_before_any_work(self):
+        self.app.config["RATELIMIT_RULES"] = {"login": {"ip": (5, 60),
+            "emailAddress": (2, 60)}}
+        login_data = {"emailAddress": "John.Doe@example.com",
+                "password": "password123"}
+
+        for attempt in range(2):
+            response = self.client.post("/api/authentication/login",
+                    json = login_data)
+            self.assertEqual(response.status_code, 401)
+
+        # Email addresses are counted regardless of case
+        with self.capture_statements() as statements:
+            response = self.client.post("/api/authentication/login",
+                    json = {"emailAddress": "john.doe@example.com",
+                        "password": "password345"})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response.headers["Retry-After"]), 0)
+        self.assertEqual(statements, [])
+
+        # Other addresses are only limited per client
+        for attempt in range(2):
+            response = self.client.post("/api/authentication/login",
+                    json = {"emailAddress": f"user{attempt}@example.com",
+                        "password": "password123"})
+            self.assertEqual(response.status_code, 401)
+
+        response = self.client.post("/api/authentication/login",
+                json = {"emailAddress": "user9@example.com",
+                    "password": "password123"})
+        self.assertEqual(response.status_code, 429)
+
+
+    def test_client_addresses_are_taken_from_trusted_proxies(self):
+        with mock.patch.object(config["testing"], "PROXY_COUNT", 1):
+            app = create_app("testing")
+
+        headers = {"X-Forwarded-For": "203.0.113.5"}
+        environ = {"REMOTE_ADDR": "10.0.0.1"}
+        for application in (self.app, app):
+            application.add_url_rule("/address", "address", get_address)
+
+        # Forwarded addresses are only used behind a trusted proxy
+        response = self.client.get("/address", headers = headers,
+                environ_base = environ)
+        self.assertEqual(response.get_data(as_text = True), "10.0.0.1")
+        response = app.test_client().get("/address", headers = headers,
+                environ_base = environ)
+        self.assertEqual(response.get_data(as_text = True), "203.0.113.5")
+
+
+    def test_sliding_window_counts_the_previous_window(self):
+        store = WindowStore(max_keys = 2)
+        self.assertEqual(store.hit("a", 10, 5), (1, 0))
+        self.assertEqual(store.hit("a", 10, 9), (2, 0))
+        self.assertEqual(store.hit("a", 10, 12), (1, 2))
+        self.assertEqual(store.hit("a", 10, 35), (1, 0))
+
+        store.hit("b", 10, 35)
+        store.hit("c", 10, 35)
+        self.assertNotIn("a", store.windows)
@@ -0,0 +1,67 @@
+import time
+from app import db, cache
+from app.cache import LocalCache, MISSING
+from tests import BaseTestCase
+from app.models import Book, Author, Role, User
+
+
+class CacheTestCase(BaseTestCase):
+    def test_local_cache_evicts_least_recently_used_and_expired(self):
+        local = LocalCache(max_entries = 2, ttl = 60)
+        local.set("a", 1, ("Book",))
+        local.set("b", 2)
+        self.assertEqual(local.get("a"), 1)
+
+        local.set("c", 3)
+        self.assertIs(local.get("b"), MISSING)
+        self.assertEqual(local.stats.evictions, 1)
+
+        local.invalidate("Book")
+        self.assertIs(local.get("a"), MISSING)
+
+        local.set("d", 4, ttl = 0.01)
+        time.sleep(0.02)
+        self.assertIs(local.get("d"), MISSING)
+        self.assertEqual(local.stats.expirations, 1)
+
+
+    def test_details_are_cached_and_invalidated_on_change(self):
+        self.app.config["CACHE_SHARED_URL"] = "local"
+        cache.init_app(self.app)
+
+        book = Book.add({"title": "Book", "publisher": "Publisher",
+            "yearPublished": 2020, "edition": 1})
+        author = Author.add({"firstName": "Author"})
+
+        with self.app.test_request_context():
+            self.assertEqual(book.getDetails()["authorsCount"], 0)
+            details = book.getDetails()
+            details["title"] = "Changed by caller"
+            self.assertEqual(book.getDetails()["title"], "Book")
+
+            # Linking an author invalidates both sides
+            author.getDetails()
+            book.authors.append(author)
+            db.session.commit()
+            self.assertEqual(book.getDetails()["authorsCount"], 1)
+            self.assertEqual(author.getDetails()["booksCount"], 1)
+
+            book.updateDetails({"title": "Renamed", "publisher": "Publisher",
+                "yearPublished": 2020, "edition": 1})
+            db.session.commit()
+            self.assertEqual(book.getDetails()["title"], "Renamed")
+
+            # Users joining a role change its cached count
+            role = Role.query.filter_by(default = True).first()
+            count = role.getDetails()["usersCount"]
+            db.session.add(User(firstName = "User", lastName = "One",
+                emailAddress = "user@example.com", phoneNumber = "0700000000",
+                password = "password123"))
+            db.session.commit()
+            self.assertEqual(role.getDetails()["usersCount"], count + 1)
+
+        statistics = self.client.get("/api/administration/cache")\
+                .get_json()["cache"]
+        self.assertGreater(statistics["LocalCache"]["hits"], 0)
+        self.assertGreater(statistics["LocalCache"]["invalidations"], 0)
+        self.assertIn("SharedCacheStandIn", statistics)
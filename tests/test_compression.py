@@ -0,0 +1,60 @@
+import zlib
+import gzip
+import flask
+from app import db
+from tests import BaseTestCase
+from app.models import Book
+
+
+class CompressionTestCase(BaseTestCase):
+    def setUp(self):
+        super(CompressionTestCase, self).setUp()
+        for index in range(20):
+            db.session.add(Book(title = f"Book {index}", publisher = "Publisher",
+                yearPublished = 2020, edition = 1))
+        db.session.commit()
+
+
+    def test_large_bodies_are_compressed_and_cached(self):
+        plain = self.client.get("/api/administration/books")
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertIn("Accept-Encoding", plain.headers["Vary"])
+
+        cache = self.app.extensions["compression"]
+        for attempt in range(2):
+            response = self.client.get("/api/administration/books",
+                    headers = {"Accept-Encoding": "gzip, deflate"})
+            self.assertEqual(response.headers["Content-Encoding"], "gzip")
+            self.assertEqual(gzip.decompress(response.get_data()),
+                    plain.get_data())
+            self.assertLess(int(response.headers["Content-Length"]),
+                    len(plain.get_data()))
+
+        # The repeat request reused the compressed body
+        self.assertEqual(cache.stats.hits, 1)
+
+        response = self.client.get("/api/administration/books",
+                headers = {"Accept-Encoding": "deflate"})
+        self.assertEqual(response.headers["Content-Encoding"], "deflate")
+        self.assertEqual(zlib.decompress(response.get_data()),
+                plain.get_data())
+
+        # Small bodies are left alone
+        response = self.client.get("/api/administration/books/1?fields=title",
+                headers = {"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+
+    def test_streamed_responses_are_compressed_per_chunk(self):
+        self.app.config["STREAM_BATCH_SIZE"] = 5
+        plain = self.client.get("/api/administration/books?stream=ndjson")
+
+        response = self.client.get("/api/administration/books?stream=ndjson",
+                headers = {"Accept-Encoding": "gzip"}, buffered = False)
+        self.assertTrue(response.is_streamed)
+        self.assertNotIn("Content-Length", response.headers)
+
+        chunks = list(response.response)
+        response.close()
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(gzip.decompress(b"".join(chunks)), plain.get_data())
@@ -0,0 +1,61 @@
+import decimal
+from datetime import datetime, timezone, timedelta
+from app import db, encoding
+from app.encoding import JSONProvider
+from tests import BaseTestCase
+from app.models import Author, Raffle
+
+
+class EncodingTestCase(BaseTestCase):
+    def test_datetimes_are_encoded_in_iso_format_on_every_path(self):
+        payload = {1: {"dateCreated": datetime(2023, 5, 1, 12, 30, 15, 250),
+            "startTime": datetime(2023, 5, 1, 15, 30,
+                tzinfo = timezone(timedelta(hours = 3))),
+            "endTime": datetime(2023, 5, 2, tzinfo = timezone.utc),
+            "price": decimal.Decimal("50.5"), "name": "Kitabu ñ"}}
+        expected = {"1": {"dateCreated": "2023-05-01T12:30:15.000250Z",
+            "startTime": "2023-05-01T15:30:00+03:00", "price": "50.5",
+            "endTime": "2023-05-02T00:00:00Z", "name": "Kitabu ñ"}}
+
+        outputs = [self.app.json.dumps(payload),
+                self.app.json.dumps(payload, indent = 2)]
+
+        orjson = encoding.orjson
+        encoding.orjson = None
+        try:
+            outputs.append(JSONProvider(self.app).dumps(payload))
+        finally:
+            encoding.orjson = orjson
+
+        for output in outputs:
+            self.assertEqual(self.app.json.loads(output), expected)
+
+
+    def test_compact_keys_leave_out_nulls(self):
+        author = Author.add({"firstName": "Author"})
+
+        url = f"/api/administration/authors/{author.authorId}"
+        details = self.client.get(url).get_json()
+        self.assertIsNone(details["lastName"])
+        self.assertRegex(details["dateCreated"], r"^\d{4}-\d\d-\d\dT.*Z$")
+
+        compact = self.client.get(url + "?keys=compact").get_json()
+        self.assertNotIn("lastName", compact)
+        self.assertEqual(compact, {key: value for key, value in
+            details.items() if value is not None})
+
+        # Streams are compacted too, but data stored while serving the
+        # request keeps its nulls
+        raffle = Raffle.open({"participantLimit": 10})
+        url = "/api/administration/raffles?stream=ndjson"
+        lines = [self.app.json.loads(self.client.get(url + query)
+            .get_data(as_text = True))[str(raffle.raffleId)]
+            for query in ("", "&keys=compact")]
+        self.assertIsNone(lines[0]["endTime"])
+        self.assertEqual(lines[1], {key: value for key, value in
+            lines[0].items() if value is not None})
+
+        with self.app.test_request_context("/?keys=compact"):
+            self.assertEqual(self.app.json.loads(self.app.json.dumps(
+                {"lastName": None})), {"lastName": None})
+
@@ -0,0 +1,66 @@
+import flask
+from datetime import datetime, timedelta
+from app import db, presence
+from tests import BaseTestCase
+from app.models import User
+from app.presence import LastSeenBuffer
+
+
+class PresenceTestCase(BaseTestCase):
+    def test_pings_are_coalesced_into_one_batched_update(self):
+        users = [self.create_user(index) for index in range(3)]
+        user_ids = [user.userId for user in users]
+        last_updated = users[0].lastUpdated
+        response = self.client.post("/api/authentication/login", json = {
+            "emailAddress": "user0@example.com", "password": "password123"})
+        headers = {"Authorization":
+                f"Bearer {response.get_json()['access_token']}"}
+
+        with self.capture_statements("UPDATE users") as statements:
+            # Authenticated requests and pings only touch the buffer
+            for attempt in range(5):
+                self.client.get("/api/administration/users",
+                        headers = headers)
+                for user in users:
+                    user.ping()
+
+            self.assertEqual(statements, [])
+            self.assertEqual(set(presence.buffer.pending), set(user_ids))
+
+            presence.flush()
+
+        self.assertEqual([(statement.executemany, len(statement.parameters))
+            for statement in statements], [(True, 3)])
+        self.assertEqual(presence.buffer.pending, {})
+
+        db.session.expire_all()
+        user = db.session.get(User, user_ids[0])
+        self.assertEqual(user.lastUpdated, last_updated)
+        self.assertGreater(user.lastSeen, last_updated)
+
+        # Users written within the interval are not written again
+        user.ping()
+        self.assertEqual(presence.buffer.pending, {})
+
+
+    def test_buffer_flushes_when_due_and_keeps_failed_writes(self):
+        seen = datetime(2024, 1, 1)
+        buffer = LastSeenBuffer(interval = 60, flush_interval = 30,
+                max_pending = 3)
+        buffer.flushedAt = 0
+
+        self.assertFalse(buffer.record(1, seen, 10))
+        self.assertFalse(buffer.record(1, seen, 20))
+        self.assertEqual(buffer.pending, {1: seen})
+        self.assertTrue(buffer.record(2, seen, 30))
+
+        pending = buffer.take(30)
+        self.assertEqual(pending, {1: seen, 2: seen})
+        self.assertFalse(buffer.record(1, seen, 50))
+        self.assertTrue(buffer.record(1, seen + timedelta(minutes = 2), 70))
+
+        # A failed write is buffered again without overwriting newer times
+        buffer.restore(pending)
+        self.assertEqual(buffer.pending, {1: seen + timedelta(minutes = 2),
+            2: seen})
+        self.assertTrue(buffer.record(3, seen, 71))
@@ -1,7 +1,7 @@
 import flask
 from app import create_app, db
 from tests import BaseTestCase
-from app.models import User
+from app.models import User, Role
 
 
 class RegistrationTestCase(BaseTestCase):
@@ -108,3 +108,50 @@ class RegistrationTestCase(BaseTestCase):
         response = self.client.post('/api/registration/register', json = data)
         self.assertEqual(response.status_code, 400)
         self.assertIn(b"Phone number is already registered", response.data)
+
+
+    def test_register_user_normalizes_contacts_in_one_statement(self):
+        data = {
+                "firstName": "John",
+                "lastName": "Doe",
+                "middleName": "James",
+                "emailAddress": "  John.Doe@Example.com ",
+                "phoneNumber": "0700 000-000",
+                "password": "password123",
+                "nationality": "Kenya",
+                "gender": "Male"
+                }
+
+        # Warm the cached role IDs, then record the statements of a signup
+        User.register(details = {**data, "emailAddress": "a@example.com",
+            "phoneNumber": "0711111111"})
+        with self.capture_statements() as statements:
+            response = self.client.post('/api/registration/register',
+                    json = data)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].statement.startswith("INSERT INTO users"))
+
+        user = User.query.filter_by(emailAddress = "john.doe@example.com").first()
+        self.assertEqual(user.phoneNumber, "0700000000")
+        self.assertEqual(user.roleId, Role.query.filter_by(default = True)
+                .first().roleId)
+
+        # Duplicates differing only in case or separators are rejected
+        response = self.client.post('/api/registration/register',
+                json = {**data, "emailAddress": "JOHN.DOE@example.com",
+                    "phoneNumber": "0722222222"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b"Email address is already registered", response.data)
+
+        response = self.client.post('/api/registration/register',
+                json = {**data, "emailAddress": "mary.jane@example.com",
+                    "phoneNumber": "(0700) 000 000"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b"Phone number is already registered", response.data)
+
+        response = self.client.post("/api/authentication/login",
+                json = {"emailAddress": "John.Doe@example.com",
+                    "password": "password123"})
+        self.assertEqual(response.status_code, 200)
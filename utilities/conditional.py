@@ -0,0 +1,99 @@
+import hashlib
+from datetime import datetime, timezone
+import flask
+from sqlalchemy import func, select, inspect
+
+
+class Validator(object):
+    """
+    Conditional request validator for a resource or a collection, computed
+    from the MAX and COUNT of a column over one or more (query, column)
+    parts in a single statement, without loading any rows. The last
+    modification time only moves forward, so rows of dependent tables
+    without a lastUpdated column are tracked by their primary key instead
+    """
+
+    def __init__(self, *parts):
+        self.parts = parts
+        self._values = None
+
+
+    def __add__(self, other):
+        """Combines the parts of two validators"""
+        return Validator(*(self.parts + other.parts))
+
+
+    @property
+    def values(self):
+        """Retrieves the (MAX, COUNT) pairs of every part"""
+        if self._values is None:
+            expressions = []
+            for query, column in self.parts:
+                query = query.order_by(None)
+                expressions.append(query.with_entities(func.max(column))
+                        .scalar_subquery())
+                key = inspect(column.class_).primary_key[0]
+                expressions.append(query.with_entities(func.count(key))
+                        .scalar_subquery())
+
+            row = self.parts[0][0].session.execute(select(*expressions)).one()
+            self._values = list(zip(row[::2], row[1::2]))
+
+        return self._values
+
+
+    @property
+    def etag(self):
+        """
+        Retrieves a weak entity tag, which also varies by the requested URL
+        and representation
+        """
+        request = flask.request
+        state = repr((request.host_url, request.full_path,
+            request.headers.get("Accept"), self.values))
+        return hashlib.sha1(state.encode("utf-8")).hexdigest()
+
+
+    @property
+    def lastModified(self):
+        """Retrieves the latest modification time across every part"""
+        times = [value for value, count in self.values
+                if isinstance(value, datetime)]
+        if not times:
+            return None
+
+        return max(times).replace(tzinfo = timezone.utc)
+
+
+    def isFresh(self):
+        """
+        Checks if the client already holds the current representation
+        If-Modified-Since is only honoured for single resources without
+        dependent parts, since removing rows does not move the modification
+        time of what remains
+        """
+        request = flask.request
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(self.etag)
+
+        last_modified = self.lastModified
+        if request.if_modified_since and last_modified and \
+                len(self.parts) == 1 and self.values[0][1] == 1:
+            return request.if_modified_since >= \
+                    last_modified.replace(microsecond = 0)
+
+        return False
+
+
+    def apply(self, response):
+        """Adds the validators to a response"""
+        response.set_etag(self.etag, weak = True)
+        if self.lastModified:
+            response.last_modified = self.lastModified
+
+        return response
+
+
+    def notModified(self):
+        """Retrieves a 304 Not Modified response"""
+        return self.apply(flask.Response(status = 304))
@@ -0,0 +1,19 @@
+import re
+
+PHONE_SEPARATORS = re.compile(r"[\s\-().]")
+
+
+def normalize_email(email_address):
+    """Returns an email address stripped and in lowercase"""
+    if email_address is None:
+        return None
+
+    return str(email_address).strip().lower()
+
+
+def normalize_phone(phone_number):
+    """Returns a phone number without spaces, dashes, dots or brackets"""
+    if phone_number is None:
+        return None
+
+    return PHONE_SEPARATORS.sub("", str(phone_number))
@@ -0,0 +1,71 @@
+import flask
+from sqlalchemy.orm import load_only
+
+
+def get_fields():
+    """
+    Retrieves the fields selected with ?fields=a,b,c as a frozenset
+    Returns None when every field is requested
+    """
+    if not flask.has_request_context():
+        return None
+
+    fields = flask.request.args.get("fields")
+    if not fields:
+        return None
+
+    return frozenset(field.strip() for field in fields.split(",")
+            if field.strip())
+
+
+def wants(fields, *names):
+    """Checks if any of the named fields is selected"""
+    return fields is None or any(name in fields for name in names)
+
+
+def select_fields(fields, getters):
+    """
+    Evaluates the getters of the selected fields only, so expensive computed
+    fields cost nothing unless requested
+    """
+    if fields is None:
+        return {name: get() for name, get in getters.items()}
+
+    return {name: get() for name, get in getters.items() if name in fields}
+
+
+def get_field_columns(model, fields):
+    """
+    Retrieves the column attributes needed to render the selected fields of
+    a model, from its __fields__ registry and the arguments of its __links__
+    Returns None when every column is needed
+    """
+    if fields is None:
+        return None
+
+    names = set()
+    for field in fields:
+        names.update(model.__fields__.get(field, ()))
+
+        link = getattr(model, "__links__", {}).get(field)
+        if link is not None:
+            names.update(link[1].values())
+
+    # Resolve names through the mapper, since methods may shadow columns
+    attributes = model.__mapper__.column_attrs
+    return [attributes[name].class_attribute for name in sorted(names)
+            if name in attributes]
+
+
+def load_fields(query, model, fields):
+    """Narrows the columns a query loads to the selected fields of a model"""
+    columns = get_field_columns(model, fields)
+    if columns is None:
+        return query
+
+    # The primary key is always loaded, even when no column is needed
+    if not columns:
+        columns = [getattr(model, column.key)
+                for column in model.__mapper__.primary_key]
+
+    return query.options(load_only(*columns))
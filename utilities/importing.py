@@ -0,0 +1,160 @@
+import csv
+import codecs
+import json
+import time
+
+IMPORT_FORMATS = ("csv", "ndjson")
+IMPORT_MIMETYPES = {
+        "text/csv": "csv",
+        "application/csv": "csv",
+        "application/x-ndjson": "ndjson",
+        "application/jsonl": "ndjson",
+        }
+IMPORT_EXTENSIONS = {
+        ".csv": "csv",
+        ".ndjson": "ndjson",
+        ".jsonl": "ndjson",
+        }
+
+
+def get_import_format(requested = None, filename = None, mimetype = None):
+    """
+    Retrieves the format of an import from an explicit choice, the extension
+    of the file name or the mimetype, in that order, or None
+    """
+    if requested:
+        return requested if requested in IMPORT_FORMATS else None
+
+    for extension, import_format in IMPORT_EXTENSIONS.items():
+        if filename and filename.lower().endswith(extension):
+            return import_format
+
+    return IMPORT_MIMETYPES.get(mimetype)
+
+
+class DecodedLines(object):
+    """
+    Iterates over the lines of a binary stream as text, counting them.
+    Lines that are not valid UTF-8 are read as blank lines, so the lines
+    after them keep their numbers, and their numbers are kept in invalid
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.line = 0
+        self.invalid = []
+
+
+    def __iter__(self):
+        for content in self.stream:
+            self.line += 1
+            if self.line == 1 and content.startswith(codecs.BOM_UTF8):
+                content = content[len(codecs.BOM_UTF8):]
+
+            try:
+                yield content.decode("utf-8")
+            except UnicodeDecodeError:
+                self.invalid.append(self.line)
+                yield "\n"
+
+
+    def takeInvalid(self):
+        """Retrieves and clears the numbers of lines that were not UTF-8"""
+        invalid, self.invalid = self.invalid, []
+        return invalid
+
+
+def read_records(stream, import_format = "csv"):
+    """
+    Yields (line, record, error) triples from a binary stream of CSV rows
+    or NDJSON lines without reading it whole. Blank values are left out of
+    records, and rows that cannot be decoded or parsed carry an error
+    instead
+    """
+    lines = DecodedLines(stream)
+
+    if import_format == "csv":
+        reader = csv.DictReader(lines)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                row = None
+            except csv.Error as e:
+                row = e
+
+            for line in lines.takeInvalid():
+                yield (line, None, "Line is not valid UTF-8")
+
+            if row is None:
+                return
+
+            if isinstance(row, csv.Error):
+                yield (lines.line, None, f"Row is not valid CSV: {row}")
+                continue
+
+            if None in row:
+                yield (lines.line, None, "Row has more values than the header")
+                continue
+
+            yield (lines.line, {key.strip(): value.strip()
+                for key, value in row.items()
+                if key and value and value.strip()}, None)
+
+    for content in lines:
+        if lines.takeInvalid():
+            yield (lines.line, None, "Line is not valid UTF-8")
+            continue
+
+        if not content.strip():
+            continue
+
+        try:
+            record = json.loads(content)
+        except ValueError:
+            yield (lines.line, None, "Line is not valid JSON")
+            continue
+
+        if not isinstance(record, dict):
+            yield (lines.line, None, "Line is not a JSON object")
+            continue
+
+        yield (lines.line, {key: value.strip() if isinstance(value, str)
+            else value for key, value in record.items()
+            if value is not None and value != ""}, None)
+
+
+class ImportReport(object):
+    """Counts the rows of an import and collects the errors of each row"""
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.finished = None
+
+
+    def addError(self, line, message):
+        """Records the error of a rejected row"""
+        self.errors.append({"line": line, "error": message})
+
+
+    def finish(self):
+        """Stops the clock of the import and orders the errors by line"""
+        self.finished = time.perf_counter()
+        self.errors.sort(key = lambda error: error["line"])
+        return self
+
+
+    def getDetails(self):
+        """Retrieves the counts, errors and throughput of the import"""
+        seconds = (self.finished or time.perf_counter()) - self.started
+        return {
+                "rows": self.rows,
+                "imported": self.imported,
+                "failed": len(self.errors),
+                "errors": self.errors,
+                "seconds": round(seconds, 3),
+                "rowsPerSecond": round(self.rows / seconds, 1) if seconds else None,
+                }
@@ -0,0 +1,76 @@
+import json
+import base64
+import binascii
+import flask
+
+
+class PaginationError(ValueError):
+    """Raised when the pagination parameters of a request are invalid"""
+    pass
+
+
+def encode_cursor(value):
+    """Returns an opaque cursor pointing past the given key value"""
+    payload = json.dumps({"after": value}, separators = (",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8"))\
+            .decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Returns the key value an opaque cursor points past"""
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        payload = base64.urlsafe_b64decode((cursor + padding).encode("ascii"))
+        value = json.loads(payload)["after"]
+
+    except (binascii.Error, ValueError, KeyError, TypeError, UnicodeError):
+        raise PaginationError("Invalid cursor")
+
+    # Only scalar key values can be compared with the key column
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise PaginationError("Invalid cursor")
+
+    return value
+
+
+def get_limit():
+    """Returns the page size requested through the 'limit' parameter"""
+    config = flask.current_app.config
+    limit = flask.request.args.get("limit")
+
+    if limit is None:
+        return config["ITEMS_PER_PAGE"]
+
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise PaginationError("Invalid limit")
+
+    if limit < 1:
+        raise PaginationError("Invalid limit")
+
+    return min(limit, config["MAX_ITEMS_PER_PAGE"])
+
+
+def paginate(query, column):
+    """
+    Applies keyset pagination over a unique, indexed column using the 'limit'
+    and 'cursor' request parameters.
+    Returns a tuple of the items on the page and the cursor of the next page,
+    which is None on the last page
+    """
+    limit = get_limit()
+
+    cursor = flask.request.args.get("cursor")
+    if cursor:
+        query = query.filter(column > decode_cursor(cursor))
+
+    # Fetch one extra row to find out whether another page exists
+    items = query.order_by(column).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(getattr(items[-1], column.key))
+
+    return items, next_cursor
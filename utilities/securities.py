@@ -1,5 +1,107 @@
+import hmac
+import base64
+import struct
 import hashlib
+import secrets
+
+TICKET_CODE_VERSION = 1
+TICKET_CODE_FORMAT = ">BQIII"
+TICKET_CODE_MAC_SIZE = 12
 
 def get_gravatar_hash(emailAddress = None):
     """Returns gravatar hash based on email address"""
     return hashlib.md5(emailAddress.lower().encode("utf-8")).hexdigest()
+
+
+def generate_seed():
+    """Returns a random hexadecimal seed for a raffle draw"""
+    return secrets.token_hex(32)
+
+
+def get_seed_commitment(seed):
+    """Returns the published commitment of a raffle draw seed"""
+    return hashlib.sha256(seed.encode("utf-8")).hexdigest()
+
+
+def draw_candidates(seed, first, last, context = ""):
+    """
+    Yields every number in [first, last] once, in an order derived from a
+    seed by a keyed permutation, so anyone holding the seed can reproduce the
+    order in which a draw tries ticket IDs
+    """
+    if first is None or last is None or last < first:
+        return
+
+    message = f"{context}:draw".encode("utf-8")
+    key = hmac.new(seed.encode("utf-8"), message, hashlib.sha256).digest()
+    domain = last - first + 1
+    for index in range(domain):
+        yield first + permute_number(index, key, domain)
+
+
+def permute_number(value, key, domain = 10 ** 9, rounds = 8):
+    """
+    Maps a number in [0, domain) to a unique, hard to guess number in the same
+    range using a keyed Feistel network with cycle walking, so distinct inputs
+    always produce distinct outputs
+    """
+    if not 0 <= value < domain:
+        raise ValueError("Value is outside the permutation domain")
+
+    bits = max(2, (domain - 1).bit_length())
+    bits += bits % 2
+    half = bits // 2
+    mask = (1 << half) - 1
+
+    while True:
+        left, right = value >> half, value & mask
+        for round in range(rounds):
+            message = round.to_bytes(1, "big") + right.to_bytes(8, "big")
+            digest = hmac.new(key, message, hashlib.sha256).digest()
+            left, right = right, left ^ (int.from_bytes(digest[:8], "big")
+                    & mask)
+        value = (left << half) | right
+
+        # Walk the cycle until the value falls back inside the domain
+        if value < domain:
+            return value
+
+
+def sign_ticket_code(key, ticket_id, raffle_id, unique_number, issued_at):
+    """
+    Returns a compact URL-safe code binding a ticket to its raffle, number and
+    issue time (seconds since the epoch), authenticated with a truncated
+    HMAC-SHA256 so it can be verified without a database lookup
+    """
+    payload = struct.pack(TICKET_CODE_FORMAT, TICKET_CODE_VERSION, ticket_id,
+            raffle_id, unique_number, issued_at)
+    mac = hmac.new(key, payload, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(payload + mac[:TICKET_CODE_MAC_SIZE])\
+            .decode("ascii").rstrip("=")
+
+
+def verify_ticket_code(key, code):
+    """
+    Checks the signature of a ticket code
+    Returns a (ticketId, raffleId, uniqueNumber, issuedAt) tuple, or None when
+    the code is malformed or has been tampered with
+    """
+    size = struct.calcsize(TICKET_CODE_FORMAT)
+    try:
+        data = base64.urlsafe_b64decode(code + "=" * (-len(code) % 4))
+    except (TypeError, ValueError):
+        return None
+
+    if len(data) != size + TICKET_CODE_MAC_SIZE:
+        return None
+
+    payload, mac = data[:size], data[size:]
+    expected = hmac.new(key, payload, hashlib.sha256).digest()
+    if not hmac.compare_digest(mac, expected[:TICKET_CODE_MAC_SIZE]):
+        return None
+
+    version, *fields = struct.unpack(TICKET_CODE_FORMAT, payload)
+    if version != TICKET_CODE_VERSION:
+        return None
+
+    return tuple(fields)
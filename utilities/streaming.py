@@ -0,0 +1,83 @@
+import logging
+import itertools
+import flask
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+JSON_MIMETYPE = "application/json"
+STREAM_FORMATS = ("ndjson", "json")
+
+
+def get_stream_format(default = None):
+    """
+    Retrieves the streaming format requested with ?stream=ndjson|json or an
+    Accept header of application/x-ndjson
+    Returns default when the client did not ask for a stream
+    """
+    stream_format = flask.request.args.get("stream")
+    if stream_format in STREAM_FORMATS:
+        return stream_format
+
+    if flask.request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        return "ndjson"
+
+    return default
+
+
+def iterate_batches(query, batch_size):
+    """
+    Yields lists of rows of a query, fetched batch_size at a time through a
+    server-side cursor where the database supports one
+    """
+    rows = iter(query.yield_per(batch_size))
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+
+        yield batch
+
+
+def stream_response(query, render, key, stream_format = "ndjson",
+        batch_size = None):
+    """
+    Streams the rows of a query as NDJSON lines or as a JSON object holding
+    an array under key. render converts a batch of rows into a list of
+    jsonifiable items, so bulk detail methods still work per batch.
+    Only one batch is held in memory at a time, and each one is flushed to
+    the client as soon as it is serialized
+    """
+    app = flask.current_app
+    compact_nulls = getattr(app.json, "compact_nulls", None)
+    batch_size = batch_size or app.config["STREAM_BATCH_SIZE"]
+
+    def dumps(item):
+        return app.json.dumps(compact_nulls(item) if compact_nulls else item)
+
+    def generate_ndjson():
+        for batch in iterate_batches(query, batch_size):
+            yield "".join(dumps(item) + "\n" for item in render(batch))
+
+    def generate_json():
+        yield "{" + dumps(key) + ": ["
+
+        separator = ""
+        for batch in iterate_batches(query, batch_size):
+            items = render(batch)
+            if items:
+                yield separator + ", ".join(dumps(item) for item in items)
+                separator = ", "
+
+        yield "], \"next\": null}"
+
+    def generate():
+        try:
+            yield from (generate_ndjson() if stream_format == "ndjson" else
+                    generate_json())
+        except Exception as e:
+            # The status line is already sent, so the response is truncated
+            logging.error(f"Error streaming {key}: {str(e)}")
+            raise
+
+    mimetype = NDJSON_MIMETYPE if stream_format == "ndjson" else JSON_MIMETYPE
+    return flask.Response(flask.stream_with_context(generate()),
+            mimetype = mimetype)